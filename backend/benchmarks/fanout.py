@@ -0,0 +1,144 @@
+"""
+CPU cost of one chat broadcast against room size, through the code a broadcast
+actually runs: channels_redis group_send serialization, the receive side decode and
+the consumer handler that writes the websocket frame.
+
+per-receiver: the group event carries the message dict and every consumer runs
+json.dumps in its handler (chat_message before serialize-once)
+serialize-once: the sender builds the frame with frame_event and every consumer
+forwards the text from FrameProtocolConsumer.forward_frame
+
+channels_redis serializes a group message once per redis key, and all the consumers of
+a worker process share one (specific.<process>!), so the layer encodes and decodes once
+per worker process while the handler runs once per receiver. Redis round trips are left
+out, they cost the same for both designs.
+
+Run from the backend directory:
+    python benchmarks/fanout.py
+"""
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from channels.generic.websocket import AsyncWebsocketConsumer  # noqa: E402
+from channels_redis.core import RedisChannelLayer  # noqa: E402
+
+from common.websocket import FrameProtocolConsumer, frame_event  # noqa: E402
+
+ROOM_SIZES = [10, 50, 100, 500, 1000, 5000]
+WORKER_PROCESSES = 4
+BROADCASTS = 50
+
+# Same shape as MessageSerializer output for a message with a sender and no file
+MESSAGE = {
+    'id': 123456,
+    'sender': {
+        'username': 'neurocom_user',
+        'email': 'user@example.com',
+        'first_name': 'Neuro',
+        'last_name': 'Com',
+        'bio': 'x' * 80,
+        'id': 42,
+        'profile_picture': {
+            'id': 7,
+            'original_name': 'avatar.png',
+            'file_size': 48213,
+            'file_type': 'image',
+            'mime_type': 'image/png',
+            'url': 'http://localhost/files/profile/secure-media/' + 'a' * 64 + '/',
+            'created_at': '2025-07-30T14:26:00.000000Z',
+            'user': 42,
+        },
+        'settings': {'message_notifications': True, 'request_notifications': True, 'darkmode': True},
+    },
+    'file': None,
+    'content': 'Lorem ipsum dolor sit amet, consectetur adipiscing elit. ' * 3,
+    'timestamp': '2025-07-30T14:26:00.000000Z',
+    'is_read': False,
+    'direct_message': 9,
+}
+
+
+class PerReceiverConsumer(AsyncWebsocketConsumer):
+    # The chat_message handler as it was before serialize-once
+    async def chat_message(self, event):
+        await self.send(text_data=json.dumps({
+            'action_type': 'chat_message',
+            'message': event['message']
+        }))
+
+
+class SerializeOnceConsumer(FrameProtocolConsumer):
+    pass
+
+
+def per_receiver_event():
+    return {'type': 'chat_message', 'message': MESSAGE}
+
+
+def serialize_once_event():
+    return frame_event({'action_type': 'chat_message', 'message': MESSAGE})
+
+
+async def connect_receivers(consumer_class, room_size):
+    """Accepted consumers spread over the worker processes, writing into a counter"""
+    sent = [0]
+
+    async def base_send(message):
+        if message['type'] == 'websocket.send':
+            sent[0] += 1
+
+    consumers = []
+    for index in range(room_size):
+        consumer = consumer_class()
+        consumer.scope = {'type': 'websocket', 'subprotocols': [], 'query_string': b''}
+        consumer.base_send = base_send
+        consumer.channel_name = f'specific.worker{index % WORKER_PROCESSES}!{index}'
+        await consumer.websocket_connect({'type': 'websocket.connect'})
+        consumers.append(consumer)
+    sent[0] = 0
+    return consumers, sent
+
+
+async def broadcast(layer, consumers, sent, build_event):
+    # Sender: what group_send does before talking to redis
+    _, channel_key_to_message, _ = layer._map_channel_keys_to_connection(
+        [consumer.channel_name for consumer in consumers], build_event()
+    )
+
+    # Receivers: each worker process decodes its copy once and dispatches it to its consumers
+    by_channel = {consumer.channel_name: consumer for consumer in consumers}
+    for content in channel_key_to_message.values():
+        message = layer.deserialize(content)
+        channels = message.pop('__asgi_channel__')
+        for channel in channels:
+            await by_channel[channel].dispatch(message)
+
+    assert sent[0] == len(consumers)
+    sent[0] = 0
+
+
+async def cpu_per_broadcast(consumer_class, build_event, room_size):
+    layer = RedisChannelLayer()
+    consumers, sent = await connect_receivers(consumer_class, room_size)
+    start = time.process_time()
+    for _ in range(BROADCASTS):
+        await broadcast(layer, consumers, sent, build_event)
+    return (time.process_time() - start) / BROADCASTS * 1000
+
+
+async def main():
+    print(f"{WORKER_PROCESSES} worker processes, {BROADCASTS} broadcasts per room size")
+    print(f"{'room size':>10} {'per-receiver ms':>16} {'serialize-once ms':>18} {'speedup':>8}")
+    for room_size in ROOM_SIZES:
+        old = await cpu_per_broadcast(PerReceiverConsumer, per_receiver_event, room_size)
+        new = await cpu_per_broadcast(SerializeOnceConsumer, serialize_once_event, room_size)
+        print(f"{room_size:>10} {old:>16.3f} {new:>18.3f} {old / new if new else float('inf'):>7.1f}x")
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,103 @@
+from __future__ import annotations
+import logging
+import time
+from typing import Iterable
+from django.conf import settings
+from neurocom.redis_client import get_redis, get_async_redis
+
+logger = logging.getLogger(__name__)
+
+# Which participants have a direct message open: a redis hash per DM of user id -> number
+# of open sockets, so a second tab closing does not hide the first. Every socket refreshes
+# the TTL while it is used, so a count left behind by a crashed worker expires on its own.
+# Only message notifications of that same DM are skipped while it is open.
+
+# Drops the user's field once their last socket of the DM closes
+CLOSE_SCRIPT = """
+if redis.call('HINCRBY', KEYS[1], ARGV[1], -1) <= 0 then
+    redis.call('HDEL', KEYS[1], ARGV[1])
+end
+return 0
+"""
+
+
+def chat_open_key(dm_id: int) -> str:
+    return f'dm_chat_open_{dm_id}'
+
+
+class OpenChat:
+    """The open state of one DM socket, refreshed at most every half TTL"""
+
+    def __init__(self, dm_id: int, user_id: int) -> None:
+        self.dm_id = dm_id
+        self.user_id = user_id
+        self._refreshed_at = float('-inf')
+
+    async def open(self) -> None:
+        try:
+            pipe = get_async_redis().pipeline(transaction=True)
+            pipe.hincrby(chat_open_key(self.dm_id), str(self.user_id), 1)
+            pipe.expire(chat_open_key(self.dm_id), settings.CHAT_OPEN_STATUS_TTL)
+            await pipe.execute()
+            self._refreshed_at = time.monotonic()
+        except Exception as e:
+            logger.error(f"Error on OpenChat.open: {e}")
+
+    async def refresh(self) -> None:
+        if time.monotonic() - self._refreshed_at < settings.CHAT_OPEN_STATUS_TTL / 2:
+            return
+        try:
+            await get_async_redis().expire(chat_open_key(self.dm_id), settings.CHAT_OPEN_STATUS_TTL)
+            self._refreshed_at = time.monotonic()
+        except Exception as e:
+            logger.error(f"Error on OpenChat.refresh: {e}")
+
+    async def close(self) -> None:
+        try:
+            script = get_async_redis().register_script(CLOSE_SCRIPT)
+            await script(keys=[chat_open_key(self.dm_id)], args=[str(self.user_id)])
+        except Exception as e:
+            logger.error(f"Error on OpenChat.close: {e}")
+
+
+async def get_open_chat_users_async(dm_id: int, user_ids: list[int]) -> dict[int, bool]:
+    counts = await get_async_redis().hmget(chat_open_key(dm_id), [str(user_id) for user_id in user_ids])
+    return {user_id: int(count or 0) > 0 for user_id, count in zip(user_ids, counts)}
+
+
+def get_open_chat_users(dm_id: int, user_ids: Iterable[int]) -> dict[int, bool]:
+    """Whether each user has the DM open, for all of them in one round trip"""
+    user_ids = list(user_ids)
+    if not user_ids:
+        return {}
+    try:
+        counts = get_redis().hmget(chat_open_key(dm_id), [str(user_id) for user_id in user_ids])
+    except Exception as e:
+        #Better an extra notification than a lost one
+        logger.error(f"Error on get_open_chat_users: {e}")
+        return {user_id: False for user_id in user_ids}
+    return {user_id: int(count or 0) > 0 for user_id, count in zip(user_ids, counts)}
+
+
+def get_open_chats(dm_users: Iterable[tuple[int, int]]) -> dict[tuple[int, int], bool]:
+    """
+    Whether each user has their DM open, for (dm id, user id) pairs across any number of
+    DMs in one pipelined round trip, for fan-outs that notify many recipients at once.
+    """
+    dm_users = list(dict.fromkeys(dm_users))
+    if not dm_users:
+        return {}
+    try:
+        pipe = get_redis().pipeline(transaction=False)
+        for dm_id, user_id in dm_users:
+            pipe.hget(chat_open_key(dm_id), str(user_id))
+        counts = pipe.execute()
+    except Exception as e:
+        #Better an extra notification than a lost one
+        logger.error(f"Error on get_open_chats: {e}")
+        return {dm_user: False for dm_user in dm_users}
+    return {dm_user: int(count or 0) > 0 for dm_user, count in zip(dm_users, counts)}
+
+
+def is_chat_open(dm_id: int, user_id: int) -> bool:
+    return get_open_chat_users(dm_id, [user_id])[user_id]
@@ -1,34 +1,45 @@
-from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
 from chat.models import DirectMessage,DirectMessageMessage
-import json
 from chatroom.models import ChatRoom, Channel, ChatroomMessage
 from django.core.exceptions import ObjectDoesNotExist
 from django.contrib.auth import get_user_model
 from .serializers import MessageSerializer
-from asgiref.sync import sync_to_async
-import redis.client
+from neurocom.redis_client import get_async_redis
 from django.conf import settings
 from django.core.files.base import ContentFile
 import base64
 from files.models import ChatFile
+from files.serializers import ChatFileSerializer
+import time
 from django.utils import timezone
 from chatroom.serializers import ChatroomMessageSerializer
+from chatroom.membership import is_chatroom_member
+from chatroom.events import channel_group_name, chatroom_group_name
 from django.contrib.contenttypes.models import ContentType
 import logging
 from django.db.transaction import atomic
+from rest_framework import serializers
+from user.card_cache import get_user_card
+from uuid import uuid4
+from .persistence import get_write_behind_buffer
+from .typing import get_typing_tracker
+from .chat_status import OpenChat, get_open_chat_users_async
+from user_activity.activity import record_activity_async
+from .idempotency import MAX_CLIENT_MSG_ID_LENGTH, client_msg_key, claim_client_msg_id, record_client_msg_id, release_client_msg_id
+from common.websocket import FrameProtocolConsumer, frame_event
+from common.channel_layer import channel_layer_counters
+from .replay import publish_event, get_missed_events
+from urllib.parse import parse_qs
 logger = logging.getLogger(__name__)
 
 
-#REDIS SETUP
-redis_client = redis.StrictRedis(host=settings.REDIS_HOST, port=settings.REDIS_PORT, db=0)
-
 user_model = get_user_model()
 
 
 
-class BaseConsumer(AsyncWebsocketConsumer):
-    message_model: type[DirectMessageMessage] | type[ChatroomMessage] | None  = None
+class BaseConsumer(FrameProtocolConsumer):
+    #Set by every concrete consumer
+    message_model: type[DirectMessageMessage] | type[ChatroomMessage]
     serializer_class: type[MessageSerializer] | type[ChatroomMessageSerializer] | None = None
     
     
@@ -39,50 +50,162 @@ class BaseConsumer(AsyncWebsocketConsumer):
         
         if not is_authorized:
             logger.info('UNAUTHORIZED')
-            self.close()
+            await self.close()
             return
         
-        await self.channel_layer.group_add(self.room_group_name, self.channel_name)
+        #Seq of the last conversation event sent to this socket
+        self.last_seq = None
+        for group_name in self.get_group_names():
+            await self.channel_layer.group_add(group_name, self.channel_name)
         await self.accept()
+        await self.replay_missed_events()
+
+    async def disconnect(self, close_code):
+        if getattr(self, 'room_group_name', None) is None:
+            return
+        await get_typing_tracker().stop(self.room_group_name, self.user.id)
+        for group_name in self.get_group_names():
+            await self.channel_layer.group_discard(group_name, self.channel_name)
+
+    #Groups the socket listens to, conversation events are broadcast to room_group_name only
+    def get_group_names(self):
+        return [self.room_group_name]
         
         
         
-    async def receive(self, text_data):
+    async def receive(self, text_data=None, bytes_data=None):
         try:
-            data = json.loads(text_data)
-            action_type = data['action_type'] #Detect the action type: chat_message, edit_message, delete_message, user_status
+            data = self.decode_frame(text_data, bytes_data)
+        except ValueError:
+            await self.send_error("Invalid frame format")
+            return
+
+        await record_activity_async(self.user.id)
+
+        try:
+            action_type = data['action_type'] #Detect the action type: chat_message, edit_message, delete_message, typing
             
        
             if action_type == 'chat_message':
-
-                message = data['message']
-                message = await self.save_message(message)
-                
-                # Send message to group
-                await self.channel_layer.group_send(
-                    self.room_group_name,
-                    {
-                        'type': 'chat_message',
-                        'message': message
-                    }
-                )
+                await self.send_chat_message(data)
             
             elif action_type == 'edit_message':
                 await self.edit_message(data)
             elif action_type == 'delete_message':
                 await self.delete_message(data)
 
+            elif action_type == 'typing':
+                #Sent on every keystroke, the tracker turns it into one start and one stop event
+                await self.set_typing(data.get('is_typing', True))
             elif action_type == 'user_status':
-                pass
+                #Older clients report typing inside a status frame, only the typing flag is used
+                await self.set_typing(data['user_status'].get('typing') == 'True')
 
-        except json.JSONDecodeError:
-            await self.send_error("Invalid json format")
-            
         except Exception as e:
             logger.error(f"Error in receive: {e}")
             await self.send_error("Internal server error")
 
 
+    async def send_chat_message(self, data):
+        client_msg_id = data.get('client_msg_id')
+        idempotency_key = None
+        if client_msg_id is not None:
+            if not isinstance(client_msg_id, str) or len(client_msg_id) > MAX_CLIENT_MSG_ID_LENGTH:
+                await self.send_error("Invalid client_msg_id")
+                return
+            idempotency_key = client_msg_key(self.room_group_name, self.user.id, client_msg_id)
+            is_new, recorded = await claim_client_msg_id(idempotency_key)
+            if not is_new:
+                #A retry: answer the sender only, nothing is saved or broadcast again
+                await self.send_payload({
+                    'action_type': 'message_ack',
+                    'client_msg_id': client_msg_id,
+                    'duplicate': True,
+                    **(recorded or {'message_id': None, 'pending_id': None}),
+                })
+                return
+
+        message = data['message']
+        if settings.CHAT_WRITE_BEHIND_ENABLED:
+            message = await self.stage_message(message)
+        else:
+            message = await self.save_message(message)
+
+        if message is None:
+            if idempotency_key is not None:
+                await release_client_msg_id(idempotency_key)
+            await self.send_error("Message could not be saved")
+            return
+
+        if idempotency_key is not None:
+            await record_client_msg_id(idempotency_key, message)
+            message = {**message, 'client_msg_id': client_msg_id}
+
+        await get_typing_tracker().stop(self.room_group_name, self.user.id)
+        
+        # Send message to group
+        await self.broadcast({
+            'action_type': 'chat_message',
+            'message': message
+        })
+
+    async def set_typing(self, is_typing):
+        if is_typing:
+            await get_typing_tracker().touch(self.room_group_name, self.user.id)
+        else:
+            await get_typing_tracker().stop(self.room_group_name, self.user.id)
+
+    #Write-behind: stamp the message and stage it, it gets an id once the buffer is flushed
+    async def stage_message(self, message_data):
+        try:
+            field_name, conversation_id = self.get_conversation_field()
+            sender = await self.get_sender_data()
+            pending_id = uuid4().hex
+            file_data = None
+            if message_data.get('file'):
+                #Broadcast what the database holds, never the metadata the client sent
+                file_data = await self.get_uploaded_file(message_data['file']['id'])
+                if file_data is None:
+                    return None
+
+            await get_write_behind_buffer().enqueue({
+                'model': self.message_model._meta.label,
+                'fields': {
+                    f'{field_name}_id': conversation_id,
+                    'sender_id': self.user.id,
+                    'content': message_data['content'],
+                },
+                'file_id': file_data['id'] if file_data else None,
+                'group_name': self.room_group_name,
+                'pending_id': pending_id,
+                'staged_at': time.time(),
+            })
+
+            return {
+                'id': None,
+                'pending_id': pending_id,
+                'sender': sender,
+                'file': file_data,
+                'content': message_data['content'],
+                'timestamp': serializers.DateTimeField().to_representation(timezone.now()),
+                'is_read': False,
+                field_name: conversation_id,
+            }
+        except Exception as e:
+            logger.error(f"Error on stage_message: {e}")
+
+    #A file the user uploaded that is not attached to a message yet
+    @database_sync_to_async
+    def get_uploaded_file(self, file_id):
+        chat_file = ChatFile.objects.filter(id=file_id, user=self.user, message_object_id__isnull=True).first()
+        return ChatFileSerializer(chat_file).data if chat_file else None
+
+    #The sender is serialized once per connection instead of once per message
+    async def get_sender_data(self):
+        if getattr(self, 'sender_data', None) is None:
+            self.sender_data = await database_sync_to_async(get_user_card)(self.user.id)
+        return self.sender_data
+
     #Message edit function
     async def edit_message(self,data):
         try:
@@ -93,13 +216,11 @@ class BaseConsumer(AsyncWebsocketConsumer):
             await self.edit_save_message(new_content,message_id)
         
             #Send the edited message id back to frontend with the new content to update the message
-            await self.channel_layer.group_send(
-                self.room_group_name,{
-                    'type':'send_edited_message',
-                    'message_id': message.id,
-                    'new_content': new_content
-                }
-            )
+            await self.broadcast({
+                'action_type': 'message_edited',
+                'message_id': message.id,
+                'new_content': new_content
+            })
         except Exception as e:
             logger.error(f"Error on edit_message:{e}")
 
@@ -112,66 +233,90 @@ class BaseConsumer(AsyncWebsocketConsumer):
             await self.delete_message_from_database(message_id)
 
             #Send the deleted message id back to frontend to remove from the chat.
-            await self.channel_layer.group_send(
-                self.room_group_name,
-                {
-                    'type':'send_deleted_message',
-                    'message_id':message_id
-                }
-            )
+            await self.broadcast({
+                'action_type': 'message_deleted',
+                'message_id': message_id
+            })
         except Exception as e:
             logger.error(f"Error on delete_message:{e}")
     
     
     
-    #Sending user status: Typing, Online etc.
-    async def send_user_status(self,event):
+    #Encode the frame once, every socket in the group only forwards the text.
+    #Conversation events are sequenced so a reconnecting client can ask for what it missed
+    async def broadcast(self, payload):
+        await publish_event(self.channel_layer, self.room_group_name, payload)
+
+    #Reconnect with ?since_seq=<last seq seen> to get the missed events over the socket.
+    #The socket joined its group before reading the stream, so an event published in between
+    #also arrives live; last_seq makes forward_frame drop that second copy
+    async def replay_missed_events(self):
         try:
-            
-            user_status = event['user_status']
+            query_params = parse_qs(self.scope.get('query_string', b'').decode())
+            if 'since_seq' not in query_params:
+                return
+            since_seq = int(query_params['since_seq'][0])
 
-            await self.send(text_data=json.dumps({
-                "action_type":'user_status',
-                "user_status":user_status
-            }))
+            events = await get_missed_events(self.room_group_name, since_seq)
+            if events is None:
+                #The gap is older than the replay stream, the client refetches the history over REST
+                await self.send_payload({'action_type': 'resync_required'})
+                return
+            self.last_seq = since_seq
+            for event in events:
+                await self.send_payload(event)
+                self.last_seq = max(self.last_seq, event['seq'])
+        except ValueError:
+            await self.send_error("Invalid since_seq")
         except Exception as e:
-            logger.error(f"Error on send_user_status:{e}")
+            logger.error(f"Error on replay_missed_events: {e}")
+            await self.send_payload({'action_type': 'resync_required'})
 
-
-        
-        
-    async def send_deleted_message(self, event):
+    #Handler for every pre-encoded group event: chat messages, edits, deletes, user status etc.
+    async def forward_frame(self, event):
         try:
-            
-            await self.send(text_data=json.dumps({
-                'action_type': 'message_deleted',
-                'message_id': event['message_id']
-            }))
+            seq = event.get('seq')
+            if seq is not None and not await self.follow_seq(seq):
+                return
+            await super().forward_frame(event)
         except Exception as e:
-            logger.error(f"Error on send_deleted_message:{e}")
+            logger.error(f"Error on forward_frame:{e}")
+
+    #A jump in seq means channels_redis dropped group messages while this socket's channel
+    #was over capacity (or a later event overtook an earlier one). The missing events are
+    #replayed from the stream; returns False when the event itself was already sent
+    async def follow_seq(self, seq):
+        if self.last_seq is None or seq == self.last_seq + 1:
+            self.last_seq = seq
+            return True
+        if seq <= self.last_seq:
+            return False
 
-    async def send_edited_message(self, event):
         try:
-            
-            await self.send(text_data=json.dumps({
-                'action_type': 'message_edited',
-                'message_id': event['message_id'],
-                'new_content': event['new_content']
-            }))
-            
+            events = await get_missed_events(self.room_group_name, self.last_seq)
         except Exception as e:
-            logger.error(f"Error on send_edited_message:{e}")
+            logger.error(f"Error on follow_seq: {e}")
+            events = None
+        if events is None:
+            channel_layer_counters['resync_required'] += 1
+            await self.send_payload({'action_type': 'resync_required'})
+            self.last_seq = seq
+            return True
 
-    async def chat_message(self, event):
-        try:
-            
-            await self.send(text_data=json.dumps({
-                'action_type': 'chat_message',
-                'message': event['message']
-            }))
-            
-        except Exception as e:
-            logger.error(f"Error on chat_message:{e}")
+        channel_layer_counters['gap_replayed'] += 1
+        for missed in events:
+            await self.send_payload(missed)
+            self.last_seq = max(self.last_seq, missed['seq'])
+        if seq <= self.last_seq:
+            return False
+        self.last_seq = seq
+        return True
+
+    async def send_error(self, message):
+        await self.send_payload({
+            'action_type': 'error',
+            'message': message
+        })
 
 
     #================================================#
@@ -180,6 +325,10 @@ class BaseConsumer(AsyncWebsocketConsumer):
     async def authorize(self):
         raise NotImplementedError()
 
+    def get_conversation_field(self):
+        # (foreign key name on the message model, id of the conversation this socket is bound to)
+        raise NotImplementedError()
+
     @database_sync_to_async
     def delete_message_from_database(self, message_id):
         raise NotImplementedError()
@@ -198,8 +347,8 @@ class BaseConsumer(AsyncWebsocketConsumer):
 
 #CHATROOM CONSUMER
 class ChatroomConsumer(BaseConsumer):
-    message_model = type[ChatroomMessage]
-    serializer_class = type[ChatroomMessageSerializer]
+    message_model = ChatroomMessage
+    serializer_class = ChatroomMessageSerializer
     room_group_name: str | None = None
 
     async def authorize(self):
@@ -207,39 +356,33 @@ class ChatroomConsumer(BaseConsumer):
             self.chatroom_id = self.scope['url_route']['kwargs']['chatroom_id']
             self.channel_id = self.scope['url_route']['kwargs']['channel_id']
             self.user = self.scope['user']
-            
-            # Get the DM object and check if the current user is part of this DM
-            self.chatroom = await self.get_chatroom(self.chatroom_id)
 
-            if self.chatroom is None:
-                await self.close()
-                return
-            
-            # Check if the user is part of the DM (authorization)
-            if not self.user in self.chatroom.users.all() and self.user != self.chatroom.user:
-                await self.close()  # Close connection if user is unauthorized
+            if self.user.is_anonymous:
+                return False
+
+            # Check the redis membership index, the database is only hit on a miss
+            is_member = await is_chatroom_member(self.chatroom_id, self.user.id)
+            if not is_member or not await self.channel_in_chatroom():
                 logger.info("UNAUTHORIZED")
                 return False
-            self.room_group_name = f"chatroom_{self.chatroom.id}"
+            # Messages only go to the sockets open on this channel
+            self.room_group_name = channel_group_name(self.channel_id)
             logger.info("AUTHORIZED")
             return True
             
         except Exception as e:
             logger.error(f"Error on authorize (Chatroom): {e}")
-            
 
-    #Get the chatroom from the database
+    def get_conversation_field(self):
+        return 'channel', int(self.channel_id)
+
+    #The room-wide group carries channel and membership changes
+    def get_group_names(self):
+        return [self.room_group_name, chatroom_group_name(self.chatroom_id)]
+
     @database_sync_to_async
-    def get_chatroom(self, chatroom_id):
-        try:
-            return ChatRoom.objects.select_related('user').prefetch_related('users').get(id=chatroom_id)
-            
-        except Channel.DoesNotExist:
-            return None
-        
-        except Exception as e:
-            logger.error(f"Error on get_chatroom:{e}")
-        
+    def channel_in_chatroom(self):
+        return Channel.objects.filter(id=self.channel_id, chatroom_id=self.chatroom_id).exists()
 
 
     @database_sync_to_async
@@ -265,7 +408,7 @@ class ChatroomConsumer(BaseConsumer):
     @database_sync_to_async
     def save_message(self,message_data):
         try:
-            channel = Channel.objects.get(id=message_data['channel_id']) #Get the channel that the message belongs to
+            channel = Channel.objects.get(id=self.channel_id) #The socket is bound to a single channel
             user = user_model.objects.get(id=message_data['sender']['id']) #get the sender
             if 'file' in message_data: #Check if a file exists in the message
                 #Get the file data
@@ -320,8 +463,8 @@ class ChatroomConsumer(BaseConsumer):
 
 
 class DirectMessageConsumer(BaseConsumer):
-    message_model = type[DirectMessageMessage]
-    serializer_class = type[MessageSerializer]
+    message_model = DirectMessageMessage
+    serializer_class = MessageSerializer
     
     async def authorize(self):
         try:
@@ -340,36 +483,50 @@ class DirectMessageConsumer(BaseConsumer):
         except Exception as e:
             logger.error(f"Error on authorize(DM): {e}")
 
+    def get_conversation_field(self):
+        return 'direct_message', int(self.dm_id)
 
-    async def broadcast_status(self):
-        try:
-            
-            user_status_1 = await sync_to_async(redis_client.hgetall)(f'user_activity_{self.dm["user1_id"]}')
-            user_status_2 = await sync_to_async(redis_client.hgetall)(f'user_activity_{self.dm["user2_id"]}')
-            user_status_list = [user_status_1,user_status_2]
-            decoded_status_list = []
-            for user_status in user_status_list:
-                decoded_status = {k.decode('utf-8'): v.decode('utf-8') for k, v in user_status.items()}
-                decoded_status_list.append(decoded_status)
-                
-            await self.channel_layer.group_send(self.room_group_name, {
-                'type':'send_user_status',
-                'user_status':decoded_status_list
-            })
-        except Exception as e:
-            logger.error(f"Error on broadcast_status(DM): {e}")
+    #Status changes are pushed to the conversation when a participant opens or leaves it
+    async def connect(self):
+        await super().connect()
+        if getattr(self, 'room_group_name', None) is not None:
+            self.open_chat = OpenChat(int(self.dm_id), self.user.id)
+            await self.open_chat.open()
+            await self.broadcast_status()
+
+    async def disconnect(self, close_code):
+        open_chat = getattr(self, 'open_chat', None)
+        if open_chat is not None:
+            await open_chat.close()
+            await self.broadcast_status()
+        await super().disconnect(close_code)
+
+    #An open socket keeps its DM marked open
+    async def receive(self, text_data=None, bytes_data=None):
+        open_chat = getattr(self, 'open_chat', None)
+        if open_chat is not None:
+            await open_chat.refresh()
+        await super().receive(text_data, bytes_data)
 
-    async def send_user_status(self,event):
+    async def broadcast_status(self):
         try:
-            
-            user_status = event['user_status']
-
-            await self.send(text_data=json.dumps({
-                "action_type":'user_status',
-                "user_status":user_status
+            participants = [self.dm['user1_id'], self.dm['user2_id']]
+            is_open = await get_open_chat_users_async(int(self.dm_id), participants)
+            #Same shape the clients already read, later typing changes come as typing events
+            typing_tracker = get_typing_tracker()
+            decoded_status_list = [{
+                'user_id': str(user_id),
+                'in_the_chat_status': str(is_open[user_id]),
+                'typing': str(typing_tracker.is_typing(self.room_group_name, user_id)),
+            } for user_id in participants]
+
+            #Status updates are not part of the conversation history, so they are not sequenced
+            await self.channel_layer.group_send(self.room_group_name, frame_event({
+                'action_type': 'user_status',
+                'user_status': decoded_status_list
             }))
         except Exception as e:
-            logger.error(f"Error on send_user_status(DM): {e}")
+            logger.error(f"Error on broadcast_status(DM): {e}")
 
     @database_sync_to_async
     def get_dm(self, dm_id):
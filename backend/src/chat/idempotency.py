@@ -0,0 +1,61 @@
+from __future__ import annotations
+import json
+import logging
+from typing import Any
+from django.conf import settings
+from neurocom.redis_client import get_async_redis
+
+logger = logging.getLogger(__name__)
+
+# Clients may tag chat_message frames with a client_msg_id and retry them freely.
+# The first frame claims the id with SET NX, the claim is then overwritten with the
+# id of the saved message so a retry within CHAT_CLIENT_MSG_ID_TTL gets it back
+# instead of creating a second row.
+
+IN_FLIGHT = b'in_flight'
+MAX_CLIENT_MSG_ID_LENGTH = 64
+
+
+def client_msg_key(group_name: str, user_id: int, client_msg_id: str) -> str:
+    return f'chat_client_msg_{group_name}_{user_id}_{client_msg_id}'
+
+
+async def claim_client_msg_id(key: str) -> tuple[bool, dict[str, Any] | None]:
+    """
+    Returns (True, None) when the id is new and the caller should save the message,
+    otherwise (False, the recorded message ids), which are None while the first
+    attempt is still being saved. If redis is down the message is saved as usual.
+    """
+    redis_client = get_async_redis()
+    try:
+        if await redis_client.set(key, IN_FLIGHT, nx=True, ex=settings.CHAT_CLIENT_MSG_ID_TTL):
+            return True, None
+        recorded = await redis_client.get(key)
+    except Exception as e:
+        logger.error(f"Error on claim_client_msg_id: {e}")
+        return True, None
+
+    if recorded is None:
+        # Expired between the two calls, treat it as new
+        return True, None
+    if recorded == IN_FLIGHT:
+        return False, None
+    return False, json.loads(recorded)
+
+
+async def record_client_msg_id(key: str, message: dict[str, Any]) -> None:
+    try:
+        await get_async_redis().set(key, json.dumps({
+            'message_id': message['id'],
+            'pending_id': message.get('pending_id'),
+        }), xx=True, keepttl=True)
+    except Exception as e:
+        logger.error(f"Error on record_client_msg_id: {e}")
+
+
+async def release_client_msg_id(key: str) -> None:
+    # The first attempt failed, let the retry go through
+    try:
+        await get_async_redis().delete(key)
+    except Exception as e:
+        logger.error(f"Error on release_client_msg_id: {e}")
@@ -0,0 +1,31 @@
+import json
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from chat.persistence import RETRY_QUEUE_KEY, persist_messages, broadcast_persisted, claim_orphaned_messages
+from neurocom.redis_client import get_redis
+
+
+class Command(BaseCommand):
+    help = "Persist chat messages parked in the write-behind retry queue or left staged by a stopped process"
+
+    def handle(self, *args, **options):
+        redis_client = get_redis()
+        # Only replay what is queued right now, rows that fail again are pushed back to the end
+        queued = redis_client.llen(RETRY_QUEUE_KEY)
+        replayed = 0
+        for _ in range(queued):
+            raw = redis_client.lpop(RETRY_QUEUE_KEY)
+            if raw is None:
+                break
+            persisted = persist_messages([json.loads(raw)])
+            async_to_sync(broadcast_persisted)(persisted)
+            replayed += len(persisted)
+
+        self.stdout.write(f"Replayed {replayed} of {queued} pending messages")
+
+        orphaned = claim_orphaned_messages(settings.CHAT_WRITE_BEHIND_ORPHAN_AGE)
+        if orphaned:
+            persisted = persist_messages(orphaned)
+            async_to_sync(broadcast_persisted)(persisted)
+            self.stdout.write(f"Saved {len(persisted)} of {len(orphaned)} messages left staged by a stopped process")
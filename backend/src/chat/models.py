@@ -42,6 +42,10 @@ class DirectMessage(models.Model):
         self.last_interaction = timezone.now()
         self.save()
 
+    def mark_read(self, user: User) -> int:
+        """Mark the messages user received in this DM as read, returns how many were unread"""
+        return self.messages.filter(is_read=False).exclude(sender=user).update(is_read=True)
+
     def __str__(self) -> str:
         return f"DM between {self.user1.username} and {self.user2.username}"
 
@@ -0,0 +1,217 @@
+from __future__ import annotations
+import asyncio
+import json
+import logging
+import time
+from typing import Any, TypedDict
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.db.models.signals import post_save
+from django.db.transaction import atomic
+from django.utils import timezone
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from rest_framework import serializers
+from chat.replay import publish_event
+from chat.models import DirectMessage, DirectMessageMessage
+from chatroom.models import ChatroomMessage
+from files.models import ChatFile
+from neurocom.redis_client import get_redis, get_async_redis
+
+logger = logging.getLogger(__name__)
+
+# Redis list holding messages that could not be written to the database.
+# Drained by the replay_pending_messages management command.
+RETRY_QUEUE_KEY = 'chat_write_behind_retry'
+
+# Redis hash of pending_id -> message for every message that was acknowledged but is not
+# saved yet. Written before the ack and cleared once the message is saved or parked in the
+# retry queue, so a process that dies with a full buffer leaves its messages behind here
+# and replay_pending_messages saves them.
+STAGED_KEY = 'chat_write_behind_staged'
+
+# Message models the buffer can persist, by app_label.ModelName
+MESSAGE_MODELS: dict[str, type[DirectMessageMessage] | type[ChatroomMessage]] = {
+    model._meta.label: model for model in (DirectMessageMessage, ChatroomMessage)
+}
+
+
+class PendingMessage(TypedDict):
+    model: str  # app_label.ModelName
+    fields: dict[str, Any]
+    file_id: int | None
+    group_name: str
+    pending_id: str
+    staged_at: float  # unix time
+
+
+def persist_messages(batch: list[PendingMessage]) -> list[tuple[PendingMessage, Any]]:
+    """
+    Write a batch of pending messages with one bulk insert per message model.
+    If the bulk insert fails the batch is retried row by row so one bad row does
+    not take the others down with it; rows that still fail are parked in the
+    retry queue instead of being dropped.
+    """
+    grouped: dict[str, list[PendingMessage]] = {}
+    for pending in batch:
+        grouped.setdefault(pending['model'], []).append(pending)
+
+    persisted: list[tuple[PendingMessage, Any]] = []
+    for label, items in grouped.items():
+        try:
+            persisted.extend(_bulk_persist(label, items))
+        except Exception as e:
+            logger.error(f"Error on bulk persist ({label}), retrying one by one: {e}")
+            for pending in items:
+                try:
+                    persisted.extend(_bulk_persist(label, [pending]))
+                except Exception as e:
+                    logger.error(f"Error on persist ({pending['pending_id']}): {e}")
+                    push_to_retry_queue(pending)
+    return persisted
+
+
+def _bulk_persist(label: str, items: list[PendingMessage]) -> list[tuple[PendingMessage, Any]]:
+    model = MESSAGE_MODELS[label]
+    with atomic():
+        messages: list[Any] = [model(**pending['fields']) for pending in items]
+        instances: list[Any] = model.objects.bulk_create(messages)
+
+        file_ids = {instance.id: pending['file_id'] for pending, instance in zip(items, instances) if pending['file_id']}
+        if file_ids:
+            content_type = ContentType.objects.get_for_model(model)
+            for message_id, file_id in file_ids.items():
+                ChatFile.objects.filter(id=file_id).update(
+                    message_object_id=message_id,
+                    message_content_type=content_type,
+                )
+
+        if model is DirectMessageMessage:
+            dm_ids = {instance.direct_message_id for instance in instances}
+            DirectMessage.objects.filter(id__in=dm_ids).update(last_interaction=timezone.now())
+
+    # bulk_create does not send post_save, send it here so notifications still go out
+    for instance in instances:
+        try:
+            post_save.send(sender=model, instance=instance, created=True, update_fields=None, raw=False, using=instance._state.db)
+        except Exception as e:
+            logger.error(f"Error on post_save for message {instance.id}: {e}")
+
+    return list(zip(items, instances))
+
+
+def push_to_retry_queue(pending: PendingMessage) -> None:
+    try:
+        get_redis().rpush(RETRY_QUEUE_KEY, json.dumps(pending))
+    except Exception as e:
+        # Last resort: the payload ends up in the error log so it can be recovered by hand
+        logger.critical(f"Message {pending['pending_id']} could not be queued for retry: {e}", extra={'pending_message': pending})
+
+
+async def push_batch_to_retry_queue(batch: list[PendingMessage]) -> bool:
+    try:
+        await get_async_redis().rpush(RETRY_QUEUE_KEY, *[json.dumps(pending) for pending in batch])
+        return True
+    except Exception as e:
+        logger.critical(f"{len(batch)} messages could not be queued for retry: {e}", extra={'pending_messages': batch})
+        return False
+
+
+async def unstage_messages(batch: list[PendingMessage]) -> None:
+    try:
+        await get_async_redis().hdel(STAGED_KEY, *[pending['pending_id'] for pending in batch])
+    except Exception as e:
+        # They are saved already, the orphan replay would save them a second time
+        logger.error(f"Error on unstage_messages: {e}")
+
+
+def claim_orphaned_messages(max_age: float) -> list[PendingMessage]:
+    """Staged messages older than max_age seconds, left behind by a process that went away"""
+    redis_client = get_redis()
+    cutoff = time.time() - max_age
+    claimed: list[PendingMessage] = []
+    for pending_id, raw in redis_client.hgetall(STAGED_KEY).items():
+        pending = json.loads(raw)
+        # HDEL is atomic, of two runs racing for a message only one gets it
+        if pending['staged_at'] < cutoff and redis_client.hdel(STAGED_KEY, pending_id):
+            claimed.append(pending)
+    return claimed
+
+
+async def broadcast_persisted(persisted: list[tuple[PendingMessage, Any]]) -> None:
+    """Tell the conversation which database id each staged message ended up with."""
+    channel_layer = get_channel_layer()
+    for pending, instance in persisted:
+        await publish_event(channel_layer, pending['group_name'], {
+            'action_type': 'message_persisted',
+            'pending_id': pending['pending_id'],
+            'message_id': instance.id,
+            'timestamp': serializers.DateTimeField().to_representation(instance.timestamp),
+        })
+
+
+class MessageWriteBehindBuffer:
+    """
+    Per-process buffer for chat messages that were already broadcast but not yet saved.
+    Messages are flushed every flush_interval seconds, or as soon as batch_size of
+    them are waiting, whichever comes first. Every message is staged in redis before it
+    is acknowledged, so the buffer itself can be lost without losing messages.
+    """
+
+    def __init__(self, flush_interval: float, batch_size: int) -> None:
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self._pending: list[PendingMessage] = []
+        self._batch_full: asyncio.Event | None = None
+        self._flush_task: asyncio.Task | None = None
+
+    async def enqueue(self, pending: PendingMessage) -> None:
+        """Raises if the message could not be staged, the caller has to save it another way"""
+        await get_async_redis().hset(STAGED_KEY, pending['pending_id'], json.dumps(pending))
+        self._pending.append(pending)
+        if self._flush_task is None or self._flush_task.done():
+            self._batch_full = asyncio.Event()
+            self._flush_task = asyncio.get_running_loop().create_task(self._run())
+        if len(self._pending) >= self.batch_size and self._batch_full is not None:
+            self._batch_full.set()
+
+    async def _run(self) -> None:
+        while self._pending and self._batch_full is not None:
+            try:
+                await asyncio.wait_for(self._batch_full.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._batch_full.clear()
+            await self.flush()
+
+    async def flush(self) -> None:
+        while self._pending:
+            batch = self._pending[:self.batch_size]
+            del self._pending[:self.batch_size]
+            try:
+                persisted = await database_sync_to_async(persist_messages)(batch)
+            except Exception as e:
+                logger.error(f"Error on write-behind flush: {e}")
+                # Left staged if even the retry queue is down, the orphan replay picks them up
+                if await push_batch_to_retry_queue(batch):
+                    await unstage_messages(batch)
+                continue
+            # Saved or parked in the retry queue by persist_messages
+            await unstage_messages(batch)
+            try:
+                await broadcast_persisted(persisted)
+            except Exception as e:
+                logger.error(f"Error on broadcast_persisted: {e}")
+
+
+_buffer: MessageWriteBehindBuffer | None = None
+
+
+def get_write_behind_buffer() -> MessageWriteBehindBuffer:
+    global _buffer
+    if _buffer is None:
+        _buffer = MessageWriteBehindBuffer(
+            flush_interval=settings.CHAT_WRITE_BEHIND_FLUSH_INTERVAL,
+            batch_size=settings.CHAT_WRITE_BEHIND_BATCH_SIZE,
+        )
+    return _buffer
@@ -0,0 +1,87 @@
+from __future__ import annotations
+import json
+import logging
+from typing import Any
+from django.conf import settings
+from common.websocket import frame_event
+from neurocom.redis_client import get_async_redis
+
+logger = logging.getLogger(__name__)
+
+# Every conversation event (message, edit, delete, persisted ack) gets the next sequence
+# number of its group and is appended to a capped redis stream keyed by that number.
+# A client reconnecting with ?since_seq=N gets the events after N replayed over the socket,
+# or a resync_required frame when they are no longer in the stream and it has to use REST.
+
+# Counter and stream are updated in one script so stream ids always follow the sequence
+PUBLISH_SCRIPT = """
+local seq = redis.call('INCR', KEYS[1])
+redis.call('XADD', KEYS[2], 'MAXLEN', '~', ARGV[2], seq .. '-0', 'payload', ARGV[1])
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+redis.call('EXPIRE', KEYS[2], ARGV[3])
+return seq
+"""
+
+
+def seq_key(group_name: str) -> str:
+    return f'chat_seq_{group_name}'
+
+
+def stream_key(group_name: str) -> str:
+    return f'chat_stream_{group_name}'
+
+
+async def next_seq(group_name: str, payload: dict[str, Any]) -> int | None:
+    try:
+        script = get_async_redis().register_script(PUBLISH_SCRIPT)
+        seq = await script(
+            keys=[seq_key(group_name), stream_key(group_name)],
+            args=[json.dumps(payload), settings.CHAT_REPLAY_STREAM_LENGTH, settings.CHAT_REPLAY_TTL],
+        )
+        return int(seq)
+    except Exception as e:
+        logger.error(f"Error on next_seq: {e}")
+        return None
+
+
+async def publish_event(channel_layer, group_name: str, payload: dict[str, Any]) -> None:
+    """Sequence a conversation event, keep it for replay and send it to the group."""
+    seq = await next_seq(group_name, payload)
+    if seq is None:
+        await channel_layer.group_send(group_name, frame_event(payload))
+        return
+    #The seq also rides on the event, so consumers can spot the events they never got
+    event = frame_event({**payload, 'seq': seq})
+    event['seq'] = seq
+    await channel_layer.group_send(group_name, event)
+
+
+async def get_missed_events(group_name: str, since_seq: int) -> list[dict[str, Any]] | None:
+    """
+    Events of the group with a sequence number above since_seq, oldest first.
+    Returns None when some of them were already trimmed from the stream (or the
+    counter was reset), in which case the client has to refetch over REST.
+    """
+    redis_client = get_async_redis()
+    pipe = redis_client.pipeline(transaction=False)
+    pipe.get(seq_key(group_name))
+    pipe.xrange(stream_key(group_name), count=1)
+    last_seq, first_kept = await pipe.execute()
+
+    last_seq = int(last_seq or 0)
+    if since_seq == last_seq:
+        return []
+    if since_seq > last_seq or not first_kept:
+        return None
+
+    # The first event after since_seq must still be in the stream, otherwise there is a gap
+    oldest_kept = int(first_kept[0][0].split(b'-')[0])
+    if oldest_kept > since_seq + 1:
+        return None
+
+    events = []
+    for entry_id, fields in await redis_client.xrange(stream_key(group_name), min=f'{since_seq + 1}-0'):
+        event = json.loads(fields[b'payload'])
+        event['seq'] = int(entry_id.split(b'-')[0])
+        events.append(event)
+    return events
@@ -2,7 +2,10 @@ from rest_framework import serializers
 from django.contrib.auth.password_validation import validate_password
 from django.core.exceptions import ValidationError
 from .models import DirectMessage, DirectMessageMessage
-from user.serializers import UserSerializer
+from user.serializers import user_serializer_related
+from user.card_cache import UserCardsMixin, UserCardsListSerializer
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
 
 from .models import File
 from django.contrib.auth import get_user_model
@@ -13,24 +16,52 @@ user_model= get_user_model()
 #SERIALIZERS FOR CHAT
 
 
+def prefetch_message_relations(queryset):
+    """Load the senders (settings, profile picture) and files the message serializers read, in a fixed number of queries"""
+    return queryset.select_related(*user_serializer_related('sender')).prefetch_related('file')
+
+
+def annotate_dm_inbox(queryset, user):
+    """
+    Join both participants in and add the last message preview and the user's unread
+    count as subqueries, so DirectMessageSerializer renders a whole page from one query.
+    """
+    messages = DirectMessageMessage.objects.filter(direct_message=OuterRef('pk'))
+    last_message = messages.order_by('-timestamp', '-id')
+    unread = (
+        messages.filter(is_read=False).exclude(sender=user)
+        .order_by().values('direct_message').annotate(count=Count('id')).values('count')
+    )
+    return queryset.select_related(*user_serializer_related('user1', 'user2')).annotate(
+        last_message_content=Subquery(last_message.values('content')[:1]),
+        last_message_sender_id=Subquery(last_message.values('sender_id')[:1]),
+        last_message_timestamp=Subquery(last_message.values('timestamp')[:1]),
+        unread_count=Coalesce(Subquery(unread), 0),
+    )
+
+
     
-class MessageSerializer(serializers.ModelSerializer):
+class MessageSerializer(UserCardsMixin, serializers.ModelSerializer):
     sender = serializers.SerializerMethodField()
     file = serializers.SerializerMethodField()
 
     class Meta:
         model = DirectMessageMessage
         fields = '__all__'
+        list_serializer_class = UserCardsListSerializer
+
+    def card_users(self, obj):
+        return [obj.sender]
 
     def get_sender(self,obj):
-        sender = UserSerializer(obj.sender).data
+        sender = self.card(obj.sender)
 
 
         return sender
     
     def get_file(self, obj):
-        # Get the first file if it exists
-        file = obj.file.first()
+        # Get the first file if it exists, through .all() so a prefetch_related('file') is reused
+        file = min(obj.file.all(), key=lambda chat_file: chat_file.id, default=None)
         if file:
             return ChatFileSerializer(file).data  # Serialize the file
         return None
@@ -52,20 +83,37 @@ class MessageSerializer(serializers.ModelSerializer):
 
 
 
-class DirectMessageSerializer(serializers.ModelSerializer):
+class DirectMessageSerializer(UserCardsMixin, serializers.ModelSerializer):
     other_user = serializers.SerializerMethodField()
+    last_message = serializers.SerializerMethodField()
+    unread_count = serializers.SerializerMethodField()
     class Meta:
         model = DirectMessage
         fields = '__all__'
+        list_serializer_class = UserCardsListSerializer
 
+    def chat_partner(self, obj):
+        if obj.user1_id == self.context['request'].user.id:
+            return obj.user2
+        return obj.user1
 
-    def get_other_user(self,obj):
-        user_id = obj.user1.id
-        user = user_model.objects.get(id=user_id)
+    def card_users(self, obj):
+        return [self.chat_partner(obj)]
 
-        if user == self.context['request'].user:
-            return UserSerializer(obj.user2).data
-        else:
-            return UserSerializer(user).data
+    def get_other_user(self,obj):
+        return self.card(self.chat_partner(obj))
+
+    def get_last_message(self, obj):
+        #Filled by annotate_dm_inbox, None for a conversation without messages
+        if getattr(obj, 'last_message_timestamp', None) is None:
+            return None
+        return {
+            'content': obj.last_message_content,
+            'sender_id': obj.last_message_sender_id,
+            'timestamp': serializers.DateTimeField().to_representation(obj.last_message_timestamp),
+        }
+
+    def get_unread_count(self, obj):
+        return getattr(obj, 'unread_count', 0)
 
 
@@ -0,0 +1,59 @@
+from django.test import SimpleTestCase
+from asgiref.sync import async_to_sync
+from chat.chat_status import OpenChat, chat_open_key, get_open_chats, CLOSE_SCRIPT
+from unittest.mock import patch, call, AsyncMock, MagicMock
+
+
+@patch('chat.chat_status.get_async_redis')
+class OpenChatTest(SimpleTestCase):
+
+    def mock_redis(self, mock_redis):
+        redis_client = mock_redis.return_value
+        redis_client.pipeline.return_value = MagicMock(execute=AsyncMock())
+        redis_client.expire = AsyncMock()
+        redis_client.register_script.return_value = AsyncMock()
+        return redis_client
+
+    def test_sockets_are_counted_per_dm(self, mock_redis):
+        redis_client = self.mock_redis(mock_redis)
+        open_chat = OpenChat(7, 1)
+
+        async_to_sync(open_chat.open)()
+        async_to_sync(open_chat.close)()
+
+        pipe = redis_client.pipeline.return_value
+        pipe.hincrby.assert_called_once_with(chat_open_key(7), '1', 1)
+        pipe.expire.assert_called_once()
+        redis_client.register_script.assert_called_with(CLOSE_SCRIPT)
+        redis_client.register_script.return_value.assert_awaited_once_with(keys=[chat_open_key(7)], args=['1'])
+
+    def test_refresh_is_throttled(self, mock_redis):
+        redis_client = self.mock_redis(mock_redis)
+        open_chat = OpenChat(7, 1)
+        async_to_sync(open_chat.open)()
+
+        for _ in range(3):
+            async_to_sync(open_chat.refresh)()
+
+        # open() just set the TTL, nothing to refresh yet
+        redis_client.expire.assert_not_awaited()
+
+
+@patch('chat.chat_status.get_redis')
+class GetOpenChatsTest(SimpleTestCase):
+
+    def test_users_of_many_dms_are_checked_in_one_round_trip(self, mock_redis):
+        pipe = mock_redis.return_value.pipeline.return_value
+        pipe.execute.return_value = [b'2', None, b'0']
+
+        open_chats = get_open_chats([(7, 1), (7, 2), (8, 1), (7, 1)])
+
+        self.assertEqual(open_chats, {(7, 1): True, (7, 2): False, (8, 1): False})
+        pipe.hget.assert_has_calls([call(chat_open_key(7), '1'), call(chat_open_key(7), '2'), call(chat_open_key(8), '1')])
+        pipe.execute.assert_called_once()
+
+    def test_redis_errors_count_as_not_open(self, mock_redis):
+        mock_redis.return_value.pipeline.return_value.execute.side_effect = ConnectionError
+
+        with self.assertLogs('chat.chat_status', 'ERROR'):
+            self.assertEqual(get_open_chats([(7, 1)]), {(7, 1): False})
@@ -0,0 +1,27 @@
+from django.test import SimpleTestCase
+from asgiref.sync import async_to_sync
+from chat.idempotency import claim_client_msg_id, IN_FLIGHT
+from unittest.mock import patch, AsyncMock
+import json
+
+claim = async_to_sync(claim_client_msg_id)
+
+
+@patch('chat.idempotency.get_async_redis')
+class ClaimClientMsgIdTest(SimpleTestCase):
+
+    def mock_redis(self, mock_redis, claimed, recorded=None):
+        mock_redis.return_value.set = AsyncMock(return_value=claimed)
+        mock_redis.return_value.get = AsyncMock(return_value=recorded)
+
+    def test_first_attempt_claims_the_id(self, mock_redis):
+        self.mock_redis(mock_redis, True)
+        self.assertEqual(claim('key'), (True, None))
+
+    def test_retry_gets_the_original_message(self, mock_redis):
+        self.mock_redis(mock_redis, None, json.dumps({'message_id': 5, 'pending_id': None}).encode())
+        self.assertEqual(claim('key'), (False, {'message_id': 5, 'pending_id': None}))
+
+    def test_retry_while_first_attempt_is_saving(self, mock_redis):
+        self.mock_redis(mock_redis, None, IN_FLIGHT)
+        self.assertEqual(claim('key'), (False, None))
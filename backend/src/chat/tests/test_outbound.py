@@ -0,0 +1,66 @@
+from django.test import SimpleTestCase, override_settings
+from asgiref.sync import async_to_sync
+from channels.exceptions import ChannelFull
+from channels.layers import get_channel_layer
+from channels.testing import WebsocketCommunicator
+from common.channel_layer import CountingRedisChannelLayer, GROUP_OVERFLOW_LOG_MESSAGE, channel_layer_counters
+from common.websocket import FrameProtocolConsumer, frame_event
+from unittest.mock import patch, AsyncMock
+import json
+import logging
+import msgpack
+
+
+class GroupConsumer(FrameProtocolConsumer):
+    async def connect(self):
+        await self.channel_layer.group_add('frames', self.channel_name)
+        await self.accept()
+
+
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+class FrameProtocolTest(SimpleTestCase):
+
+    def receive_group_frame(self, path):
+        async def run():
+            communicator = WebsocketCommunicator(GroupConsumer.as_asgi(), path)
+            await communicator.connect()
+            await get_channel_layer().group_send('frames', frame_event({'n': 1}))
+            output = await communicator.receive_output()
+            await communicator.disconnect()
+            return output
+        return async_to_sync(run)()
+
+    def test_group_events_carry_only_the_json_frame(self):
+        self.assertNotIn('bytes', frame_event({'n': 1}))
+        self.assertEqual(self.receive_group_frame('/ws/')['text'], json.dumps({'n': 1}))
+
+    def test_msgpack_clients_get_the_frame_transcoded(self):
+        output = self.receive_group_frame('/ws/?format=msgpack')
+        self.assertEqual(msgpack.unpackb(output['bytes']), {'n': 1})
+
+
+class ChannelLayerOverflowTest(SimpleTestCase):
+
+    def setUp(self):
+        channel_layer_counters.clear()
+
+    @patch('channels_redis.core.RedisChannelLayer.send', new_callable=AsyncMock, side_effect=ChannelFull)
+    def test_full_channel_is_counted_and_still_raised(self, mock_send):
+        layer = CountingRedisChannelLayer()
+
+        with self.assertRaises(ChannelFull), self.assertLogs('common.channel_layer', 'WARNING'):
+            async_to_sync(layer.send)('specific.abc!def', {'type': 'forward_frame'})
+        self.assertEqual(channel_layer_counters['channel_full'], 1)
+
+    def test_dropped_group_messages_are_counted_from_the_channels_redis_log(self):
+        with self.assertLogs('channels_redis.core', 'INFO'):
+            logging.getLogger('channels_redis.core').info(GROUP_OVERFLOW_LOG_MESSAGE, 3, 10, 'chat_1')
+            logging.getLogger('channels_redis.core').info("Creating tasks")
+
+        self.assertEqual(channel_layer_counters['group_dropped'], 3)
+
+    def test_websocket_channels_have_their_own_capacity(self):
+        layer = CountingRedisChannelLayer(capacity=100, channel_capacity={'specific.*': 20})
+
+        self.assertEqual(layer.get_capacity('specific.abc!def'), 20)
+        self.assertEqual(layer.get_capacity('background-jobs'), 100)
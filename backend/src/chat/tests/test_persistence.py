@@ -0,0 +1,119 @@
+from django.test import TestCase
+from django.contrib.auth import get_user_model
+from asgiref.sync import async_to_sync
+from chat.consumers import DirectMessageConsumer
+from chat.models import DirectMessage, DirectMessageMessage
+from chat.persistence import persist_messages, claim_orphaned_messages, MessageWriteBehindBuffer, RETRY_QUEUE_KEY, STAGED_KEY
+from files.models import ChatFile
+from unittest.mock import patch, AsyncMock, Mock
+import json
+import time
+
+User = get_user_model()
+
+
+@patch('notifications.signals.create_notification')
+class PersistMessagesTest(TestCase):
+    def setUp(self):
+        self.user1 = User.objects.create_user(username='user1', email='user1@test.com', password='testpass123')
+        self.user2 = User.objects.create_user(username='user2', email='user2@test.com', password='testpass123')
+        self.dm = DirectMessage.objects.create(user1=self.user1, user2=self.user2)
+
+    def pending(self, content, pending_id):
+        return {
+            'model': DirectMessageMessage._meta.label,
+            'fields': {
+                'direct_message_id': self.dm.id,
+                'sender_id': self.user1.id,
+                'content': content,
+            },
+            'file_id': None,
+            'group_name': self.dm.group_name,
+            'pending_id': pending_id,
+            'staged_at': time.time(),
+        }
+
+    def test_batch_is_saved_and_signals_fire(self, mock_notification):
+        original_interaction = self.dm.last_interaction
+        persisted = persist_messages([self.pending('first', 'a'), self.pending('second', 'b')])
+
+        self.assertEqual(len(persisted), 2)
+        self.assertEqual(DirectMessageMessage.objects.filter(direct_message=self.dm).count(), 2)
+        self.assertEqual([pending['pending_id'] for pending, _ in persisted], ['a', 'b'])
+        self.assertTrue(all(instance.id for _, instance in persisted))
+        self.assertEqual(mock_notification.call_count, 2)
+
+        self.dm.refresh_from_db()
+        self.assertGreater(self.dm.last_interaction, original_interaction)
+
+    @patch('chat.persistence.get_redis')
+    def test_failed_rows_go_to_retry_queue(self, mock_redis, mock_notification):
+        bad = self.pending(None, 'bad')  # content is NOT NULL
+        persisted = persist_messages([self.pending('ok', 'good'), bad])
+
+        self.assertEqual([pending['pending_id'] for pending, _ in persisted], ['good'])
+        mock_redis.return_value.rpush.assert_called_once_with(RETRY_QUEUE_KEY, json.dumps(bad))
+
+    @patch('chat.persistence.broadcast_persisted', new_callable=AsyncMock)
+    @patch('chat.persistence.get_async_redis')
+    def test_messages_are_staged_until_saved(self, mock_redis, mock_broadcast, mock_notification):
+        redis_client = mock_redis.return_value = Mock(hset=AsyncMock(), hdel=AsyncMock())
+        buffer = MessageWriteBehindBuffer(flush_interval=10, batch_size=100)
+        pending = self.pending('hello', 'a')
+
+        async def stage_and_flush():
+            await buffer.enqueue(pending)
+            redis_client.hset.assert_awaited_once_with(STAGED_KEY, 'a', json.dumps(pending))
+            redis_client.hdel.assert_not_awaited()
+            await buffer.flush()
+
+        async_to_sync(stage_and_flush)()
+
+        self.assertTrue(DirectMessageMessage.objects.filter(content='hello').exists())
+        redis_client.hdel.assert_awaited_once_with(STAGED_KEY, 'a')
+
+    @patch('chat.persistence.get_redis')
+    def test_only_old_staged_messages_are_claimed(self, mock_redis, mock_notification):
+        orphaned = {**self.pending('lost', 'old'), 'staged_at': time.time() - 600}
+        fresh = self.pending('in flight', 'new')
+        redis_client = mock_redis.return_value
+        redis_client.hgetall.return_value = {b'old': json.dumps(orphaned).encode(), b'new': json.dumps(fresh).encode()}
+        redis_client.hdel.return_value = 1
+
+        self.assertEqual(claim_orphaned_messages(300), [orphaned])
+        redis_client.hdel.assert_called_once_with(STAGED_KEY, b'old')
+
+
+@patch('chat.consumers.get_write_behind_buffer')
+class StageMessageTest(TestCase):
+    def setUp(self):
+        self.user1 = User.objects.create_user(username='user1', email='user1@test.com', password='testpass123')
+        self.user2 = User.objects.create_user(username='user2', email='user2@test.com', password='testpass123')
+        self.dm = DirectMessage.objects.create(user1=self.user1, user2=self.user2)
+
+    def upload(self, user):
+        return ChatFile.objects.create(user=user, original_name='photo.png', file_path='uploads/photo.png', file_size=10, mime_type='image/png')
+
+    def stage(self, mock_buffer, file_data):
+        mock_buffer.return_value.enqueue = AsyncMock()
+        consumer = DirectMessageConsumer()
+        consumer.user = self.user1
+        consumer.dm_id = self.dm.id
+        consumer.room_group_name = self.dm.group_name
+        consumer.sender_data = {'id': self.user1.id}
+        return async_to_sync(consumer.stage_message)({'content': 'look', 'file': file_data})
+
+    def test_file_metadata_comes_from_the_database(self, mock_buffer):
+        chat_file = self.upload(self.user1)
+
+        message = self.stage(mock_buffer, {'id': chat_file.id, 'original_name': 'fake.exe', 'url': 'https://evil.test/'})
+
+        self.assertEqual(message['file']['original_name'], 'photo.png')
+        self.assertNotEqual(message['file']['url'], 'https://evil.test/')
+        self.assertEqual(mock_buffer.return_value.enqueue.await_args.args[0]['file_id'], chat_file.id)
+
+    def test_files_of_other_users_are_refused(self, mock_buffer):
+        chat_file = self.upload(self.user2)
+
+        self.assertIsNone(self.stage(mock_buffer, {'id': chat_file.id}))
+        mock_buffer.return_value.enqueue.assert_not_awaited()
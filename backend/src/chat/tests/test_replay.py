@@ -0,0 +1,124 @@
+from django.test import SimpleTestCase
+from asgiref.sync import async_to_sync
+from chat.consumers import DirectMessageConsumer
+from chat.replay import get_missed_events
+from unittest.mock import patch, AsyncMock
+import json
+
+
+def stream_entry(seq, payload):
+    return (f'{seq}-0'.encode(), {b'payload': json.dumps(payload).encode()})
+
+
+@patch('chat.replay.get_async_redis')
+class GetMissedEventsTest(SimpleTestCase):
+
+    def mock_stream(self, mock_redis, last_seq, entries):
+        redis_client = mock_redis.return_value
+        redis_client.pipeline.return_value.execute = AsyncMock(return_value=[
+            str(last_seq).encode() if last_seq else None,
+            entries[:1],
+        ])
+        redis_client.xrange = AsyncMock(side_effect=lambda key, min: [
+            entry for entry in entries if int(entry[0].split(b'-')[0]) >= int(min.split('-')[0])
+        ])
+
+    def test_replays_events_after_since_seq(self, mock_redis):
+        self.mock_stream(mock_redis, 3, [
+            stream_entry(1, {'action_type': 'chat_message'}),
+            stream_entry(2, {'action_type': 'message_edited'}),
+            stream_entry(3, {'action_type': 'message_deleted'}),
+        ])
+
+        events = async_to_sync(get_missed_events)('dm_1', 1)
+
+        self.assertEqual(events, [
+            {'action_type': 'message_edited', 'seq': 2},
+            {'action_type': 'message_deleted', 'seq': 3},
+        ])
+
+    def test_up_to_date_client_gets_nothing(self, mock_redis):
+        self.mock_stream(mock_redis, 3, [stream_entry(3, {'action_type': 'chat_message'})])
+
+        self.assertEqual(async_to_sync(get_missed_events)('dm_1', 3), [])
+
+    def test_trimmed_gap_requires_resync(self, mock_redis):
+        # Events 2 to 4 were trimmed, the client that saw 1 cannot be caught up from the stream
+        self.mock_stream(mock_redis, 6, [stream_entry(5, {}), stream_entry(6, {})])
+
+        self.assertIsNone(async_to_sync(get_missed_events)('dm_1', 1))
+
+    def test_reset_counter_requires_resync(self, mock_redis):
+        self.mock_stream(mock_redis, None, [])
+
+        self.assertIsNone(async_to_sync(get_missed_events)('dm_1', 10))
+
+
+@patch('chat.consumers.get_missed_events', new_callable=AsyncMock)
+class FollowSeqTest(SimpleTestCase):
+
+    def make_consumer(self, last_seq):
+        consumer = DirectMessageConsumer()
+        consumer.room_group_name = 'dm_1'
+        consumer.last_seq = last_seq
+        consumer.send_payload = AsyncMock()
+        consumer.send_frame = AsyncMock()
+        return consumer
+
+    def forward(self, consumer, seq):
+        async_to_sync(consumer.forward_frame)({'type': 'forward_frame', 'text': json.dumps({'seq': seq}), 'seq': seq})
+
+    def test_events_in_order_are_forwarded(self, mock_missed):
+        consumer = self.make_consumer(None)
+
+        self.forward(consumer, 4)
+        self.forward(consumer, 5)
+
+        self.assertEqual(consumer.send_frame.await_count, 2)
+        self.assertEqual(consumer.last_seq, 5)
+        mock_missed.assert_not_awaited()
+
+    def test_gap_is_replayed_from_the_stream(self, mock_missed):
+        # channels_redis dropped 5 and 6 while the socket's channel was over capacity
+        mock_missed.return_value = [{'seq': 5}, {'seq': 6}, {'seq': 7}]
+        consumer = self.make_consumer(4)
+
+        self.forward(consumer, 7)
+
+        mock_missed.assert_awaited_once_with('dm_1', 4)
+        self.assertEqual([call.args[0] for call in consumer.send_payload.await_args_list], [{'seq': 5}, {'seq': 6}, {'seq': 7}])
+        consumer.send_frame.assert_not_awaited()
+        self.assertEqual(consumer.last_seq, 7)
+
+    def test_event_overtaken_by_a_replay_is_dropped(self, mock_missed):
+        consumer = self.make_consumer(7)
+
+        self.forward(consumer, 6)
+
+        consumer.send_frame.assert_not_awaited()
+        self.assertEqual(consumer.last_seq, 7)
+
+    def test_gap_older_than_the_stream_requires_resync(self, mock_missed):
+        mock_missed.return_value = None
+        consumer = self.make_consumer(4)
+
+        self.forward(consumer, 9)
+
+        consumer.send_payload.assert_awaited_once_with({'action_type': 'resync_required'})
+        consumer.send_frame.assert_awaited_once()
+        self.assertEqual(consumer.last_seq, 9)
+
+    def test_event_published_during_the_connect_replay_is_sent_once(self, mock_missed):
+        # Event 5 was published after the socket joined the group but before the stream was read
+        mock_missed.return_value = [{'seq': 4}, {'seq': 5}]
+        consumer = self.make_consumer(None)
+        consumer.scope = {'query_string': b'since_seq=3'}
+
+        async_to_sync(consumer.replay_missed_events)()
+        self.forward(consumer, 5)
+        self.forward(consumer, 6)
+
+        mock_missed.assert_awaited_once_with('dm_1', 3)
+        self.assertEqual([call.args[0] for call in consumer.send_payload.await_args_list], [{'seq': 4}, {'seq': 5}])
+        consumer.send_frame.assert_awaited_once_with(json.dumps({'seq': 6}))
+        self.assertEqual(consumer.last_seq, 6)
@@ -0,0 +1,64 @@
+from django.test import SimpleTestCase
+from asgiref.sync import async_to_sync
+from chat.typing import TypingTracker
+from chat.consumers import BaseConsumer
+from unittest.mock import patch, call, AsyncMock, Mock
+import asyncio
+import json
+
+
+@patch('chat.typing.send_typing')
+class TypingTrackerTest(SimpleTestCase):
+
+    def test_keystrokes_are_coalesced_into_start_and_stop(self, mock_send):
+        async def type_and_wait():
+            tracker = TypingTracker(window=0.05)
+            for _ in range(20):
+                await tracker.touch('dm_1', 1)
+                await asyncio.sleep(0.01)
+            await asyncio.sleep(0.1)
+
+        async_to_sync(type_and_wait)()
+
+        self.assertEqual(mock_send.call_args_list, [call('dm_1', 1, True), call('dm_1', 1, False)])
+
+    def test_stop_ends_typing_right_away(self, mock_send):
+        async def type_and_send():
+            tracker = TypingTracker(window=10)
+            await tracker.touch('dm_1', 1)
+            await tracker.stop('dm_1', 1)
+            await tracker.stop('dm_1', 1)
+
+        async_to_sync(type_and_send)()
+
+        self.assertEqual(mock_send.call_args_list, [call('dm_1', 1, True), call('dm_1', 1, False)])
+
+
+@patch('chat.consumers.record_activity_async', new_callable=AsyncMock)
+@patch('chat.consumers.get_typing_tracker')
+class TypingFramesTest(SimpleTestCase):
+
+    def receive(self, payload):
+        consumer = BaseConsumer()
+        consumer.user = Mock(id=1)
+        consumer.room_group_name = 'dm_1'
+        async_to_sync(consumer.receive)(text_data=json.dumps(payload))
+
+    def test_status_frames_of_the_current_client_drive_the_tracker(self, mock_tracker, mock_activity):
+        tracker = mock_tracker.return_value = Mock(touch=AsyncMock(), stop=AsyncMock())
+        status = {'user_id': '1', 'in_the_chat_status': 'True'}
+
+        self.receive({'action_type': 'user_status', 'user_status': {**status, 'typing': 'True'}})
+        self.receive({'action_type': 'user_status', 'user_status': {**status, 'typing': 'False'}})
+
+        tracker.touch.assert_awaited_once_with('dm_1', 1)
+        tracker.stop.assert_awaited_once_with('dm_1', 1)
+
+    def test_typing_frames_drive_the_tracker(self, mock_tracker, mock_activity):
+        tracker = mock_tracker.return_value = Mock(touch=AsyncMock(), stop=AsyncMock())
+
+        self.receive({'action_type': 'typing', 'is_typing': True})
+        self.receive({'action_type': 'typing', 'is_typing': False})
+
+        tracker.touch.assert_awaited_once_with('dm_1', 1)
+        tracker.stop.assert_awaited_once_with('dm_1', 1)
@@ -10,6 +10,11 @@ import json
 import tempfile
 import os
 from neurocom import settings
+from django.contrib.contenttypes.models import ContentType
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from files.models import ChatFile
+from unittest.mock import patch
 
 User = get_user_model()
 
@@ -239,3 +244,100 @@ class SecureMediaViewTest(APITestCase):
         response = self.client.get(url)
         
         self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+@patch('notifications.signals.create_notification')
+class DmMessagesQueryBudgetTest(APITestCase):
+    def setUp(self):
+        self.user1 = User.objects.create_user(username='user1', email='user1@test.com', password='testpass123')
+        self.user2 = User.objects.create_user(username='user2', email='user2@test.com', password='testpass123')
+        self.token = Token.objects.create(user=self.user1)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        self.dm = DirectMessage.objects.create(user1=self.user1, user2=self.user2)
+        self.content_type = ContentType.objects.get_for_model(DirectMessageMessage)
+
+    def create_messages(self, count):
+        for i in range(count):
+            sender = self.user1 if i % 2 else self.user2
+            message = DirectMessageMessage.objects.create(direct_message=self.dm, sender=sender, content=f"Message {i}")
+            ChatFile.objects.create(
+                user=sender, original_name='a.txt', file_path='a.txt', file_size=1, mime_type='text/plain',
+                file_type='document', message_content_type=self.content_type, message_object_id=message.id,
+            )
+
+    def get_page(self, page_size):
+        url = reverse('get_messages_dm', args=[self.dm.id])
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, {'page_size': page_size})
+        messages = response.data['data']['messages']
+        self.assertEqual(len(messages), page_size)
+        self.assertIsNotNone(messages[0]['file'])
+        return len(queries)
+
+    def test_query_count_does_not_grow_with_page_size(self, mock_notification):
+        self.create_messages(5)
+        small_page_queries = self.get_page(5)
+
+        self.create_messages(45)
+        self.assertEqual(self.get_page(50), small_page_queries)
+
+
+@patch('user_activity.audience.get_redis')
+@patch('notifications.signals.create_notification')
+class DirectMessageInboxTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='user1', email='user1@test.com', password='testpass123')
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def create_dms(self, count):
+        for _ in range(count):
+            i = User.objects.count()
+            other_user = User.objects.create_user(username=f'user{i + 1}', email=f'user{i + 1}@test.com', password='testpass123')
+            dm = DirectMessage.objects.create(user1=other_user, user2=self.user)
+            DirectMessageMessage.objects.create(direct_message=dm, sender=other_user, content='hello')
+            DirectMessageMessage.objects.create(direct_message=dm, sender=self.user, content='hi back')
+            DirectMessageMessage.objects.create(direct_message=dm, sender=other_user, content='latest')
+
+    def get_inbox(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('get_direct_messages'), {'page_size': 50})
+        return response.data['data']['direct_messages'], len(queries)
+
+    def test_query_count_does_not_grow_with_page_size(self, mock_notification, mock_redis):
+        self.create_dms(2)
+        direct_messages, small_inbox_queries = self.get_inbox()
+        self.assertEqual(len(direct_messages), 2)
+
+        self.create_dms(10)
+        direct_messages, large_inbox_queries = self.get_inbox()
+        self.assertEqual(len(direct_messages), 12)
+        self.assertEqual(large_inbox_queries, small_inbox_queries)
+
+    def test_rows_carry_other_user_preview_and_unread_count(self, mock_notification, mock_redis):
+        self.create_dms(1)
+
+        direct_message = self.get_inbox()[0][0]
+
+        self.assertEqual(direct_message['other_user']['username'], 'user2')
+        self.assertEqual(direct_message['last_message']['content'], 'latest')
+        self.assertEqual(direct_message['unread_count'], 2)
+
+    def test_opening_the_conversation_reads_it(self, mock_notification, mock_redis):
+        self.create_dms(1)
+        dm = DirectMessage.objects.get()
+
+        response = self.client.get(reverse('get_messages_dm', kwargs={'id': dm.id}))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.get_inbox()[0][0]['unread_count'], 0)
+        # Only what the user received, their own message is left for the other side
+        self.assertEqual(list(dm.messages.filter(is_read=False).values_list('content', flat=True)), ['hi back'])
+
+    def test_blocked_conversations_are_left_out(self, mock_notification, mock_redis):
+        self.create_dms(2)
+        blocked, blocker = User.objects.filter(username__in=['user2', 'user3']).order_by('username')
+        self.user.block_user(blocked)
+        blocker.block_user(self.user)
+
+        self.assertEqual(self.get_inbox()[0], [])
@@ -0,0 +1,76 @@
+from __future__ import annotations
+import asyncio
+import logging
+from django.conf import settings
+from channels.layers import get_channel_layer
+from common.websocket import frame_event
+
+logger = logging.getLogger(__name__)
+
+TypingKey = tuple[str, int]  # (group name, user id)
+
+
+async def send_typing(group_name: str, user_id: int, is_typing: bool) -> None:
+    try:
+        await get_channel_layer().group_send(group_name, frame_event({
+            'action_type': 'typing',
+            'user_id': user_id,
+            'is_typing': is_typing,
+        }))
+    except Exception as e:
+        logger.error(f"Error on send_typing: {e}")
+
+
+class TypingTracker:
+    """
+    Per-process coalescing of typing indicators, never persisted.
+    The first keystroke of a user in a conversation broadcasts a start event, the
+    following ones only push the deadline back. A stop event is broadcast once the
+    user has been quiet for window seconds, sends the message or disconnects, so
+    there are at most two channel layer events per typing burst.
+    """
+
+    def __init__(self, window: float) -> None:
+        self.window = window
+        self._deadlines: dict[TypingKey, float] = {}
+        self._expiry_tasks: dict[TypingKey, asyncio.Task] = {}
+
+    async def touch(self, group_name: str, user_id: int) -> None:
+        key = (group_name, user_id)
+        loop = asyncio.get_running_loop()
+        is_new = key not in self._deadlines
+        self._deadlines[key] = loop.time() + self.window
+        if is_new:
+            self._expiry_tasks[key] = loop.create_task(self._expire(key))
+            await send_typing(group_name, user_id, True)
+
+    def is_typing(self, group_name: str, user_id: int) -> bool:
+        """Only knows about the sockets of this process"""
+        return (group_name, user_id) in self._deadlines
+
+    async def stop(self, group_name: str, user_id: int) -> None:
+        key = (group_name, user_id)
+        if self._deadlines.pop(key, None) is None:
+            return
+        task = self._expiry_tasks.pop(key, None)
+        if task is not None:
+            task.cancel()
+        await send_typing(group_name, user_id, False)
+
+    async def _expire(self, key: TypingKey) -> None:
+        loop = asyncio.get_running_loop()
+        while (remaining := self._deadlines.get(key, 0) - loop.time()) > 0:
+            await asyncio.sleep(remaining)
+        self._deadlines.pop(key, None)
+        self._expiry_tasks.pop(key, None)
+        await send_typing(*key, False)
+
+
+_tracker: TypingTracker | None = None
+
+
+def get_typing_tracker() -> TypingTracker:
+    global _tracker
+    if _tracker is None:
+        _tracker = TypingTracker(window=settings.CHAT_TYPING_WINDOW)
+    return _tracker
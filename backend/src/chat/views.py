@@ -4,7 +4,9 @@ from rest_framework.views import APIView
 from rest_framework.parsers import MultiPartParser, FormParser
 from django.db.models import Q
 from chat.models import File
-from chat.serializers import DirectMessageSerializer, MessageSerializer
+from chat.serializers import DirectMessageSerializer, MessageSerializer, prefetch_message_relations, annotate_dm_inbox
+from django.db.models import Case, Exists, F, OuterRef, When
+from user.models import UserBlock
 from files.serializers import ChatFileSerializer
 from rest_framework.pagination import PageNumberPagination
 from .models import DirectMessage, BaseMessage, DirectMessageMessage
@@ -74,7 +76,18 @@ class GetDirectMessagesView(BaseAPIView, generics.ListAPIView):
     def get_queryset(self) -> QuerySet[DirectMessage]:
         try:
             
-            dm_objects: QuerySet[DirectMessage] = DirectMessage.objects.exclude_blocked(self.request.user).filter(Q(user1=self.request.user) | Q(user2=self.request.user)).order_by('-last_interaction')
+            user = self.request.user
+            # Anti-join on the other participant instead of exclude_blocked's four joins
+            blocked = UserBlock.objects.filter(
+                Q(user=user, blocked_user=OuterRef('other_user_id')) |
+                Q(user=OuterRef('other_user_id'), blocked_user=user)
+            )
+            dm_objects: QuerySet[DirectMessage] = annotate_dm_inbox(
+                DirectMessage.objects.filter(Q(user1=user) | Q(user2=user))
+                .annotate(other_user_id=Case(When(user1=user, then=F('user2_id')), default=F('user1_id')))
+                .filter(~Exists(blocked)),
+                user,
+            ).order_by('-last_interaction')
             
             return dm_objects
 
@@ -103,17 +116,23 @@ class GetDmMessagesView(BaseAPIView, generics.ListAPIView):
     pagination_class = MessagePagination
     def get_queryset(self) -> QuerySet[DirectMessageMessage]:
         dm_id: int | None = self.kwargs.get('id')
-        return DirectMessageMessage.objects.filter(direct_message=dm_id).order_by('-timestamp')
+        messages: QuerySet[DirectMessageMessage] = prefetch_message_relations(
+            DirectMessageMessage.objects.filter(direct_message=dm_id).order_by('-timestamp')
+        )
+        return messages
     
     def list(self, request: Request, *args: Any, **kwargs: Any):
 
             dm_id: str | None= self.kwargs.get('id')
             dm: DirectMessage = get_object_or_404(DirectMessage, id=dm_id)
+            #Opening the conversation reads it
+            if request.user.id in (dm.user1_id, dm.user2_id):
+                dm.mark_read(cast('User', request.user))
 
             return super().list(request, *args, **kwargs)
         
     def get(self, request: Request, *args, **kwargs):
-        response = super().list(request, *args, *kwargs)
+        response = self.list(request, *args, **kwargs)
         return self.success_response(
             data={
                 "messages": response.data.get('results', response.data),
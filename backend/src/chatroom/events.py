@@ -0,0 +1,30 @@
+import logging
+from typing import Any
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from common.websocket import frame_event
+
+logger = logging.getLogger(__name__)
+
+# Chatroom sockets join two groups: the group of the channel they are open on, which
+# carries that channel's messages, and the room-wide group, which only carries
+# room-level events (channels created/updated/deleted, members joining or leaving).
+
+
+def channel_group_name(channel_id: int | str) -> str:
+    return f'chatroom_channel_{channel_id}'
+
+
+def chatroom_group_name(chatroom_id: int | str) -> str:
+    return f'chatroom_{chatroom_id}'
+
+
+def send_chatroom_event(chatroom_id: int, payload: dict[str, Any]) -> None:
+    try:
+        async_to_sync(get_channel_layer().group_send)(chatroom_group_name(chatroom_id), frame_event(payload))
+    except Exception as e:
+        logger.error(f"Error on send_chatroom_event: {e}")
+
+
+def send_member_event(action_type: str, chatroom_id: int, user_id: int) -> None:
+    send_chatroom_event(chatroom_id, {'action_type': action_type, 'user_id': user_id})
@@ -0,0 +1,124 @@
+from __future__ import annotations
+import logging
+from django.conf import settings
+from redis.exceptions import RedisError
+from chatroom.models import ChatRoom, UserChatRoom
+from channels.db import database_sync_to_async
+from neurocom.redis_client import get_redis, get_async_redis
+
+logger = logging.getLogger(__name__)
+
+# Redis set per chatroom holding the ids of every user allowed to open a socket on it
+# (the members and the admin). Only a positive answer is trusted: a missing id falls
+# back to the database, so a partial or stale set can never lock a member out.
+# Removals run after their commit and bump a version; a rebuild only writes the set if
+# the version is still the one it saw before reading the database, so a rebuild that
+# read the members before a removal committed can not cache the removed user again.
+
+REBUILD_SCRIPT = """
+if (redis.call('GET', KEYS[2]) or '') ~= ARGV[1] then
+    return 0
+end
+redis.call('DEL', KEYS[1])
+redis.call('SADD', KEYS[1], unpack(ARGV, 3))
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+return 1
+"""
+
+
+def membership_key(chatroom_id: int | str) -> str:
+    return f'chatroom_members_{chatroom_id}'
+
+
+def membership_version_key(chatroom_id: int | str) -> str:
+    return f'chatroom_members_version_{chatroom_id}'
+
+
+async def is_chatroom_member(chatroom_id: int | str, user_id: int) -> bool:
+    key = membership_key(chatroom_id)
+    try:
+        pipe = get_async_redis().pipeline(transaction=False)
+        pipe.sismember(key, user_id)
+        pipe.exists(key)
+        is_member, is_cached = await pipe.execute()
+        if is_member:
+            return True
+    except RedisError as e:
+        logger.error(f"Error on is_chatroom_member: {e}")
+        is_cached = True  # Redis is down, skip the rebuild and ask the database
+
+    if not is_cached:
+        return user_id in await database_sync_to_async(rebuild_membership)(chatroom_id)
+
+    return bool(await database_sync_to_async(member_in_database)(chatroom_id, user_id))
+
+
+def member_in_database(chatroom_id: int | str, user_id: int) -> bool:
+    return (
+        UserChatRoom.objects.filter(chatroom_id=chatroom_id, user_id=user_id).exists()
+        or ChatRoom.objects.filter(id=chatroom_id, user_id=user_id).exists()
+    )
+
+
+def rebuild_membership(chatroom_id: int | str) -> set[int]:
+    try:
+        raw_version = get_redis().get(membership_version_key(chatroom_id))
+        version = raw_version.decode() if raw_version is not None else ''
+    except RedisError as e:
+        logger.error(f"Error on rebuild_membership: {e}")
+        version = None
+
+    admin_id = ChatRoom.objects.filter(id=chatroom_id).values_list('user_id', flat=True).first()
+    if admin_id is None:
+        return set()
+
+    member_ids = set(UserChatRoom.objects.filter(chatroom_id=chatroom_id).values_list('user_id', flat=True))
+    member_ids.add(admin_id)
+
+    if version is None:
+        return member_ids
+    try:
+        script = get_redis().register_script(REBUILD_SCRIPT)
+        script(
+            keys=[membership_key(chatroom_id), membership_version_key(chatroom_id)],
+            args=[version, settings.CHATROOM_MEMBERSHIP_CACHE_TTL, *member_ids],
+        )
+    except RedisError as e:
+        logger.error(f"Error on rebuild_membership: {e}")
+    return member_ids
+
+
+def add_to_membership(chatroom_id: int, user_id: int) -> None:
+    key = membership_key(chatroom_id)
+    try:
+        pipe = get_redis().pipeline()
+        pipe.sadd(key, user_id)
+        pipe.expire(key, settings.CHATROOM_MEMBERSHIP_CACHE_TTL)
+        pipe.execute()
+    except RedisError as e:
+        logger.error(f"Error on add_to_membership: {e}")
+
+
+def remove_from_membership(chatroom_id: int, user_id: int) -> None:
+    """Call once the removal is committed, see transaction.on_commit"""
+    try:
+        pipe = get_redis().pipeline()
+        pipe.incr(membership_version_key(chatroom_id))
+        pipe.expire(membership_version_key(chatroom_id), settings.CHATROOM_MEMBERSHIP_CACHE_TTL)
+        pipe.srem(membership_key(chatroom_id), user_id)
+        pipe.execute()
+    except RedisError as e:
+        # A stale positive would let a removed member back in, drop the whole set instead
+        logger.error(f"Error on remove_from_membership: {e}")
+        clear_membership(chatroom_id)
+
+
+def clear_membership(chatroom_id: int) -> None:
+    try:
+        pipe = get_redis().pipeline()
+        pipe.incr(membership_version_key(chatroom_id))
+        pipe.expire(membership_version_key(chatroom_id), settings.CHATROOM_MEMBERSHIP_CACHE_TTL)
+        pipe.delete(membership_key(chatroom_id))
+        pipe.execute()
+    except RedisError as e:
+        logger.error(f"Error on clear_membership: {e}")
@@ -1,5 +1,5 @@
 from __future__ import annotations
-from django.db import models
+from django.db import models, transaction
 from neurocom.settings import AUTH_USER_MODEL
 from neurocom.utils import BlockAwareManager
 from chat.models import File
@@ -41,14 +41,22 @@ class ChatRoom(models.Model):
 
 
     def add_member(self, user) -> None:
+        from chatroom.membership import add_to_membership
+        from chatroom.events import send_member_event
         if self.users.count() >= self.max_members:
             raise ValueError("Max members reached.")
-        elif user not in self.users.all():
+        elif not self.is_member(user):
             self.users.add(user)
+            # users.add() bulk inserts the through rows, so UserChatRoom's post_save never fires
+            transaction.on_commit(lambda: add_to_membership(self.pk, user.pk))
+            transaction.on_commit(lambda: send_member_event('member_joined', self.pk, user.pk))
 
     def remove_member(self, user) -> None:
-        if user in self.users.all():
+        from chatroom.membership import remove_from_membership
+        if self.is_member(user):
             self.users.remove(user)
+            # After the commit, a cache rebuild reading the members before it must see the removal
+            transaction.on_commit(lambda: remove_from_membership(self.pk, user.pk))
 
     def is_member(self,user) -> bool:
         return self.users.filter(pk=user.pk).exists()
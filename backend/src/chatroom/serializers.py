@@ -1,7 +1,10 @@
 from rest_framework import serializers
 from django.contrib.auth.password_validation import validate_password
 from django.core.exceptions import ValidationError
-from user.serializers import UserSerializer
+from user.serializers import user_serializer_related
+from user.card_cache import get_user_cards, UserCardsMixin, UserCardsListSerializer
+from django.contrib.auth import get_user_model
+from django.db.models import Count, OuterRef, Prefetch, Subquery
 from .models import File, Channel, ChatRoom
 from chat.serializers import ChatFileSerializer
 from .models import ChatroomMessage, UserChatRoom
@@ -48,33 +51,89 @@ class UpdateChannelSerializer(serializers.ModelSerializer):
 
 
     
-class MembershipSerializer(serializers.ModelSerializer):
+def annotate_chatroom_activity(queryset):
+    """Member count and time of the latest message in any of the room's channels"""
+    last_message = ChatroomMessage.objects.filter(channel__chatroom=OuterRef('pk')).order_by('-timestamp')
+    return queryset.annotate(
+        member_count=Count('users'),
+        last_activity=Subquery(last_message.values('timestamp')[:1]),
+    )
+
+
+def prefetch_memberships(queryset):
+    """Load what MembershipSerializer and sideload_memberships read, in a fixed number of queries"""
+    # ChatroomSerializer renders users as ids, so the member rows need nothing else
+    members = Prefetch('users', queryset=get_user_model().objects.only('id'))
+    chatrooms = annotate_chatroom_activity(ChatRoom.objects.all()).prefetch_related(members)
+    return queryset.select_related(*user_serializer_related('user')).prefetch_related(
+        Prefetch('chatroom', queryset=chatrooms)
+    )
+
+
+class ChatroomActivitySerializer(ChatroomSerializer):
+    """ChatroomSerializer plus the annotate_chatroom_activity fields"""
+    member_count = serializers.IntegerField(read_only=True)
+    last_activity = serializers.DateTimeField(read_only=True)
+
+
+class FlatMembershipSerializer(serializers.ModelSerializer):
+    """Membership row with chatroom and user as ids, for side-loaded listings"""
+    class Meta:
+        model = UserChatRoom
+        fields = ['id', 'user', 'chatroom', 'joined_at']
+
+
+def sideload_memberships(memberships) -> dict:
+    """Flat membership rows plus each chatroom and user they point to, serialized once"""
+    chatrooms = {membership.chatroom_id: membership.chatroom for membership in memberships}
+    users = {membership.user_id: membership.user for membership in memberships}
+    return {
+        'memberships': FlatMembershipSerializer(memberships, many=True).data,
+        'included': {
+            'chatrooms': ChatroomActivitySerializer(chatrooms.values(), many=True).data,
+            'users': list(get_user_cards(users.values()).values()),
+        },
+    }
+
+
+class MembershipSerializer(UserCardsMixin, serializers.ModelSerializer):
     chatroom = serializers.SerializerMethodField()
     user = serializers.SerializerMethodField()
     class Meta:
         model = UserChatRoom
         fields = '__all__'
+        list_serializer_class = UserCardsListSerializer
+
+    def card_users(self, obj):
+        return [obj.user]
 
     def get_chatroom(self,obj):
+        #Member count and last activity are only there when the chatroom came from prefetch_memberships
+        if hasattr(obj.chatroom, 'member_count'):
+            return ChatroomActivitySerializer(obj.chatroom).data
         serialized_chatroom = ChatroomSerializer(obj.chatroom).data
         return serialized_chatroom
     
     def get_user(self,obj):
-        serialized_user =UserSerializer(obj.user).data
+        serialized_user = self.card(obj.user)
         return serialized_user
 
-class ChatroomMessageSerializer(serializers.ModelSerializer):
+class ChatroomMessageSerializer(UserCardsMixin, serializers.ModelSerializer):
     sender = serializers.SerializerMethodField()
     file = serializers.SerializerMethodField()
     class Meta:
         model = ChatroomMessage
         fields = '__all__'
+        list_serializer_class = UserCardsListSerializer
+
+    def card_users(self, obj):
+        return [obj.sender]
 
     def get_sender(self,obj):
-        return UserSerializer(obj.sender).data
+        return self.card(obj.sender)
     def get_file(self, obj):
-        # Get the first file if it exists
-        file = obj.file.first()
+        # Get the first file if it exists, through .all() so a prefetch_related('file') is reused
+        file = min(obj.file.all(), key=lambda chat_file: chat_file.id, default=None)
         if file:
             return ChatFileSerializer(file).data  # Serialize the file
         return None
@@ -1,6 +1,10 @@
 from django.db.models.signals import post_save,post_delete
 from django.dispatch import receiver
-from chatroom.models import ChatRoom,Channel
+from django.db import transaction
+from chatroom.models import ChatRoom,Channel,UserChatRoom
+from chatroom.membership import add_to_membership, remove_from_membership, clear_membership
+from chatroom.events import send_chatroom_event, send_member_event
+from chatroom.serializers import ChannelSerializer
 from notifications.models import Invitation
 from typing import Any
 
@@ -9,4 +13,40 @@ from typing import Any
 def create_main_channel(sender: type[ChatRoom], instance: ChatRoom,created: bool, **kwargs: Any):
      if created:
           main_channel = Channel.objects.create(chatroom=instance,name="Main")
-          main_channel.save()
\ No newline at end of file
+          main_channel.save()
+
+
+#Keep the redis membership index used by the chatroom socket in sync
+@receiver(post_save, sender=UserChatRoom)
+def add_membership(sender: type[UserChatRoom], instance: UserChatRoom, created: bool, **kwargs: Any):
+     if created:
+          transaction.on_commit(lambda: add_to_membership(instance.chatroom_id, instance.user_id))
+          transaction.on_commit(lambda: send_member_event('member_joined', instance.chatroom_id, instance.user_id))
+
+@receiver(post_delete, sender=UserChatRoom)
+def remove_membership(sender: type[UserChatRoom], instance: UserChatRoom, **kwargs: Any):
+     transaction.on_commit(lambda: remove_from_membership(instance.chatroom_id, instance.user_id))
+     transaction.on_commit(lambda: send_member_event('member_left', instance.chatroom_id, instance.user_id))
+
+@receiver(post_delete, sender=ChatRoom)
+def clear_chatroom_membership(sender: type[ChatRoom], instance: ChatRoom, **kwargs: Any):
+     chatroom_id = instance.id
+     transaction.on_commit(lambda: clear_membership(chatroom_id))
+
+
+#Room-level events for the sockets open on any channel of the chatroom
+@receiver(post_save, sender=Channel)
+def broadcast_channel_saved(sender: type[Channel], instance: Channel, created: bool, **kwargs: Any):
+     channel_data = ChannelSerializer(instance).data
+     transaction.on_commit(lambda: send_chatroom_event(instance.chatroom_id, {
+          'action_type': 'channel_created' if created else 'channel_updated',
+          'channel': channel_data
+     }))
+
+@receiver(post_delete, sender=Channel)
+def broadcast_channel_deleted(sender: type[Channel], instance: Channel, **kwargs: Any):
+     channel_id = instance.id
+     transaction.on_commit(lambda: send_chatroom_event(instance.chatroom_id, {
+          'action_type': 'channel_deleted',
+          'channel_id': channel_id
+     }))
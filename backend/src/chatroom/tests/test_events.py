@@ -0,0 +1,45 @@
+from django.test import TestCase
+from django.contrib.auth import get_user_model
+from chatroom.models import ChatRoom, Channel
+from chatroom.events import chatroom_group_name
+from common.websocket import frame_event
+from unittest.mock import patch, AsyncMock
+
+user_model = get_user_model()
+
+
+@patch('chatroom.membership.get_redis')
+@patch('chatroom.events.get_channel_layer')
+class TestChatroomEvents(TestCase):
+
+    def setUp(self):
+        self.admin = user_model.objects.create(username='admin', email='admin@email.com', password='password123')
+        self.member = user_model.objects.create(username='member', email='member@email.com', password='password123')
+        self.chatroom = ChatRoom.objects.create(user=self.admin, name='testchatroom')
+
+    def assertRoomEvent(self, mock_layer, payload):
+        mock_layer.return_value.group_send.assert_called_with(chatroom_group_name(self.chatroom.id), frame_event(payload))
+
+    def test_channel_changes_go_to_the_room_group(self, mock_layer, mock_redis):
+        mock_layer.return_value.group_send = AsyncMock()
+        with self.captureOnCommitCallbacks(execute=True):
+            channel = Channel.objects.create(chatroom=self.chatroom, name='second')
+        self.assertRoomEvent(mock_layer, {
+            'action_type': 'channel_created',
+            'channel': {'name': 'second', 'chatroom': self.chatroom.id, 'is_public': True, 'id': channel.id}
+        })
+
+        channel_id = channel.id
+        with self.captureOnCommitCallbacks(execute=True):
+            channel.delete()
+        self.assertRoomEvent(mock_layer, {'action_type': 'channel_deleted', 'channel_id': channel_id})
+
+    def test_membership_changes_go_to_the_room_group(self, mock_layer, mock_redis):
+        mock_layer.return_value.group_send = AsyncMock()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.chatroom.add_member(self.member)
+        self.assertRoomEvent(mock_layer, {'action_type': 'member_joined', 'user_id': self.member.id})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.chatroom.remove_member(self.member)
+        self.assertRoomEvent(mock_layer, {'action_type': 'member_left', 'user_id': self.member.id})
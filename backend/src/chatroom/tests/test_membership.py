@@ -0,0 +1,69 @@
+from django.test import TestCase
+from django.contrib.auth import get_user_model
+from chatroom.models import ChatRoom
+from chatroom.membership import is_chatroom_member as async_is_chatroom_member, membership_key, membership_version_key
+from django.conf import settings
+from asgiref.sync import async_to_sync
+from unittest.mock import patch, AsyncMock
+
+user_model = get_user_model()
+is_chatroom_member = async_to_sync(async_is_chatroom_member)
+
+
+def cached_answer(mock_async_redis, is_member, is_cached):
+    mock_async_redis.return_value.pipeline.return_value.execute = AsyncMock(return_value=[is_member, is_cached])
+
+
+@patch('chatroom.membership.get_async_redis')
+@patch('chatroom.membership.get_redis')
+class TestMembershipIndex(TestCase):
+
+    def setUp(self):
+        self.admin = user_model.objects.create(username='admin', email='admin@email.com', password='password123')
+        self.member = user_model.objects.create(username='member', email='member@email.com', password='password123')
+        self.outsider = user_model.objects.create(username='outsider', email='outsider@email.com', password='password123')
+        with patch('chatroom.membership.get_redis'):
+            self.chatroom = ChatRoom.objects.create(user=self.admin, name='testchatroom')
+            self.chatroom.add_member(self.member)
+
+    def test_cache_hit_skips_database(self, mock_redis, mock_async_redis):
+        cached_answer(mock_async_redis, True, True)
+
+        with self.assertNumQueries(0):
+            self.assertTrue(is_chatroom_member(self.chatroom.id, self.member.id))
+
+    def test_cache_miss_rebuilds_index(self, mock_redis, mock_async_redis):
+        cached_answer(mock_async_redis, False, False)
+        mock_redis.return_value.get.return_value = b'3'
+        script = mock_redis.return_value.register_script.return_value
+
+        self.assertTrue(is_chatroom_member(self.chatroom.id, self.member.id))
+        self.assertTrue(is_chatroom_member(self.chatroom.id, self.admin.id))
+        self.assertFalse(is_chatroom_member(self.chatroom.id, self.outsider.id))
+        # Only written if no removal bumped the version read before the members were
+        script.assert_called_with(
+            keys=[membership_key(self.chatroom.id), membership_version_key(self.chatroom.id)],
+            args=['3', settings.CHATROOM_MEMBERSHIP_CACHE_TTL, *{self.admin.id, self.member.id}],
+        )
+
+    def test_negative_answer_is_checked_against_database(self, mock_redis, mock_async_redis):
+        # The set exists but is missing the member (e.g. a partial set), the database decides
+        cached_answer(mock_async_redis, False, True)
+
+        self.assertTrue(is_chatroom_member(self.chatroom.id, self.member.id))
+        self.assertFalse(is_chatroom_member(self.chatroom.id, self.outsider.id))
+
+    def test_add_and_remove_member_update_index(self, mock_redis, mock_async_redis):
+        redis_client = mock_redis.return_value
+        with self.captureOnCommitCallbacks(execute=True):
+            self.chatroom.add_member(self.outsider)
+        redis_client.pipeline.return_value.sadd.assert_called_with(membership_key(self.chatroom.id), self.outsider.id)
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.chatroom.remove_member(self.outsider)
+        # Nothing changes in redis before the removal is committed
+        redis_client.pipeline.return_value.srem.assert_not_called()
+        for callback in callbacks:
+            callback()
+        redis_client.pipeline.return_value.incr.assert_called_with(membership_version_key(self.chatroom.id))
+        redis_client.pipeline.return_value.srem.assert_called_with(membership_key(self.chatroom.id), self.outsider.id)
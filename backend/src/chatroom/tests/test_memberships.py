@@ -0,0 +1,93 @@
+from django.urls import reverse
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APITestCase
+from rest_framework.authtoken.models import Token
+from chatroom.models import ChatRoom, UserChatRoom
+from unittest.mock import patch
+
+User = get_user_model()
+
+
+@patch('user_activity.audience.get_redis')
+@patch('chatroom.events.get_channel_layer')
+class MembershipListingTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create(email='user1@test.com', username='user1', password='password123')
+        self.token, _ = Token.objects.get_or_create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def create_users(self, count):
+        users = []
+        for _ in range(count):
+            i = User.objects.count() + 1
+            users.append(User.objects.create(email=f'user{i}@test.com', username=f'user{i}', password='password123'))
+        return users
+
+    def join_chatrooms(self, count):
+        # bulk_create skips the post_save that gives every room a channel named Main (channel names are unique)
+        offset = ChatRoom.objects.count()
+        admin = self.create_users(1)[0]
+        chatrooms = ChatRoom.objects.bulk_create([ChatRoom(name=f'room{offset + i}', user=admin) for i in range(count)])
+        UserChatRoom.objects.bulk_create(
+            [UserChatRoom(user=self.user, chatroom=chatroom) for chatroom in chatrooms] +
+            [UserChatRoom(user=admin, chatroom=chatroom) for chatroom in chatrooms]
+        )
+
+    def get(self, url, **params):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, {'page_size': 50, **params})
+        return response.data['data'], len(queries)
+
+    def test_joined_chatrooms_query_count_does_not_grow(self, mock_layer, mock_redis):
+        url = reverse('get_joined_chatrooms')
+        for params in ({}, {'sideload': 'true'}):
+            with self.subTest(**params):
+                UserChatRoom.objects.all().delete()
+                self.join_chatrooms(2)
+                data, few_rooms_queries = self.get(url, **params)
+                self.assertEqual(len(data['chatrooms']), 2)
+
+                self.join_chatrooms(10)
+                data, many_rooms_queries = self.get(url, **params)
+                self.assertEqual(len(data['chatrooms']), 12)
+                self.assertEqual(many_rooms_queries, few_rooms_queries)
+
+    def test_member_ids_are_loaded_without_user_rows(self, mock_layer, mock_redis):
+        self.join_chatrooms(2)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('get_joined_chatrooms'), {'page_size': 50})
+
+        self.assertEqual(len(response.data['data']['chatrooms']), 2)
+        member_queries = [query['sql'] for query in queries if '_prefetch_related_val_chatroom_id' in query['sql']]
+        self.assertEqual(len(member_queries), 1)
+        self.assertNotIn('password', member_queries[0])
+
+    def test_members_query_count_does_not_grow(self, mock_layer, mock_redis):
+        chatroom = ChatRoom.objects.create(name='room', user=self.user)
+        url = reverse('get_members', args=[chatroom.id])
+        for params in ({}, {'sideload': 'true'}):
+            with self.subTest(**params):
+                UserChatRoom.objects.all().delete()
+                for member in self.create_users(2):
+                    chatroom.add_member(member)
+                data, few_members_queries = self.get(url, **params)
+                self.assertEqual(len(data['members']), 2)
+
+                for member in self.create_users(10):
+                    chatroom.add_member(member)
+                data, many_members_queries = self.get(url, **params)
+                self.assertEqual(len(data['members']), 12)
+                self.assertEqual(many_members_queries, few_members_queries)
+
+    def test_sideloaded_rows_reference_included_objects_once(self, mock_layer, mock_redis):
+        self.join_chatrooms(3)
+
+        data, _ = self.get(reverse('get_joined_chatrooms'), sideload='true')
+
+        self.assertEqual(data['chatrooms'][0].keys(), {'id', 'user', 'chatroom', 'joined_at'})
+        self.assertEqual([user['id'] for user in data['included']['users']], [self.user.id])
+        self.assertEqual(len(data['included']['chatrooms']), 3)
+        self.assertEqual({chatroom['member_count'] for chatroom in data['included']['chatrooms']}, {2})
@@ -0,0 +1,50 @@
+from django.urls import reverse
+from django.contrib.auth import get_user_model
+from django.contrib.contenttypes.models import ContentType
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APITestCase
+from rest_framework.authtoken.models import Token
+from chatroom.models import ChatRoom, ChatroomMessage
+from files.models import ChatFile
+from unittest.mock import patch
+
+User = get_user_model()
+
+
+@patch('user_activity.audience.get_redis')
+@patch('chatroom.events.get_channel_layer')
+class ChannelMessagesQueryBudgetTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create(email='user1@test.com', username='user1', password='password123')
+        self.member = User.objects.create(email='user2@test.com', username='user2', password='password123')
+        self.chatroom = ChatRoom.objects.create(user=self.user, name='budgetroom')
+        self.channel = self.chatroom.channels.get()
+        self.content_type = ContentType.objects.get_for_model(ChatroomMessage)
+        self.token, _ = Token.objects.get_or_create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def create_messages(self, count):
+        for i in range(count):
+            sender = self.user if i % 2 else self.member
+            message = ChatroomMessage.objects.create(channel=self.channel, sender=sender, content=f'Message {i}')
+            ChatFile.objects.create(
+                user=sender, original_name='a.txt', file_path='a.txt', file_size=1, mime_type='text/plain',
+                file_type='document', message_content_type=self.content_type, message_object_id=message.id,
+            )
+
+    def get_page(self, page_size):
+        url = reverse('get_channel_messages', args=[self.channel.id])
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, {'page_size': page_size})
+        messages = response.data['data']['messages']
+        self.assertEqual(len(messages), page_size)
+        self.assertIsNotNone(messages[0]['file'])
+        return len(queries)
+
+    def test_query_count_does_not_grow_with_page_size(self, mock_layer, mock_redis):
+        self.create_messages(5)
+        small_page_queries = self.get_page(5)
+
+        self.create_messages(45)
+        self.assertEqual(self.get_page(50), small_page_queries)
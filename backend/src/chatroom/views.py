@@ -15,9 +15,10 @@ from user.serializers import UserSerializer
 from django.contrib.auth import get_user_model
 from django.shortcuts import get_object_or_404
 from chatroom.models import ChatRoom, Channel, UserChatRoom
-from chatroom.serializers import MembershipSerializer
+from chatroom.serializers import MembershipSerializer, prefetch_memberships, sideload_memberships
 from rest_framework.request import Request
 from chatroom.serializers import ChatroomMessageSerializer
+from chat.serializers import prefetch_message_relations
 from django.db.models import QuerySet
 from .models import ChatroomMessage
 from neurocom.errors.exceptions import PermissionError
@@ -307,7 +308,38 @@ class DeleteChannelView(BaseModelAPIView, generics.DestroyAPIView):
     
 
 
-class GetMembersView(BaseAPIView, generics.ListAPIView,):
+class SideloadedMembershipsMixin(generics.ListAPIView):
+    """
+    Membership listings nest the full chatroom and user in every row by default.
+    With ?sideload=true the rows only hold ids, and each chatroom and user is sent
+    once under "included".
+    """
+    def wants_sideload(self) -> bool:
+        return self.request.query_params.get('sideload', '').lower() in ('1', 'true')
+
+    def list(self, request: Request, *args, **kwargs):
+        if not self.wants_sideload():
+            return super().list(request, *args, **kwargs)
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        if page is None:
+            return Response(sideload_memberships(list(queryset)))
+        return self.get_paginated_response(sideload_memberships(page))
+
+    def membership_list_data(self, response: Response, key: str) -> dict[str, Any]:
+        results = response.data.get('results', response.data)
+        data: dict[str, Any] = {key: results}
+        if self.wants_sideload():
+            data = {key: results['memberships'], 'included': results['included']}
+        data['pagination'] = {
+            "count": response.data.get('count'),
+            "next": response.data.get('next'),
+            "previous": response.data.get('previous'),
+        } if hasattr(response.data, 'get') and 'count' in response.data else None
+        return data
+
+
+class GetMembersView(SideloadedMembershipsMixin, BaseAPIView, generics.ListAPIView,):
     permission_classes = [IsAuthenticated]
     serializer_class = MembershipSerializer
     pagination_class = UsersPagination
@@ -321,21 +353,16 @@ class GetMembersView(BaseAPIView, generics.ListAPIView,):
         if user != chatroom.user:
             raise PermissionError("You don't have permission to access this chatroom")
 
-        memberships: QuerySet[UserChatRoom] = UserChatRoom.objects.filter(chatroom=chatroom)
+        memberships: QuerySet[UserChatRoom] = prefetch_memberships(
+            UserChatRoom.objects.filter(chatroom=chatroom).order_by('joined_at', 'id')
+        )
 
         return memberships
     
     def get(self, request: Request, *args, **kwargs):
-        response = super().list(request, *args, **kwargs)
+        response = self.list(request, *args, **kwargs)
         return self.success_response(
-            data={
-                "members": response.data.get('results', response.data),
-                "pagination": {
-                    "count": response.data.get('count'),
-                    "next": response.data.get('next'),
-                    "previous": response.data.get('previous'),
-                } if hasattr(response.data, 'get') and 'count' in response.data else None
-            },
+            data=self.membership_list_data(response, "members"),
             message="Members retrieved successfully"
         )
 
@@ -422,7 +449,7 @@ class GetChannelMessagesView(BaseAPIView, generics.ListAPIView):
         channel: Channel =  get_object_or_404(Channel, id=channel_id)
         chatroom: ChatRoom = cast(ChatRoom, channel.chatroom)
         if chatroom.is_member(user) or chatroom.user == user:
-            messages: QuerySet[ChatroomMessage] = channel.messages.all().order_by('-timestamp')
+            messages: QuerySet[ChatroomMessage] = prefetch_message_relations(channel.messages.all().order_by('-timestamp'))
             return messages
         
         raise PermissionError('You are not a member of this chatroom')
@@ -441,7 +468,7 @@ class GetChannelMessagesView(BaseAPIView, generics.ListAPIView):
             message="Messages retrieved successfully"
         )
     
-class GetJoinedChatroomsView(BaseAPIView, generics.ListAPIView):
+class GetJoinedChatroomsView(SideloadedMembershipsMixin, BaseAPIView, generics.ListAPIView):
     permission_classes = [IsAuthenticated]
     serializer_class = MembershipSerializer
     pagination_class = ChatroomsPagination
@@ -450,18 +477,12 @@ class GetJoinedChatroomsView(BaseAPIView, generics.ListAPIView):
         user = self.get_authenticated_user(self.request)
         if (isinstance(user, Response)):
             raise PermissionError("Unauthenticated")
-        return user.memberships.all()
+        memberships: QuerySet[UserChatRoom] = prefetch_memberships(user.memberships.order_by('-joined_at', '-id'))
+        return memberships
     
     def get(self, request: Request, *args, **kwargs):
-        response = super().list(request, *args, **kwargs)
+        response = self.list(request, *args, **kwargs)
         return self.success_response(
-            data={
-                "chatrooms": response.data.get('results', response.data),
-                "pagination": {
-                    "count": response.data.get('count'),
-                    "next": response.data.get('next'),
-                    "previous": response.data.get('previous'),
-                } if hasattr(response.data, 'get') and 'count' in response.data else None
-            },
+            data=self.membership_list_data(response, "chatrooms"),
             message="Chatrooms retrieved successfully"
         )
\ No newline at end of file
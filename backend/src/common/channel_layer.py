@@ -0,0 +1,42 @@
+import logging
+from collections import Counter
+from typing import cast
+from channels.exceptions import ChannelFull
+from channels_redis.core import RedisChannelLayer
+
+logger = logging.getLogger(__name__)
+
+# Per-process counters of channel layer overflow: channel_full (a send rejected because
+# the channel is at capacity) and group_dropped (group messages channels_redis skipped for
+# channels over capacity). Consumers add gap_replayed and resync_required when they notice
+# the group messages they lost.
+channel_layer_counters: Counter = Counter()
+
+# channels_redis reports the group messages it drops only through this log record
+GROUP_OVERFLOW_LOG_MESSAGE = "%s of %s channels over capacity in group %s"
+
+
+class CountingRedisChannelLayer(RedisChannelLayer):
+    """
+    RedisChannelLayer that counts the sends it rejects. Under Daphne send() never waits
+    for the client, so a socket that falls behind backs up its layer channel, which holds
+    at most CHANNEL_LAYERS capacity / channel_capacity messages.
+    """
+
+    async def send(self, channel, message):
+        try:
+            await super().send(channel, message)
+        except ChannelFull:
+            channel_layer_counters['channel_full'] += 1
+            logger.warning(f"Channel {channel} is full, counters: {dict(channel_layer_counters)}")
+            raise
+
+
+class GroupOverflowFilter(logging.Filter):
+    """Counts the group messages channels_redis dropped, attached to the channels_redis.core logger"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.msg == GROUP_OVERFLOW_LOG_MESSAGE and isinstance(record.args, tuple):
+            channels_over_capacity = cast(int, record.args[0])
+            channel_layer_counters['group_dropped'] += channels_over_capacity
+        return True
@@ -0,0 +1,80 @@
+import json
+from functools import lru_cache
+from typing import Any
+from urllib.parse import parse_qs
+import msgpack
+from channels.generic.websocket import AsyncWebsocketConsumer
+
+# Clients pick the frame encoding when they connect, either by offering the "msgpack"
+# subprotocol or with ?format=msgpack. JSON text frames stay the default.
+MSGPACK_SUBPROTOCOL = 'msgpack'
+
+
+def frame_event(payload: dict[str, Any]) -> dict[str, Any]:
+    """
+    Build a channel layer event carrying an already encoded websocket frame.
+    The payload is JSON encoded once by the sender; every consumer in the group
+    forwards the frame as is from its forward_frame handler, msgpack clients get it
+    through msgpack_frame so rooms without one never pay for a second encoding.
+    """
+    return {
+        'type': 'forward_frame',
+        'text': json.dumps(payload),
+    }
+
+
+@lru_cache(maxsize=256)
+def msgpack_frame(text: str) -> bytes:
+    # Every msgpack consumer of the process gets the same group event, so it is transcoded once
+    frame: bytes = msgpack.packb(json.loads(text))
+    return frame
+
+
+class FrameProtocolConsumer(AsyncWebsocketConsumer):
+    """
+    Websocket consumer that talks JSON text frames or msgpack binary frames.
+    Group events arrive already encoded and are written as they are. Daphne never makes
+    send() wait for the client, so a socket that falls behind backs up its channel layer
+    channel instead, where channels_redis drops group messages past the channel capacity
+    (counted in common.channel_layer).
+    """
+
+    use_msgpack = False
+
+    async def websocket_connect(self, message):
+        self.use_msgpack = self.wants_msgpack()
+        await super().websocket_connect(message)
+
+    def wants_msgpack(self) -> bool:
+        if MSGPACK_SUBPROTOCOL in self.scope.get('subprotocols', []):
+            return True
+        query_string: bytes = self.scope.get('query_string', b'')
+        query_params = parse_qs(query_string.decode())
+        return query_params.get('format', [''])[0] == 'msgpack'
+
+    async def accept(self, subprotocol=None):
+        # A subprotocol offered by the client has to be echoed back or browsers drop the socket
+        if subprotocol is None and MSGPACK_SUBPROTOCOL in self.scope.get('subprotocols', []):
+            subprotocol = MSGPACK_SUBPROTOCOL
+        await super().accept(subprotocol)
+
+    def decode_frame(self, text_data=None, bytes_data=None) -> Any:
+        # Raises ValueError on malformed frames
+        if bytes_data is not None:
+            return msgpack.unpackb(bytes_data, raw=False)
+        return json.loads(text_data)
+
+    async def send_payload(self, payload: dict[str, Any]) -> None:
+        if self.use_msgpack:
+            await self.send(bytes_data=msgpack.packb(payload))
+        else:
+            await self.send(text_data=json.dumps(payload))
+
+    async def forward_frame(self, event):
+        await self.send_frame(msgpack_frame(event['text']) if self.use_msgpack else event['text'])
+
+    async def send_frame(self, frame: str | bytes) -> None:
+        if isinstance(frame, bytes):
+            await self.send(bytes_data=frame)
+        else:
+            await self.send(text_data=frame)
@@ -13,11 +13,7 @@ import os
 from django.core.asgi import get_asgi_application
 from channels.routing import ProtocolTypeRouter, URLRouter
 from channels.security.websocket import AllowedHostsOriginValidator
-from channels.auth import AuthMiddlewareStack
 from urllib.parse import parse_qs
-from django.contrib.auth.models import AnonymousUser
-from rest_framework.authtoken.models import Token
-from asgiref.sync import sync_to_async
 
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'neurocom.settings')
@@ -28,15 +24,8 @@ django_asgi_app = get_asgi_application()
 from chat.routing import chat_websocket_urlpatterns
 from notifications.routing import notifications_websocket_urlpatterns
 from user_activity.routing import user_activity_websocket_urlpatterns
-
-
-@sync_to_async
-def get_user_from_token(token_key):
-    try:
-        token = Token.objects.get(key=token_key)
-        return token.user
-    except Token.DoesNotExist:
-        return AnonymousUser()
+from user.token_cache import get_user_for_token
+from django.contrib.auth.models import AnonymousUser
 
 
 class TokenAuthMiddleware:
@@ -50,7 +39,7 @@ class TokenAuthMiddleware:
 
         if token_key:
             token_key = token_key[0]
-            scope['user'] = await get_user_from_token(token_key)
+            scope['user'] = await get_user_for_token(token_key) #Cached, no database query on the common path
         else:
             scope['user'] = AnonymousUser()
 
@@ -62,9 +51,9 @@ class TokenAuthMiddleware:
 application = ProtocolTypeRouter(
     {
         "http": django_asgi_app,
+        #Sockets authenticate with ?token= only, so there is no session/cookie middleware in front
         "websocket":AllowedHostsOriginValidator(
-            AuthMiddlewareStack(
-                TokenAuthMiddleware(URLRouter(chat_websocket_urlpatterns + notifications_websocket_urlpatterns + user_activity_websocket_urlpatterns )))
+            TokenAuthMiddleware(URLRouter(chat_websocket_urlpatterns + notifications_websocket_urlpatterns + user_activity_websocket_urlpatterns ))
         )
         # Just HTTP for now. (We can add other protocols later.)
     }
@@ -50,4 +50,17 @@ class ErrorLoggingMiddleware(MiddlewareMixin):
             ip = x_forwarded_for.split(',')[0]
         else:
             ip = request.META.get('REMOTE_ADDR')
-        return ip
\ No newline at end of file
+        return ip
+
+
+class ActivityTrackingMiddleware(MiddlewareMixin):
+    """Record the last activity of authenticated users, flushed to the user table in bulk"""
+
+    def process_response(self, request: HttpRequest, response: HttpResponse) -> HttpResponse:
+        # DRF sets request.user on the underlying request once the view authenticated it
+        user = getattr(request, 'user', None)
+        # pk is None once the request deleted its own account
+        if user is not None and user.is_authenticated and user.pk is not None:
+            from user_activity.activity import record_activity
+            record_activity(user.id)
+        return response
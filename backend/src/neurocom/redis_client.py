@@ -0,0 +1,41 @@
+import asyncio
+import weakref
+import redis
+import redis.asyncio
+from django.conf import settings
+
+# Shared redis clients for everything outside of the channel layer and the django cache.
+# Sync code (views, signals, management commands) uses get_redis(), consumers use
+# get_async_redis() so redis calls never occupy a worker thread.
+
+_pool: redis.ConnectionPool | None = None
+
+# asyncio connections belong to the loop that opened them, so there is one pool per loop
+_async_pools: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, redis.asyncio.ConnectionPool]" = weakref.WeakKeyDictionary()
+
+
+def _pool_kwargs() -> dict:
+    return {
+        'host': settings.REDIS_HOST,
+        'port': settings.REDIS_PORT,
+        'db': 0,
+        'max_connections': settings.REDIS_POOL_MAX_CONNECTIONS,
+        'socket_timeout': settings.REDIS_SOCKET_TIMEOUT,
+        'socket_connect_timeout': settings.REDIS_SOCKET_CONNECT_TIMEOUT,
+    }
+
+
+def get_redis() -> redis.StrictRedis:
+    global _pool
+    if _pool is None:
+        _pool = redis.ConnectionPool(**_pool_kwargs())
+    return redis.StrictRedis(connection_pool=_pool)
+
+
+def get_async_redis() -> redis.asyncio.Redis:
+    loop = asyncio.get_running_loop()
+    pool = _async_pools.get(loop)
+    if pool is None:
+        pool = redis.asyncio.ConnectionPool(**_pool_kwargs())
+        _async_pools[loop] = pool
+    return redis.asyncio.Redis(connection_pool=pool)
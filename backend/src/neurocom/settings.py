@@ -66,7 +66,8 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    'neurocom.middlewares.ErrorLoggingMiddleware'
+    'neurocom.middlewares.ErrorLoggingMiddleware',
+    'neurocom.middlewares.ActivityTrackingMiddleware'
 ]
 
 FILE_UPLOAD_PERMISSIONS = 0o664
@@ -104,16 +105,38 @@ ASGI_APPLICATION = 'neurocom.asgi.application'
 # Channel Layers Configuration
 CHANNEL_LAYERS = {
     'default': {
-        'BACKEND': 'channels_redis.core.RedisChannelLayer',
+        # channels_redis layer that counts overflow (common.channel_layer.channel_layer_counters)
+        'BACKEND': 'common.channel_layer.CountingRedisChannelLayer',
         'CONFIG': {
             "hosts": [(
                 config('REDIS_HOST', default='127.0.0.1'),
                 config('REDIS_PORT', default=6379, cast=int)
             )],
+            # Messages buffered per channel before sends are rejected (ChannelFull) or dropped
+            # from group sends, and how long undelivered ones are kept. Websocket consumers
+            # listen on specific.* channels, which is where a socket that falls behind backs up
+            "capacity": config('CHANNEL_LAYER_CAPACITY', default=100, cast=int),
+            "channel_capacity": {
+                "specific.*": config('CHANNEL_LAYER_WEBSOCKET_CAPACITY', default=100, cast=int),
+            },
+            "expiry": config('CHANNEL_LAYER_EXPIRY', default=60, cast=int),  # seconds
+            "group_expiry": config('CHANNEL_LAYER_GROUP_EXPIRY', default=86400, cast=int),  # seconds
         },
     },
 }
 
+# Token -> user cache used by the websocket handshake (redis, plus a per-process LRU).
+# Logging out or deactivating a user clears redis at once, but other processes keep
+# accepting the token from their LRU for up to WS_AUTH_LOCAL_TTL seconds
+WS_AUTH_CACHE_TTL = config('WS_AUTH_CACHE_TTL', default=3600, cast=int)  # seconds
+WS_AUTH_LOCAL_TTL = config('WS_AUTH_LOCAL_TTL', default=30, cast=int)  # seconds
+WS_AUTH_LOCAL_CACHE_SIZE = config('WS_AUTH_LOCAL_CACHE_SIZE', default=1024, cast=int)
+
+# Rendered user cards embedded by serializers (redis, plus a per-process LRU)
+USER_CARD_CACHE_TTL = config('USER_CARD_CACHE_TTL', default=3600, cast=int)  # seconds
+USER_CARD_LOCAL_TTL = config('USER_CARD_LOCAL_TTL', default=10, cast=int)  # seconds
+USER_CARD_LOCAL_CACHE_SIZE = config('USER_CARD_LOCAL_CACHE_SIZE', default=2048, cast=int)
+
 # ==============================================
 # DATABASE CONFIGURATION
 # ==============================================
@@ -230,6 +253,11 @@ REST_FRAMEWORK = {
 REDIS_HOST = config('REDIS_HOST', default='127.0.0.1')
 REDIS_PORT = config('REDIS_PORT', default=6379, cast=int)
 
+# Connection pools shared by the consumers and signal handlers (see neurocom.redis_client)
+REDIS_POOL_MAX_CONNECTIONS = config('REDIS_POOL_MAX_CONNECTIONS', default=50, cast=int)
+REDIS_SOCKET_TIMEOUT = config('REDIS_SOCKET_TIMEOUT', default=5, cast=float)  # seconds
+REDIS_SOCKET_CONNECT_TIMEOUT = config('REDIS_SOCKET_CONNECT_TIMEOUT', default=2, cast=float)  # seconds
+
 CACHES = {
     "default": {
         "BACKEND": "django_redis.cache.RedisCache",
@@ -242,6 +270,67 @@ CACHES = {
     }
 }
 
+# Redis set of member ids per chatroom, checked on every chatroom socket connect
+CHATROOM_MEMBERSHIP_CACHE_TTL = config('CHATROOM_MEMBERSHIP_CACHE_TTL', default=3600, cast=int)  # seconds
+
+# Redis set per user of who receives their presence (friends and direct message partners)
+PRESENCE_AUDIENCE_CACHE_TTL = config('PRESENCE_AUDIENCE_CACHE_TTL', default=3600, cast=int)  # seconds
+
+# Presence connections heartbeat every interval and are swept once they miss them for the TTL
+PRESENCE_HEARTBEAT_INTERVAL = config('PRESENCE_HEARTBEAT_INTERVAL', default=30, cast=int)  # seconds
+PRESENCE_CONNECTION_TTL = config('PRESENCE_CONNECTION_TTL', default=90, cast=int)  # seconds
+
+# Last activity is buffered in redis (at most one write per user per interval and process)
+# and flushed to User.last_active / is_online by the presence sweeper or flush_user_activity
+ACTIVITY_RECORD_INTERVAL = config('ACTIVITY_RECORD_INTERVAL', default=30, cast=int)  # seconds
+ACTIVITY_RECORD_CACHE_SIZE = config('ACTIVITY_RECORD_CACHE_SIZE', default=4096, cast=int)
+
+# ==============================================
+# CHAT MESSAGE PERSISTENCE
+# ==============================================
+
+# Write-behind mode: chat messages are broadcast right away and saved in batches.
+# Every message is staged in redis before the ack, replay_pending_messages saves the ones a
+# stopped process left staged for longer than CHAT_WRITE_BEHIND_ORPHAN_AGE.
+CHAT_WRITE_BEHIND_ENABLED = config('CHAT_WRITE_BEHIND_ENABLED', default=False, cast=bool)
+CHAT_WRITE_BEHIND_FLUSH_INTERVAL = config('CHAT_WRITE_BEHIND_FLUSH_INTERVAL', default=0.05, cast=float)  # seconds
+CHAT_WRITE_BEHIND_BATCH_SIZE = config('CHAT_WRITE_BEHIND_BATCH_SIZE', default=100, cast=int)
+CHAT_WRITE_BEHIND_ORPHAN_AGE = config('CHAT_WRITE_BEHIND_ORPHAN_AGE', default=300, cast=int)  # seconds
+
+# Sequenced events kept per conversation for ?since_seq= replay on reconnect
+CHAT_REPLAY_STREAM_LENGTH = config('CHAT_REPLAY_STREAM_LENGTH', default=500, cast=int)
+CHAT_REPLAY_TTL = config('CHAT_REPLAY_TTL', default=86400, cast=int)  # seconds
+
+# Typing indicators: a stop event is sent once a user has not typed for this long
+CHAT_TYPING_WINDOW = config('CHAT_TYPING_WINDOW', default=3.0, cast=float)  # seconds
+
+# A DM counts as open (no message notifications for it) until its sockets have been idle this long
+CHAT_OPEN_STATUS_TTL = config('CHAT_OPEN_STATUS_TTL', default=3600, cast=int)  # seconds
+
+# How long a client_msg_id is remembered, retries within this window return the original message
+CHAT_CLIENT_MSG_ID_TTL = config('CHAT_CLIENT_MSG_ID_TTL', default=300, cast=int)  # seconds
+
+# ==============================================
+# NOTIFICATIONS
+# ==============================================
+
+# Notifications are written to an outbox with the triggering row and pushed to the
+# sockets by the dispatch_notifications worker
+NOTIFICATION_OUTBOX_BATCH_SIZE = config('NOTIFICATION_OUTBOX_BATCH_SIZE', default=100, cast=int)
+NOTIFICATION_OUTBOX_POLL_INTERVAL = config('NOTIFICATION_OUTBOX_POLL_INTERVAL', default=0.5, cast=float)  # seconds
+NOTIFICATION_OUTBOX_MAX_ATTEMPTS = config('NOTIFICATION_OUTBOX_MAX_ATTEMPTS', default=5, cast=int)
+# Seconds a claimed batch is hidden from other workers, a worker that dies mid batch has it retried after that
+NOTIFICATION_OUTBOX_LEASE = config('NOTIFICATION_OUTBOX_LEASE', default=60, cast=int)
+
+# Unread message notifications are collapsed per conversation, a collapsed notification
+# is pushed again at most once per interval
+NOTIFICATION_PUSH_INTERVAL = config('NOTIFICATION_PUSH_INTERVAL', default=5, cast=int)  # seconds
+
+# Unread notifications sent on connect (older ones are paged in over the socket) and how
+# long the per-user unread counters live in redis before being rebuilt from the database
+NOTIFICATION_SYNC_LIMIT = config('NOTIFICATION_SYNC_LIMIT', default=20, cast=int)
+NOTIFICATION_UNREAD_COUNT_TTL = config('NOTIFICATION_UNREAD_COUNT_TTL', default=604800, cast=int)  # seconds
+
 # ==============================================
 # EMAIL CONFIGURATION
 # ==============================================
@@ -277,6 +366,11 @@ LOGGING: dict[str, Any] = {
             'format': '%(levelname)s %(asctime)s %(module)s %(message)s'
         }
     },
+    'filters': {
+        'group_overflow': {
+            '()': 'common.channel_layer.GroupOverflowFilter',
+        },
+    },
     'handlers': {
         'file': {
             'level': 'INFO',
@@ -310,6 +404,13 @@ LOGGING: dict[str, Any] = {
             'handlers': ['console'],
             'level': 'INFO',
         },
+        # channels_redis logs the group messages it drops at INFO, the filter counts them
+        'channels_redis.core': {
+            'handlers': ['file', 'console'],
+            'level': 'INFO',
+            'filters': ['group_overflow'],
+            'propagate': False,
+        },
     },
 }
 
@@ -1,12 +1,14 @@
-from channels.generic.websocket import AsyncWebsocketConsumer
-from .serializers import UserNotificationsSerializer
-import json
-from asgiref.sync import sync_to_async
+from __future__ import annotations
+from common.websocket import FrameProtocolConsumer
+from .serializers import UserNotificationsSerializer, prefetch_notification_content
 from channels.db import database_sync_to_async
+from typing import Any
+from django.conf import settings
+from .counters import get_unread_counts
 
 
 
-class NotificationConsumer(AsyncWebsocketConsumer):
+class NotificationConsumer(FrameProtocolConsumer):
     async def connect(self):
         self.user = self.scope['user'] #Get the user
         self.group_name = None  # Initialize group_name
@@ -24,25 +26,56 @@ class NotificationConsumer(AsyncWebsocketConsumer):
        if self.group_name:
         await self.channel_layer.group_discard(self.group_name, self.channel_name)
 
-    async def receive(self, text_data):
-        pass
+    async def receive(self, text_data=None, bytes_data=None):
         #TODO Ping/Acknowledge system will be implemented later.
+        try:
+            data = self.decode_frame(text_data, bytes_data)
+        except ValueError:
+            return
+        if isinstance(data, dict) and data.get('action_type') == 'load_notifications':
+            notifications, next_cursor = await self.get_unread_notifications(data.get('cursor'))
+            await self.send_payload({
+                'action_type': 'load_notifications',
+                'notifications': notifications,
+                'next_cursor': next_cursor,
+            })
 
     async def send_notification(self, event):
         notification = event['notification']
-        await self.send(text_data=json.dumps({
+        await self.send_payload({
             'notification':notification
-        }))
+        })
 
     @database_sync_to_async
-    def get_unread_notifications(self):
-        unread_notifications = self.user.notifications.filter(is_read=False).order_by('-created_at')
-        serialized_notifications = UserNotificationsSerializer(unread_notifications, many=True).data
-        return serialized_notifications
+    def get_unread_notifications(self, cursor: str | None = None) -> tuple[list[dict[str, Any]], str | None]:
+        """
+        Newest unread notifications below the cursor, plus the cursor of the next page.
+        Pages go by id: created_at moves forward every time a message notification
+        coalesces, which would make a notification skip or repeat across pages.
+        """
+        unread_notifications = prefetch_notification_content(
+            self.user.notifications.filter(is_read=False).order_by('-id')
+        )
+        if cursor:
+            try:
+                unread_notifications = unread_notifications.filter(id__lt=int(cursor))
+            except ValueError:
+                return [], None
+
+        limit = settings.NOTIFICATION_SYNC_LIMIT
+        page = list(unread_notifications[:limit + 1])
+        next_cursor = str(page[limit - 1].id) if len(page) > limit else None
+        serialized_notifications = list(UserNotificationsSerializer(page[:limit], many=True).data)
+        return serialized_notifications, next_cursor
 
     async def send_unread_notifications(self):
+        # Only the newest page is sent on connect, the rest is fetched with load_notifications
+        unread_counts = await get_unread_counts(self.user.id)
+        serialized_notifications, next_cursor = await self.get_unread_notifications()
+        await self.send_payload({
+            'notifications': serialized_notifications,
+            'next_cursor': next_cursor,
+            'unread_count': sum(unread_counts.values()),
+            'unread_counts': unread_counts,
+        })
 
-        serialized_notifications = await self.get_unread_notifications()
-        await self.send(text_data=json.dumps({
-            'notifications': serialized_notifications
-        }))
@@ -0,0 +1,87 @@
+from __future__ import annotations
+import logging
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count
+from channels.db import database_sync_to_async
+from neurocom.redis_client import get_redis, get_async_redis
+from .models import UserNotification
+
+logger = logging.getLogger(__name__)
+
+# Redis hash per user of notification type -> unread count, so badges need no query.
+# The hash always holds every type once built; adjustments only apply to an existing
+# hash, a missing one (expired, flushed) is rebuilt from the database on the next read.
+
+NOTIFICATION_TYPES = [notification_type for notification_type, _ in UserNotification.NOTIFICATION_TYPES]
+
+# Adjusts one type if the hash exists, never below zero
+ADJUST_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return nil
+end
+local count = redis.call('HINCRBY', KEYS[1], ARGV[1], ARGV[2])
+if count < 0 then
+    redis.call('HSET', KEYS[1], ARGV[1], 0)
+end
+return count
+"""
+
+
+def unread_counts_key(user_id: int) -> str:
+    return f'notification_unread_{user_id}'
+
+
+def adjust_unread_count(user_id: int, notification_type: str, delta: int) -> None:
+    """Apply delta once the current transaction commits"""
+    def adjust() -> None:
+        try:
+            script = get_redis().register_script(ADJUST_SCRIPT)
+            script(keys=[unread_counts_key(user_id)], args=[notification_type, delta])
+        except Exception as e:
+            logger.error(f"Error on adjust_unread_count: {e}")
+    transaction.on_commit(adjust)
+
+
+def clear_unread_counts(user_id: int) -> None:
+    """
+    Drop the hash once the current transaction commits, the next read rebuilds it.
+    Writing zeros instead would lose a notification created between the update and
+    the commit, whose adjustment may already have been applied to the hash.
+    """
+    def clear() -> None:
+        try:
+            get_redis().delete(unread_counts_key(user_id))
+        except Exception as e:
+            logger.error(f"Error on clear_unread_counts: {e}")
+    transaction.on_commit(clear)
+
+
+def rebuild_unread_counts(user_id: int) -> dict[str, int]:
+    counts = {notification_type: 0 for notification_type in NOTIFICATION_TYPES}
+    counts.update(
+        UserNotification.objects.filter(user_id=user_id, is_read=False)
+        .values_list('notification_type')
+        .annotate(count=Count('id'))
+    )
+    try:
+        pipe = get_redis().pipeline()
+        mapping: dict[str | bytes, int] = {notification_type: count for notification_type, count in counts.items()}
+        pipe.hset(unread_counts_key(user_id), mapping=mapping)
+        pipe.expire(unread_counts_key(user_id), settings.NOTIFICATION_UNREAD_COUNT_TTL)
+        pipe.execute()
+    except Exception as e:
+        logger.error(f"Error on rebuild_unread_counts: {e}")
+    return counts
+
+
+async def get_unread_counts(user_id: int) -> dict[str, int]:
+    try:
+        cached: dict[bytes, bytes] | None = await get_async_redis().hgetall(unread_counts_key(user_id))
+    except Exception as e:
+        logger.error(f"Error on get_unread_counts: {e}")
+        cached = None
+    if cached:
+        return {notification_type.decode(): int(count) for notification_type, count in cached.items()}
+    counts: dict[str, int] = await database_sync_to_async(rebuild_unread_counts)(user_id)
+    return counts
@@ -0,0 +1,22 @@
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from notifications.outbox import dispatch_outbox
+
+
+class Command(BaseCommand):
+    help = "Push the notifications waiting in the outbox to the users' sockets"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Drain the outbox once and exit instead of polling")
+
+    def handle(self, *args, **options):
+        while True:
+            sent = dispatch_outbox()
+            while sent:
+                #Keep draining full batches without sleeping
+                self.stdout.write(f"Sent {sent} notifications")
+                sent = dispatch_outbox()
+            if options['once']:
+                break
+            time.sleep(settings.NOTIFICATION_OUTBOX_POLL_INTERVAL)
@@ -43,9 +43,55 @@ class UserNotification(models.Model):
     notification_message = models.TextField(max_length=100, blank=True)
     priority = models.IntegerField(default=1)  # For future sorting
 
+    # Unread notifications with the same group_key (e.g. dm_<id>) are collapsed into one row
+    # pointing at the latest content_object, count is how many were collapsed
+    group_key = models.CharField(max_length=50, blank=True, default='')
+    count = models.PositiveIntegerField(default=1)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'group_key', 'is_read']),
+        ]
+        constraints = [
+            # One unread row per group, concurrent messages of a DM must not each start their own
+            models.UniqueConstraint(
+                fields=['user', 'group_key'],
+                condition=models.Q(is_read=False) & ~models.Q(group_key=''),
+                name='unique_unread_notification_group',
+            ),
+        ]
+
     def __str__(self) -> str:
         return f"{self.notification_type} notification for {self.user}"
 
+    def mark_read(self) -> None:
+        from .counters import adjust_unread_count
+        # Conditional update so concurrent mark-reads only count once
+        if UserNotification.objects.filter(id=self.id, is_read=False).update(is_read=True):
+            adjust_unread_count(self.user_id, self.notification_type, -1)
+        self.is_read = True
+
+
+class NotificationOutbox(models.Model):
+    """Notification waiting to be pushed to the user's sockets by the dispatch_notifications worker"""
+    notification = models.ForeignKey(
+        UserNotification,
+        on_delete=models.CASCADE,
+        related_name='outbox_entries'
+    )
+    attempts = models.PositiveSmallIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    available_at = models.DateTimeField(default=timezone.now) #Not sent before, throttles coalesced notifications
+
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['available_at']),
+        ]
+
+    def __str__(self) -> str:
+        return f"Outbox entry for {self.notification}"
+
 
 class BaseRequest(models.Model):
     class Meta:
@@ -0,0 +1,77 @@
+from __future__ import annotations
+import logging
+from datetime import timedelta
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from .models import NotificationOutbox, UserNotification
+from .serializers import UserNotificationsSerializer, prefetch_notification_content
+from .signals import notify_user
+
+logger = logging.getLogger(__name__)
+
+
+def dispatch_outbox(batch_size: int | None = None) -> int:
+    """
+    Send one batch of outbox entries to the users' notification groups, returns how many were sent.
+    A batch is claimed by pushing its available_at NOTIFICATION_OUTBOX_LEASE seconds ahead, so
+    several workers can drain the outbox side by side and the sends happen after the claim is
+    committed, without holding row locks. Delivery is at least once: an entry whose send fails,
+    or whose worker dies, comes back and is retried up to NOTIFICATION_OUTBOX_MAX_ATTEMPTS.
+    An entry is only cleared if its notification is still the one that was sent, a message
+    coalesced in meanwhile keeps it for another push after NOTIFICATION_PUSH_INTERVAL.
+    """
+    batch_size = batch_size or settings.NOTIFICATION_OUTBOX_BATCH_SIZE
+    with transaction.atomic():
+        entries = list(
+            NotificationOutbox.objects.select_for_update(skip_locked=True)
+            .filter(available_at__lte=timezone.now())[:batch_size]
+        )
+        if not entries:
+            return 0
+        NotificationOutbox.objects.filter(id__in=[entry.id for entry in entries]).update(
+            available_at=timezone.now() + timedelta(seconds=settings.NOTIFICATION_OUTBOX_LEASE)
+        )
+
+    notifications = prefetch_notification_content(
+        UserNotification.objects.filter(id__in=[entry.notification_id for entry in entries])
+    ).in_bulk()
+    # entry id -> count of the notification as sent
+    sent: dict[int, int] = {}
+    failed: list[int] = []
+    for entry in entries:
+        try:
+            notification = notifications[entry.notification_id]
+            notification_data = UserNotificationsSerializer(notification).data
+            async_to_sync(notify_user)(notification.user, notification_data)
+            sent[entry.id] = notification.count
+        except Exception as e:
+            logger.error(f"Error on dispatch_outbox ({entry.id}): {e}")
+            failed.append(entry.id)
+
+    with transaction.atomic():
+        if sent:
+            # Locked like coalesce_message_notification does, so a coalesce either committed
+            # before this reads the counts or runs after the entries are gone and adds its own
+            sent_entries = [entry for entry in entries if entry.id in sent]
+            counts = dict(
+                UserNotification.objects.select_for_update()
+                .filter(id__in=[entry.notification_id for entry in sent_entries]).values_list('id', 'count')
+            )
+            unchanged = [entry.id for entry in sent_entries if counts.get(entry.notification_id) == sent[entry.id]]
+            NotificationOutbox.objects.filter(id__in=unchanged).delete()
+            NotificationOutbox.objects.filter(id__in=sent).exclude(id__in=unchanged).update(
+                available_at=timezone.now() + timedelta(seconds=settings.NOTIFICATION_PUSH_INTERVAL)
+            )
+        if failed:
+            #Back in line for the next batch
+            NotificationOutbox.objects.filter(id__in=failed).update(attempts=F('attempts') + 1, available_at=timezone.now())
+            dropped, _ = NotificationOutbox.objects.filter(
+                id__in=failed, attempts__gte=settings.NOTIFICATION_OUTBOX_MAX_ATTEMPTS
+            ).delete()
+            if dropped:
+                #The notification itself is kept, the user still gets it on the next sync
+                logger.error(f"Error on dispatch_outbox: dropped {dropped} entries after too many attempts")
+    return len(sent)
@@ -1,42 +1,75 @@
 from __future__ import annotations
 from rest_framework import serializers
 from .models import UserNotification, Invitation, ChatroomJoinRequest
-from user.serializers import FriendshipSerializer, UserSerializer
-from chat.serializers import MessageSerializer
+from user.serializers import FriendshipSerializer, user_serializer_related
+from user.card_cache import UserCardsMixin, UserCardsListSerializer
+from chat.serializers import MessageSerializer, prefetch_message_relations
 from chatroom.serializers import ChatroomSerializer
 from django.contrib.contenttypes.models import ContentType
 from .models import FriendshipRequest, Invitation, ChatroomJoinRequest
 from chat.models import DirectMessageMessage
 from chatroom.models import ChatroomMessage
-class UserNotificationsSerializer(serializers.ModelSerializer):
+from django.contrib.contenttypes.prefetch import GenericPrefetch
+from django.db.models import QuerySet
+
+
+def prefetch_notification_content(queryset: QuerySet[UserNotification]) -> QuerySet[UserNotification]:
+    """
+    Load everything UserNotificationsSerializer reads in a fixed number of queries: the
+    content objects are fetched with one query per content type, together with their
+    users (settings, profile picture), chatrooms and message files.
+    """
+    return queryset.select_related(*user_serializer_related('user')).prefetch_related(
+        GenericPrefetch('content_object', [
+            FriendshipRequest.objects.select_related(*user_serializer_related('initiator', 'recipient')),
+            Invitation.objects.select_related('chatroom', *user_serializer_related('initiator', 'recipient'))
+            .prefetch_related('chatroom__users'),
+            ChatroomJoinRequest.objects.select_related('chatroom', *user_serializer_related('initiator', 'recipient'))
+            .prefetch_related('chatroom__users'),
+            prefetch_message_relations(DirectMessageMessage.objects.all()),
+            prefetch_message_relations(ChatroomMessage.objects.all()),
+        ])
+    )
+
+class UserNotificationsSerializer(UserCardsMixin, serializers.ModelSerializer):
     content_object = serializers.SerializerMethodField()
     user = serializers.SerializerMethodField()
     class Meta:
         model = UserNotification
         fields = '__all__'
+        list_serializer_class = UserCardsListSerializer
+
+    def card_users(self, obj):
+        # The content serializers get this context, so their cards come from the same batch
+        users = [obj.user]
+        for field in ('initiator', 'recipient', 'sender'):
+            user = getattr(obj.content_object, field, None)
+            if user is not None:
+                users.append(user)
+        return users
 
     def get_content_object(self,obj):
         serializer: FriendshipSerializer | MessageSerializer | InvitationSerializer | ChatroomJoinRequestSerializer
         if isinstance(obj.content_object, FriendshipRequest):
-            serializer = FriendshipSerializer(obj.content_object)
+            serializer = FriendshipSerializer(obj.content_object, context=self.context)
         elif isinstance(obj.content_object, DirectMessageMessage) | isinstance(obj.content_object, ChatroomMessage):
-            serializer = MessageSerializer(obj.content_object)
+            serializer = MessageSerializer(obj.content_object, context=self.context)
         elif isinstance(obj.content_object, Invitation):
-            serializer = InvitationSerializer(obj.content_object)
+            serializer = InvitationSerializer(obj.content_object, context=self.context)
         elif isinstance(obj.content_object, ChatroomJoinRequest):
-            serializer = ChatroomJoinRequestSerializer(obj.content_object)
+            serializer = ChatroomJoinRequestSerializer(obj.content_object, context=self.context)
         else:
             return None
         return serializer.data
     
     def get_user(self,obj):
         user = obj.user
-        serialized_user = UserSerializer(user).data
+        serialized_user = self.card(user)
         
         return serialized_user
         
     
-class ChatroomJoinRequestSerializer(serializers.ModelSerializer):
+class ChatroomJoinRequestSerializer(UserCardsMixin, serializers.ModelSerializer):
     initiator = serializers.SerializerMethodField()
     recipient = serializers.SerializerMethodField()
     chatroom = serializers.SerializerMethodField()
@@ -45,10 +78,10 @@ class ChatroomJoinRequestSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
     def get_initiator(self,obj):
-        return UserSerializer(obj.initiator).data
+        return self.card(obj.initiator)
 
     def get_recipient(self,obj):
-        serialized_recipient = UserSerializer(obj.recipient).data
+        serialized_recipient = self.card(obj.recipient)
         return serialized_recipient
 
     def get_chatroom(self,obj):
@@ -56,7 +89,7 @@ class ChatroomJoinRequestSerializer(serializers.ModelSerializer):
         return serialized_chatroom
 
 
-class InvitationSerializer(serializers.ModelSerializer):
+class InvitationSerializer(UserCardsMixin, serializers.ModelSerializer):
     initiator = serializers.SerializerMethodField()
     recipient = serializers.SerializerMethodField()
     chatroom = serializers.SerializerMethodField()
@@ -65,10 +98,10 @@ class InvitationSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
     def get_initiator(self,obj):
-        return UserSerializer(obj.initiator).data
+        return self.card(obj.initiator)
     
     def get_recipient(self,obj):
-        serialized_recipient = UserSerializer(obj.recipient).data
+        serialized_recipient = self.card(obj.recipient)
         return serialized_recipient
     
     def get_chatroom(self,obj):
@@ -1,17 +1,22 @@
 from __future__ import annotations
-from .models import UserNotification, FriendshipRequest, Invitation, ChatroomJoinRequest
+from .models import UserNotification, NotificationOutbox, FriendshipRequest, Invitation, ChatroomJoinRequest
 from django.db.models.signals import post_save,post_delete,pre_save
 from django.dispatch import receiver
+from django.db import transaction, IntegrityError
+from django.utils import timezone
+from datetime import timedelta
 from chatroom.models import ChatRoom,Channel
 from django.contrib.contenttypes.models import ContentType
 from channels.layers import get_channel_layer
 from asgiref.sync import async_to_sync
 import asyncio
 from .serializers import UserNotificationsSerializer
+from .counters import adjust_unread_count
 from chat.models import DirectMessage
 from chat.models import DirectMessageMessage
+from chat.chat_status import is_chat_open
 from asgiref.sync import sync_to_async
-import redis.client
+import logging
 from django.conf import settings
 from django.db.models import Q
 from typing import Any, cast, Union, Protocol
@@ -26,6 +31,8 @@ if TYPE_CHECKING:
 else:
     User = get_user_model()
 
+logger = logging.getLogger(__name__)
+
 # Fucking Protocol to ensure all content objects have an id
 class ContentObjectProtocol(Protocol):
     id: int
@@ -68,6 +75,13 @@ def create_message_notification(sender: type[DirectMessageMessage], instance: Di
           create_notification(receiver,'message',instance, not(receiver.settings.message_notifications))
  
 
+#Keep the unread counters right when notifications go away with their content object
+@receiver(post_delete, sender=UserNotification)
+def discount_deleted_notification(sender: type[UserNotification], instance: UserNotification, **kwargs: Any) -> None:
+    if not instance.is_read:
+        adjust_unread_count(instance.user_id, instance.notification_type, -1)
+
+
 #Create dm when a new friendship object has been created
 def create_dm(user1: User,user2: User):
     if user1 and user2:
@@ -108,40 +122,77 @@ def create_notification(user: User, notification_type: str, content_object: Cont
         else:
             message = 'New notification'
         
-        if not get_user_status(user):
+        #Only a message to the DM the user has open right now goes without a notification
+        in_the_chat = notification_type == 'message' and is_chat_open(cast(DirectMessageMessage, content_object).direct_message_id, user.id)
+        if in_the_chat:
+            #Delivered to the open chat, so it does not count towards the DM's unread messages
+            DirectMessageMessage.objects.filter(id=cast(DirectMessageMessage, content_object).id).update(is_read=True)
+        else:
             content_type = ContentType.objects.get_for_model(content_object)
             # Cast to ensure Fukcing MyPy knows the fucking object has an id attribute
             obj_with_id = cast(ContentObjectProtocol, content_object)
-            notification = UserNotification.objects.create(
-                user=user,
-                notification_type=notification_type,
-                content_type=content_type,
-                object_id=obj_with_id.id,
-                is_read=read,
-                notification_message=message,
-            )
-            notification_data = UserNotificationsSerializer(notification).data
-
-            if not read:
-                async_to_sync(notify_user)(user, notification_data)
+            # Committed or rolled back together with the row that triggered it, the
+            # dispatch_notifications worker renders and sends it once it is committed
+            with transaction.atomic():
+                if notification_type == 'message' and not read:
+                    coalesce_message_notification(user, cast(DirectMessageMessage, content_object), content_type, sender)
+                    return
+                notification = UserNotification.objects.create(
+                    user=user,
+                    notification_type=notification_type,
+                    content_type=content_type,
+                    object_id=obj_with_id.id,
+                    is_read=read,
+                    notification_message=message,
+                )
+                if not read:
+                    NotificationOutbox.objects.create(notification=notification)
+                    adjust_unread_count(user.id, notification_type, 1)
     else:
         #TODO Handle cases where user or content_object is None
         pass
 
-def get_user_status(user: User) -> bool:
-    redis_client = redis.StrictRedis(
-        host=settings.REDIS_HOST,
-        port=settings.REDIS_PORT,
-        db=0,
+def coalesce_message_notification(user: User, content_object: DirectMessageMessage, content_type: ContentType, sender: str) -> None:
+    """Collapse unread message notifications per (recipient, DM) into one row and throttle its pushes"""
+    group_key = f'dm_{content_object.direct_message_id}'
+    notification = (
+        UserNotification.objects.select_for_update()
+        .filter(user=user, group_key=group_key, is_read=False)
+        .first()
     )
+    if notification is None:
+        try:
+            with transaction.atomic():
+                notification = UserNotification.objects.create(
+                    user=user,
+                    notification_type='message',
+                    content_type=content_type,
+                    object_id=content_object.id,
+                    group_key=group_key,
+                    notification_message=f'{sender} sent you a message',
+                )
+        except IntegrityError:
+            #Another message of the DM created the row first, add this one to it
+            coalesce_message_notification(user, content_object, content_type, sender)
+            return
+        NotificationOutbox.objects.create(notification=notification)
+        adjust_unread_count(user.id, 'message', 1)
+        return
+
+    notification.object_id = content_object.id
+    notification.count += 1
+    notification.notification_message = f'{sender} sent you {notification.count} messages'
+    #created_at is auto_now, saving it moves the notification back to the top
+    notification.save(update_fields=['object_id', 'count', 'notification_message', 'created_at'])
+
+    # A pending push already renders the latest state, one a worker is sending right now is kept
+    # by dispatch_outbox since the count changed. Otherwise the next one waits out the interval
+    if not notification.outbox_entries.exists():
+        NotificationOutbox.objects.create(
+            notification=notification,
+            available_at=timezone.now() + timedelta(seconds=settings.NOTIFICATION_PUSH_INTERVAL),
+        )
 
-    raw_status: dict[bytes, bytes] = redis_client.hgetall(f"user_activity_{user.id}")
-
-    decoded_status: dict[str, str] = {
-        k.decode("utf-8"): v.decode("utf-8") for k, v in raw_status.items()
-    }
-
-    return decoded_status.get("in_the_chat_status") == "True"
 
 async def notify_user(user: User, notification_data: dict[str, Any]) -> None:
     channel_layer = get_channel_layer()
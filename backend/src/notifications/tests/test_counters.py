@@ -0,0 +1,109 @@
+from django.test import TestCase
+from django.contrib.auth import get_user_model
+from django.contrib.contenttypes.models import ContentType
+from asgiref.sync import async_to_sync
+from django.utils import timezone
+from notifications.models import UserNotification, FriendshipRequest
+from notifications.counters import clear_unread_counts, get_unread_counts, unread_counts_key
+from notifications.consumers import NotificationConsumer
+from unittest.mock import patch, AsyncMock
+
+user_model = get_user_model()
+
+
+@patch('notifications.counters.get_redis')
+class UnreadCountersTest(TestCase):
+
+    def setUp(self):
+        self.user = user_model.objects.create(email='user1@test.com', username='user1', password='password123')
+        self.other_user = user_model.objects.create(email='user2@test.com', username='user2', password='password123')
+
+    def create_notifications(self, count):
+        content_type = ContentType.objects.get_for_model(FriendshipRequest)
+        return [
+            UserNotification.objects.create(user=self.user, notification_type='friend_request', content_type=content_type, object_id=i)
+            for i in range(count)
+        ]
+
+    @patch('notifications.signals.is_chat_open', return_value=False)
+    def test_created_notifications_are_counted(self, mock_status, mock_redis):
+        script = mock_redis.return_value.register_script.return_value
+
+        with self.captureOnCommitCallbacks(execute=True):
+            FriendshipRequest.objects.create(initiator=self.other_user, recipient=self.user)
+
+        script.assert_called_once_with(keys=[unread_counts_key(self.user.id)], args=['friend_request', 1])
+
+    def test_mark_read_counts_once(self, mock_redis):
+        script = mock_redis.return_value.register_script.return_value
+        notification = self.create_notifications(1)[0]
+        stale_copy = UserNotification.objects.get(id=notification.id)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            notification.mark_read()
+            stale_copy.mark_read()
+
+        script.assert_called_once_with(keys=[unread_counts_key(self.user.id)], args=['friend_request', -1])
+        self.assertTrue(UserNotification.objects.get(id=notification.id).is_read)
+
+    @patch('notifications.counters.get_async_redis')
+    def test_missing_counters_are_rebuilt(self, mock_async_redis, mock_redis):
+        mock_async_redis.return_value.hgetall = AsyncMock(return_value={})
+        self.create_notifications(2)
+
+        counts = async_to_sync(get_unread_counts)(self.user.id)
+
+        self.assertEqual(counts['friend_request'], 2)
+        self.assertEqual(counts['message'], 0)
+        mock_redis.return_value.pipeline.return_value.hset.assert_called_once_with(unread_counts_key(self.user.id), mapping=counts)
+
+    @patch('notifications.consumers.settings')
+    def test_initial_sync_is_paged(self, mock_settings, mock_redis):
+        mock_settings.NOTIFICATION_SYNC_LIMIT = 2
+        notifications = self.create_notifications(3)
+        consumer = NotificationConsumer()
+        consumer.user = self.user
+
+        first_page, cursor = async_to_sync(consumer.get_unread_notifications)()
+        second_page, last_cursor = async_to_sync(consumer.get_unread_notifications)(cursor)
+
+        self.assertEqual(len(first_page), 2)
+        self.assertEqual(
+            {notification['id'] for notification in first_page + second_page},
+            {notification.id for notification in notifications}
+        )
+        self.assertIsNone(last_cursor)
+
+    def test_mark_all_read_drops_the_counters(self, mock_redis):
+        # Zeros written after the commit would hide a notification created in between
+        with self.captureOnCommitCallbacks(execute=True):
+            clear_unread_counts(self.user.id)
+
+        mock_redis.return_value.delete.assert_called_once_with(unread_counts_key(self.user.id))
+        mock_redis.return_value.pipeline.return_value.hset.assert_not_called()
+
+    @patch('notifications.consumers.settings')
+    def test_coalesced_notification_keeps_its_page(self, mock_settings, mock_redis):
+        mock_settings.NOTIFICATION_SYNC_LIMIT = 2
+        notifications = self.create_notifications(3)
+        consumer = NotificationConsumer()
+        consumer.user = self.user
+
+        first_page, cursor = async_to_sync(consumer.get_unread_notifications)()
+        # A coalesced message bumps created_at of a notification already on the first page
+        UserNotification.objects.filter(id=first_page[0]['id']).update(created_at=timezone.now())
+        second_page, _ = async_to_sync(consumer.get_unread_notifications)(cursor)
+
+        self.assertEqual(
+            [notification['id'] for notification in first_page + second_page],
+            [notification.id for notification in reversed(notifications)]
+        )
+
+    def test_loaded_page_is_tagged(self, mock_redis):
+        consumer = NotificationConsumer()
+        consumer.user = self.user
+        consumer.send_payload = AsyncMock()
+
+        async_to_sync(consumer.receive)(text_data='{"action_type": "load_notifications"}')
+
+        self.assertEqual(consumer.send_payload.await_args.args[0]['action_type'], 'load_notifications')
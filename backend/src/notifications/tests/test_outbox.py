@@ -0,0 +1,149 @@
+from django.db import connection
+from django.test import TestCase
+from django.utils import timezone
+from django.contrib.auth import get_user_model
+from notifications.models import UserNotification, NotificationOutbox, FriendshipRequest
+from notifications.outbox import dispatch_outbox
+from chat.models import DirectMessage, DirectMessageMessage
+from unittest.mock import patch, AsyncMock
+
+user_model = get_user_model()
+
+
+@patch('notifications.signals.is_chat_open', return_value=False)
+class NotificationOutboxTest(TestCase):
+
+    def setUp(self):
+        self.user = user_model.objects.create(email='user1@test.com', username='user1', password='password123')
+        self.other_user = user_model.objects.create(email='user2@test.com', username='user2', password='password123')
+
+    @patch('notifications.signals.get_channel_layer')
+    def test_creating_a_notification_only_writes_the_outbox(self, mock_layer, mock_status):
+        FriendshipRequest.objects.create(initiator=self.other_user, recipient=self.user)
+
+        notification = UserNotification.objects.get(user=self.user)
+        self.assertEqual(NotificationOutbox.objects.get().notification, notification)
+        mock_layer.assert_not_called()
+
+    @patch('notifications.signals.get_channel_layer')
+    def test_dispatch_sends_and_clears_the_outbox(self, mock_layer, mock_status):
+        group_send = mock_layer.return_value.group_send = AsyncMock()
+        FriendshipRequest.objects.create(initiator=self.other_user, recipient=self.user)
+        FriendshipRequest.objects.create(initiator=self.user, recipient=self.other_user)
+
+        self.assertEqual(dispatch_outbox(), 2)
+
+        self.assertFalse(NotificationOutbox.objects.exists())
+        self.assertEqual(
+            [call.args[0] for call in group_send.call_args_list],
+            [f'notifications_{self.user.id}', f'notifications_{self.other_user.id}']
+        )
+        self.assertEqual(group_send.call_args_list[0].args[1]['notification']['notification_type'], 'friend_request')
+
+    @patch('notifications.signals.get_channel_layer')
+    def test_failed_sends_stay_in_the_outbox(self, mock_layer, mock_status):
+        mock_layer.return_value.group_send = AsyncMock(side_effect=ConnectionError)
+        FriendshipRequest.objects.create(initiator=self.other_user, recipient=self.user)
+
+        self.assertEqual(dispatch_outbox(), 0)
+
+        entry = NotificationOutbox.objects.get()
+        self.assertEqual(entry.attempts, 1)
+        self.assertLessEqual(entry.available_at, timezone.now())
+
+    def test_sends_happen_after_the_batch_is_claimed(self, mock_status):
+        outer_blocks = len(connection.atomic_blocks)
+        during_send = []
+
+        def notify_user(user, notification_data):
+            during_send.append((len(connection.atomic_blocks), NotificationOutbox.objects.get().available_at))
+        FriendshipRequest.objects.create(initiator=self.other_user, recipient=self.user)
+
+        with patch('notifications.outbox.async_to_sync', return_value=notify_user):
+            self.assertEqual(dispatch_outbox(), 1)
+
+        # Outside the claiming transaction, with the entry leased away from other workers
+        blocks, available_at = during_send[0]
+        self.assertEqual(blocks, outer_blocks)
+        self.assertGreater(available_at, timezone.now())
+
+    @patch('notifications.signals.get_channel_layer')
+    def test_claimed_entries_are_skipped(self, mock_layer, mock_status):
+        mock_layer.return_value.group_send = AsyncMock()
+        FriendshipRequest.objects.create(initiator=self.other_user, recipient=self.user)
+        NotificationOutbox.objects.update(available_at=timezone.now() + timezone.timedelta(seconds=60))
+
+        self.assertEqual(dispatch_outbox(), 0)
+        self.assertTrue(NotificationOutbox.objects.exists())
+
+    @patch('notifications.signals.get_channel_layer')
+    def test_message_bursts_collapse_into_one_notification(self, mock_layer, mock_status):
+        group_send = mock_layer.return_value.group_send = AsyncMock()
+        dm = DirectMessage.objects.create(user1=self.user, user2=self.other_user)
+        for i in range(3):
+            message = DirectMessageMessage.objects.create(direct_message=dm, sender=self.other_user, content=f'message {i}')
+
+        notification = UserNotification.objects.get(user=self.user)
+        self.assertEqual(notification.count, 3)
+        self.assertEqual(notification.object_id, message.id)
+        self.assertEqual(NotificationOutbox.objects.count(), 1)
+        self.assertEqual(dispatch_outbox(), 1)
+        self.assertEqual(group_send.call_args.args[1]['notification']['count'], 3)
+
+        # Once pushed, the next update waits out NOTIFICATION_PUSH_INTERVAL
+        DirectMessageMessage.objects.create(direct_message=dm, sender=self.other_user, content='message 3')
+        self.assertEqual(dispatch_outbox(), 0)
+        self.assertEqual(UserNotification.objects.get(user=self.user).count, 4)
+
+    @patch('notifications.signals.get_channel_layer')
+    def test_read_notifications_are_not_reused(self, mock_layer, mock_status):
+        dm = DirectMessage.objects.create(user1=self.user, user2=self.other_user)
+        DirectMessageMessage.objects.create(direct_message=dm, sender=self.other_user, content='first')
+        UserNotification.objects.update(is_read=True)
+
+        DirectMessageMessage.objects.create(direct_message=dm, sender=self.other_user, content='second')
+
+        self.assertEqual(UserNotification.objects.filter(user=self.user, is_read=False, count=1).count(), 1)
+
+    @patch('notifications.signals.get_channel_layer')
+    def test_concurrent_first_messages_share_one_notification(self, mock_layer, mock_status):
+        dm = DirectMessage.objects.create(user1=self.user, user2=self.other_user)
+        DirectMessageMessage.objects.create(direct_message=dm, sender=self.other_user, content='first')
+        select_for_update = UserNotification.objects.select_for_update
+        lookups = []
+
+        def racing_lookup():
+            # The first lookup runs before the other message's row was committed
+            lookups.append(1)
+            return UserNotification.objects.none() if len(lookups) == 1 else select_for_update()
+
+        with patch.object(UserNotification.objects, 'select_for_update', side_effect=racing_lookup):
+            DirectMessageMessage.objects.create(direct_message=dm, sender=self.other_user, content='second')
+
+        self.assertEqual(len(lookups), 2)
+        notification = UserNotification.objects.get(user=self.user)
+        self.assertEqual(notification.count, 2)
+        self.assertEqual(notification.notification_message, 'user2 sent you 2 messages')
+
+    @patch('notifications.signals.get_channel_layer')
+    def test_message_coalesced_during_a_send_is_pushed_later(self, mock_layer, mock_status):
+        dm = DirectMessage.objects.create(user1=self.user, user2=self.other_user)
+        DirectMessageMessage.objects.create(direct_message=dm, sender=self.other_user, content='first')
+        pushed_counts = []
+
+        def notify_user(user, notification_data):
+            pushed_counts.append(notification_data['count'])
+            if len(pushed_counts) == 1:
+                # Arrives after the worker rendered the notification, before it clears the entry
+                DirectMessageMessage.objects.create(direct_message=dm, sender=self.other_user, content='second')
+
+        with patch('notifications.outbox.async_to_sync', return_value=notify_user):
+            self.assertEqual(dispatch_outbox(), 1)
+            entry = NotificationOutbox.objects.get()
+            self.assertGreater(entry.available_at, timezone.now())
+
+            NotificationOutbox.objects.update(available_at=timezone.now())
+            self.assertEqual(dispatch_outbox(), 1)
+
+        self.assertEqual(pushed_counts, [1, 2])
+        self.assertFalse(NotificationOutbox.objects.exists())
@@ -0,0 +1,68 @@
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
+from django.contrib.auth import get_user_model
+from django.contrib.contenttypes.models import ContentType
+from notifications.models import UserNotification, FriendshipRequest, Invitation, ChatroomJoinRequest
+from notifications.serializers import UserNotificationsSerializer, prefetch_notification_content
+from chatroom.models import ChatRoom, ChatroomMessage
+from chat.models import DirectMessage, DirectMessageMessage
+from unittest.mock import patch
+
+user_model = get_user_model()
+
+
+@patch('user_activity.audience.get_redis')
+@patch('chatroom.events.get_channel_layer')
+@patch('notifications.signals.create_notification')
+class NotificationPrefetchTest(TestCase):
+
+    def setUp(self):
+        self.user = user_model.objects.create(email='user@test.com', username='user', password='password123')
+        # Every chatroom gets a channel named Main and channel names are unique, so share one
+        self.chatroom = ChatRoom.objects.create(name='room', user=self.user)
+        # Content types are cached per process, load the one no test row uses up front
+        ContentType.objects.get_for_model(ChatroomMessage)
+
+    def notify(self, content_object, notification_type):
+        UserNotification.objects.create(
+            user=self.user,
+            notification_type=notification_type,
+            content_type=ContentType.objects.get_for_model(content_object),
+            object_id=content_object.id,
+        )
+
+    def create_notifications(self, count):
+        for _ in range(count):
+            i = user_model.objects.count()
+            other_user = user_model.objects.create(email=f'other{i}@test.com', username=f'other{i}', password='password123')
+            chatroom = self.chatroom
+            dm = DirectMessage.objects.create(user1=self.user, user2=other_user)
+            self.notify(FriendshipRequest.objects.create(initiator=other_user, recipient=self.user), 'friend_request')
+            self.notify(Invitation.objects.create(initiator=other_user, recipient=self.user, chatroom=chatroom), 'chatroom_invitation')
+            self.notify(ChatroomJoinRequest.objects.create(initiator=other_user, recipient=self.user, chatroom=chatroom), 'chatroom_join_request')
+            self.notify(DirectMessageMessage.objects.create(direct_message=dm, sender=other_user, content='hi'), 'message')
+
+    def serialize(self):
+        with CaptureQueriesContext(connection) as queries:
+            data = UserNotificationsSerializer(prefetch_notification_content(self.user.notifications.all()), many=True).data
+        return data, len(queries)
+
+    def test_query_count_does_not_grow_with_page_size(self, mock_create, mock_layer, mock_redis):
+        self.create_notifications(1)
+        data, small_page_queries = self.serialize()
+        self.assertEqual(len(data), 4)
+
+        self.create_notifications(5)
+        data, large_page_queries = self.serialize()
+        self.assertEqual(len(data), 24)
+
+        self.assertEqual(small_page_queries, large_page_queries)
+        self.assertTrue(all(notification['content_object'] for notification in data))
+
+    def test_fixed_query_budget(self, mock_create, mock_layer, mock_redis):
+        self.create_notifications(3)
+
+        # notifications + users, one per content type, chatroom members (x2), message files
+        with self.assertNumQueries(8):
+            UserNotificationsSerializer(prefetch_notification_content(self.user.notifications.all()), many=True).data
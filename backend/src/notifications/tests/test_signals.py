@@ -0,0 +1,62 @@
+from django.test import TestCase
+from django.contrib.auth import get_user_model
+from notifications.models import UserNotification, FriendshipRequest
+from chat.chat_status import chat_open_key
+from chat.models import DirectMessage, DirectMessageMessage
+from unittest.mock import patch
+
+user_model = get_user_model()
+
+
+@patch('user_activity.audience.get_redis')
+@patch('chat.chat_status.get_redis')
+class OpenChatNotificationTest(TestCase):
+
+    def setUp(self):
+        self.user = user_model.objects.create(email='user1@test.com', username='user1', password='password123')
+        self.other_user = user_model.objects.create(email='user2@test.com', username='user2', password='password123')
+        self.third_user = user_model.objects.create(email='user3@test.com', username='user3', password='password123')
+
+    def open_dm(self, mock_redis, dm):
+        # self.user has dm open in some tab
+        mock_redis.return_value.hmget.side_effect = lambda key, fields: [b'1' if key == chat_open_key(dm.id) else None for _ in fields]
+
+    def test_message_to_the_open_dm_is_not_notified(self, mock_redis, mock_audience_redis):
+        dm = DirectMessage.objects.create(user1=self.user, user2=self.other_user)
+        self.open_dm(mock_redis, dm)
+
+        message = DirectMessageMessage.objects.create(direct_message=dm, sender=self.other_user, content='hi')
+
+        self.assertFalse(UserNotification.objects.filter(user=self.user).exists())
+        message.refresh_from_db()
+        self.assertTrue(message.is_read)
+        mock_redis.return_value.hmget.assert_called_once_with(chat_open_key(dm.id), [str(self.user.id)])
+
+    def test_message_to_another_dm_is_notified(self, mock_redis, mock_audience_redis):
+        open_dm = DirectMessage.objects.create(user1=self.user, user2=self.other_user)
+        other_dm = DirectMessage.objects.create(user1=self.user, user2=self.third_user)
+        self.open_dm(mock_redis, open_dm)
+
+        message = DirectMessageMessage.objects.create(direct_message=other_dm, sender=self.third_user, content='hi')
+
+        self.assertEqual(UserNotification.objects.get(user=self.user).notification_type, 'message')
+        message.refresh_from_db()
+        self.assertFalse(message.is_read)
+
+    def test_other_notifications_ignore_open_dms(self, mock_redis, mock_audience_redis):
+        dm = DirectMessage.objects.create(user1=self.user, user2=self.other_user)
+        self.open_dm(mock_redis, dm)
+
+        FriendshipRequest.objects.create(initiator=self.third_user, recipient=self.user)
+
+        self.assertEqual(UserNotification.objects.get(user=self.user).notification_type, 'friend_request')
+        mock_redis.return_value.hmget.assert_not_called()
+
+    def test_redis_errors_count_as_not_in_the_chat(self, mock_redis, mock_audience_redis):
+        dm = DirectMessage.objects.create(user1=self.user, user2=self.other_user)
+        mock_redis.return_value.hmget.side_effect = ConnectionError
+
+        with self.assertLogs('chat.chat_status', 'ERROR'):
+            DirectMessageMessage.objects.create(direct_message=dm, sender=self.other_user, content='hi')
+
+        self.assertTrue(UserNotification.objects.filter(user=self.user).exists())
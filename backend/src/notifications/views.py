@@ -18,7 +18,8 @@ from notifications.models import (
     Invitation,
     ChatroomJoinRequest
 )
-from notifications.serializers import UserNotificationsSerializer
+from notifications.serializers import UserNotificationsSerializer, prefetch_notification_content
+from notifications.counters import clear_unread_counts
 from user.serializers import FriendshipSerializer
 from common.custom_api_classes import AuthenticatedAPIView
 
@@ -34,8 +35,9 @@ class MarkAllReadView(BaseAPIView):
         user = self.get_authenticated_user(request)
         if(isinstance(user, Response)):
             return user
-        notifications = UserNotification.objects.filter(user=user)
+        notifications = UserNotification.objects.filter(user=user, is_read=False)
         notifications.update(is_read=True)
+        clear_unread_counts(user.id)
         return self.success_response({"success": True}, status_code=status.HTTP_200_OK)
 
 
@@ -71,8 +73,7 @@ class AcceptFriendRequestView(BaseModelAPIView):
             ).exists():
                 DirectMessage.objects.create(user1=initiator, user2=recipient)
 
-        notification.is_read = True
-        notification.save()
+        notification.mark_read()
 
         return self.success_response({"success": True, "message": "Accepted"}, status_code=status.HTTP_201_CREATED)
 
@@ -98,8 +99,7 @@ class DeclineFriendRequestView(BaseModelAPIView):
             request_obj.is_removed = True
             request_obj.save()
 
-        notification.is_read = True
-        notification.save()
+        notification.mark_read()
 
         return self.success_response({"success": True, "Message": "Declined"}, status_code=status.HTTP_200_OK)
 
@@ -137,7 +137,7 @@ class GetNotificationsView(BaseAPIView, generics.ListAPIView):
 
     def get_queryset(self) -> QuerySet[UserNotification]:
         user: User = self.request.user  # type: ignore
-        return user.notifications.all().order_by('-created_at')
+        return prefetch_notification_content(user.notifications.all().order_by('-created_at'))
 
     def get(self, request:Request, *args, **kwargs):
         response = super().list(request, *args, **kwargs)
@@ -226,8 +226,7 @@ class AcceptInvitationView(BaseAPIView):
         invitation.status = Invitation.ACCEPTED
         invitation.save()
 
-        notification.is_read = True
-        notification.save()
+        notification.mark_read()
 
         return self.success_response({"success": True}, "Invitation Accepted")
 
@@ -255,8 +254,7 @@ class AcceptChatroomRequestView(BaseAPIView):
             join_request.status = ChatroomJoinRequest.ACCEPTED
             join_request.save()
 
-            notification.is_read = True
-            notification.save()
+            notification.mark_read()
 
             return self.success_response({"success": True,"message": "Request Accepted"}, status_code=status.HTTP_200_OK)
 
@@ -290,8 +288,7 @@ class RejectInvitationView(BaseAPIView):
         invitation.status = Invitation.REJECTED
         invitation.save()
 
-        notification.is_read = True
-        notification.save()
+        notification.mark_read()
 
         return self.success_response({"success": True, "message": "Invitation Rejected"}, status_code=status.HTTP_200_OK)
 
@@ -313,8 +310,7 @@ class RejectChatroomRequestView(BaseAPIView):
         join_request.status = ChatroomJoinRequest.REJECTED
         join_request.save()
 
-        notification.is_read = True
-        notification.save()
+        notification.mark_read()
 
         return self.success_response({"success": True, "message": "Request Rejected"}, status_code=status.HTTP_200_OK)
 
@@ -0,0 +1,195 @@
+from __future__ import annotations
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Iterable, cast
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Manager
+from rest_framework import serializers
+from neurocom.redis_client import get_redis
+from .models import User
+
+logger = logging.getLogger(__name__)
+
+# Rendered UserSerializer output ("user card") per user, cached in a per-process LRU in
+# front of redis. Every redis entry records the version it was rendered at; changing the
+# user, their settings or deleting them bumps the version, so an entry a request was
+# still writing when the change committed is ignored instead of served. The per-process copies expire after
+# USER_CARD_LOCAL_TTL seconds. Cards are shared, callers must not modify them.
+
+_local_cache: OrderedDict[int, tuple[float, dict[str, Any]]] = OrderedDict()
+
+
+def card_version_key(user_id: int) -> str:
+    return f'user_card_version_{user_id}'
+
+
+def card_cache_key(user_id: int) -> str:
+    return f'user_card_{user_id}'
+
+
+def get_user_card(user: User | int) -> dict[str, Any] | None:
+    """Card of a user or user id, None if the user does not exist"""
+    user_id = user.pk if isinstance(user, User) else user
+    return get_user_cards([user]).get(user_id)
+
+
+def get_user_cards(users: Iterable[User | int]) -> dict[int, dict[str, Any]]:
+    """
+    user id -> card for users or user ids, in at most one redis round trip and one query.
+    Users passed as instances are rendered from the instance on a miss, so a queryset
+    with select_related(*USER_SERIALIZER_RELATED) costs no query at all.
+    """
+    instances: dict[int, User | None] = {}
+    for user in users:
+        if isinstance(user, User):
+            instances[user.pk] = user
+        else:
+            instances.setdefault(user, None)
+
+    cards: dict[int, dict[str, Any]] = {}
+    missing = []
+    for user_id in instances:
+        card = _get_local(user_id)
+        if card is None:
+            missing.append(user_id)
+        else:
+            cards[user_id] = card
+    if not missing:
+        return cards
+
+    versions, cached = _get_cached(missing)
+    for user_id, card in cached.items():
+        cards[user_id] = card
+        _set_local(user_id, card)
+
+    to_render = [user_id for user_id in missing if user_id not in cached]
+    if to_render:
+        loaded: list[User] = []
+        unloaded: list[int] = []
+        for user_id in to_render:
+            instance = instances[user_id]
+            if instance is None:
+                unloaded.append(user_id)
+            else:
+                loaded.append(instance)
+        rendered = _render(loaded, unloaded)
+        if versions is not None:
+            _set_cached(rendered, versions)
+        for user_id, card in rendered.items():
+            cards[user_id] = card
+            _set_local(user_id, card)
+    return cards
+
+
+class UserCardsListSerializer(serializers.ListSerializer):
+    """
+    List serializer that fetches the cards of every user on the page with one get_user_cards
+    call before rendering the rows, and leaves them in the context for UserCardsMixin.card().
+    """
+
+    def to_representation(self, data: Any) -> list[Any]:
+        rows = list(data.all() if isinstance(data, Manager) else data)
+        child = cast(UserCardsMixin, self.child)
+        cards: dict[int, dict[str, Any]] = self.context.setdefault('user_cards', {})
+        cards.update(get_user_cards(user for row in rows for user in child.card_users(row)))
+        return super().to_representation(rows)
+
+
+class UserCardsMixin(serializers.Serializer):
+    """
+    For serializers that render user cards: card() reads the card preloaded by
+    UserCardsListSerializer (set it as the Meta list_serializer_class) and only falls
+    back to get_user_card for a single instance or a user card_users() did not list.
+    """
+
+    def card_users(self, obj: Any) -> Iterable[User | int]:
+        """Users whose cards the row renders"""
+        return ()
+
+    def card(self, user: User | int) -> dict[str, Any] | None:
+        user_id = user.pk if isinstance(user, User) else user
+        cards: dict[int, dict[str, Any]] = self.context.get('user_cards', {})
+        if user_id in cards:
+            return cards[user_id]
+        return get_user_card(user)
+
+
+def invalidate_user_card(user_id: int) -> None:
+    _local_cache.pop(user_id, None)
+
+    def bump() -> None:
+        # Dropped again after commit, a request may have cached the old row meanwhile
+        _local_cache.pop(user_id, None)
+        try:
+            pipe = get_redis().pipeline()
+            pipe.incr(card_version_key(user_id))
+            pipe.delete(card_cache_key(user_id))
+            pipe.execute()
+        except Exception as e:
+            logger.error(f"Error on invalidate_user_card: {e}")
+    transaction.on_commit(bump)
+
+
+def _render(users: list[User], user_ids: list[int]) -> dict[int, dict[str, Any]]:
+    # Imported here, the serializers module imports this one
+    from .serializers import UserSerializer, USER_SERIALIZER_RELATED
+    if user_ids:
+        users = users + list(User.objects.filter(id__in=user_ids).select_related(*USER_SERIALIZER_RELATED))
+    return {user.pk: UserSerializer(user).data for user in users}
+
+
+def _get_cached(user_ids: list[int]) -> tuple[dict[int, int] | None, dict[int, dict[str, Any]]]:
+    """Current versions of user_ids (None if redis is down), and their cards still at that version"""
+    try:
+        pipe = get_redis().pipeline()
+        pipe.mget([card_version_key(user_id) for user_id in user_ids])
+        pipe.mget([card_cache_key(user_id) for user_id in user_ids])
+        raw_versions, raw_cards = pipe.execute()
+    except Exception as e:
+        logger.error(f"Error on user card lookup: {e}")
+        return None, {}
+
+    versions = {user_id: int(version or 0) for user_id, version in zip(user_ids, raw_versions)}
+    cards = {}
+    for user_id, raw_card in zip(user_ids, raw_cards):
+        if raw_card is None:
+            continue
+        entry = json.loads(raw_card)
+        if entry['version'] == versions[user_id]:
+            cards[user_id] = entry['card']
+    return versions, cards
+
+
+def _set_cached(cards: dict[int, dict[str, Any]], versions: dict[int, int]) -> None:
+    if not cards:
+        return
+    try:
+        pipe = get_redis().pipeline()
+        for user_id, card in cards.items():
+            entry = {'version': versions[user_id], 'card': card}
+            pipe.set(card_cache_key(user_id), json.dumps(entry), ex=settings.USER_CARD_CACHE_TTL)
+        pipe.execute()
+    except Exception as e:
+        logger.error(f"Error on user card store: {e}")
+
+
+def _get_local(user_id: int) -> dict[str, Any] | None:
+    entry = _local_cache.get(user_id)
+    if entry is None:
+        return None
+    expires_at, card = entry
+    if expires_at < time.monotonic():
+        del _local_cache[user_id]
+        return None
+    _local_cache.move_to_end(user_id)
+    return card
+
+
+def _set_local(user_id: int, card: dict[str, Any]) -> None:
+    _local_cache[user_id] = (time.monotonic() + settings.USER_CARD_LOCAL_TTL, card)
+    _local_cache.move_to_end(user_id)
+    while len(_local_cache) > settings.USER_CARD_LOCAL_CACHE_SIZE:
+        _local_cache.popitem(last=False)
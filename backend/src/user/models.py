@@ -43,7 +43,7 @@ class User(AbstractUser):
         related_name='blocked_users_set'
     )
     is_online = models.BooleanField(default=False)
-    last_active = models.DateTimeField(auto_now=True)
+    last_active = models.DateTimeField(default=timezone.now) #Written in bulk by user_activity.activity.flush_activity
     
     USERNAME_FIELD = 'username'
     
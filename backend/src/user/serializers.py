@@ -7,6 +7,7 @@ from django.core.exceptions import ValidationError
 from django.db.models import Q
 from neurocom.settings import MEDIA_ROOT
 from files.serializers import ProfilePictureSerializer
+from .card_cache import UserCardsMixin, UserCardsListSerializer
 from django.contrib.auth import get_user_model
 from typing import TYPE_CHECKING
 from user.models import User
@@ -43,6 +44,15 @@ class RegisterSerializer(serializers.ModelSerializer):
             logger.error(f"Error on RegisterSerializer", str(e), exc_info=True)
 
     
+# Relations UserSerializer reads besides the user row
+USER_SERIALIZER_RELATED = ('settings', 'profile_picture')
+
+
+def user_serializer_related(*user_fields: str) -> list[str]:
+    """select_related paths so serializing the users behind user_fields costs no extra queries"""
+    return [f'{field}__{related}' for field in user_fields for related in USER_SERIALIZER_RELATED]
+
+
 class UserSerializer(serializers.ModelSerializer):
     profile_picture= serializers.SerializerMethodField()
     settings = serializers.SerializerMethodField()
@@ -55,7 +65,8 @@ class UserSerializer(serializers.ModelSerializer):
             return ProfilePictureSerializer(obj.profile_picture).data
         return None
     def get_settings(self,obj):
-        user_settings = UserSettings.objects.get(user=obj)
+        #Reverse one-to-one, reuses select_related('settings') when the queryset has it
+        user_settings = obj.settings
         return UserSettingsSerializer(user_settings).data
 
 class UpdateSerializer(serializers.ModelSerializer):
@@ -105,31 +116,32 @@ class UserSettingsSerializer(serializers.ModelSerializer):
         fields = ['message_notifications', 'request_notifications', 'darkmode']
 
 
-class FriendshipSerializer(serializers.ModelSerializer):
+class FriendshipSerializer(UserCardsMixin, serializers.ModelSerializer):
     initiator = serializers.SerializerMethodField()
     recipient = serializers.SerializerMethodField()
     class Meta:
         model = FriendshipRequest
         fields = '__all__'
+        list_serializer_class = UserCardsListSerializer
+
+    def card_users(self, obj):
+        return [obj.initiator, obj.recipient]
 
     def get_initiator(self, obj):
-        serialized_initiator = UserSerializer(obj.initiator).data
+        serialized_initiator = self.card(obj.initiator)
 
         return serialized_initiator
     
     def get_recipient(self, obj):
-        serialized_recipient = UserSerializer(obj.recipient).data
+        serialized_recipient = self.card(obj.recipient)
 
         return serialized_recipient
 
 class FriendsSerializer(serializers.ModelSerializer):
-    created_at = serializers.SerializerMethodField()
+    """Compact user card of a friend, expects the queryset of GetFriendsView"""
+    profile_picture = ProfilePictureSerializer(read_only=True)
+    #Friendship date, annotated by the view
+    created_at = serializers.DateTimeField(source='friends_since', read_only=True)
     class Meta:
         model = User
-        fields = '__all__'
-    
-    def get_created_at(self,obj):
-       user = self.context['request'].user
-       friendship = Friendship.objects.get(user=user,friend=obj)
-       if friendship:
-            return friendship.created_at
+        fields = ('id', 'username', 'first_name', 'last_name', 'bio', 'profile_picture', 'is_online', 'last_active', 'created_at')
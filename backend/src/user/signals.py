@@ -1,5 +1,5 @@
 from __future__ import annotations
-from django.db.models.signals import post_save,post_delete
+from django.db.models.signals import post_save,post_delete,post_init
 from django.dispatch import receiver
 from django.contrib.contenttypes.models import ContentType
 from .models import UserSettings
@@ -9,6 +9,9 @@ from django.contrib.auth import get_user_model
 from typing import Any, TYPE_CHECKING
 
 from .models import User
+from .token_cache import invalidate_token
+from .card_cache import invalidate_user_card
+from rest_framework.authtoken.models import Token
 
 @receiver(post_save, sender=User)
 def create_user_settings(sender: type[User], instance: User, created: bool, **kwargs: Any) -> None:
@@ -19,4 +22,50 @@ def create_user_settings(sender: type[User], instance: User, created: bool, **kw
 
 
 
-           
\ No newline at end of file
+           
+
+
+#Drop cached websocket auth when a token goes away (LogOut, user deletion) or its user changes
+@receiver(post_delete, sender=Token)
+def invalidate_deleted_token(sender: type[Token], instance: Token, **kwargs: Any) -> None:
+    invalidate_token(instance.key)
+
+#Fields whose change has to reach the websocket handshake right away
+TOKEN_AUTH_FIELDS = ('password', 'is_active', 'is_staff', 'is_superuser')
+
+def token_auth_state(user: User) -> tuple:
+    #Read from __dict__ so deferred fields are not loaded
+    return tuple(user.__dict__.get(name) for name in TOKEN_AUTH_FIELDS)
+
+@receiver(post_init, sender=User)
+def remember_token_auth_state(sender: type[User], instance: User, **kwargs: Any) -> None:
+    setattr(instance, '_token_auth_state', token_auth_state(instance))
+
+@receiver(post_save, sender=User)
+def invalidate_user_tokens(sender: type[User], instance: User, created: bool, **kwargs: Any) -> None:
+    #Profile edits and photo uploads save the user too, those skip the token query
+    state = token_auth_state(instance)
+    changed = state != getattr(instance, '_token_auth_state', None)
+    setattr(instance, '_token_auth_state', state)
+    if created or not changed:
+        return
+    for token_key in Token.objects.filter(user=instance).values_list('key', flat=True):
+        invalidate_token(token_key)
+
+#Fields rendered in the cached user card (UserSerializer)
+USER_CARD_FIELDS = {'username', 'email', 'first_name', 'last_name', 'bio', 'profile_picture'}
+
+@receiver(post_save, sender=User)
+def invalidate_saved_user_card(sender: type[User], instance: User, created: bool, update_fields: Any = None, **kwargs: Any) -> None:
+    #Also on creation, a process may still hold a card cached under a reused id
+    if update_fields is not None and not set(update_fields) & USER_CARD_FIELDS:
+        return
+    invalidate_user_card(instance.pk)
+
+@receiver(post_delete, sender=User)
+def invalidate_deleted_user_card(sender: type[User], instance: User, **kwargs: Any) -> None:
+    invalidate_user_card(instance.pk)
+
+@receiver(post_save, sender=UserSettings)
+def invalidate_settings_user_card(sender: type[UserSettings], instance: UserSettings, **kwargs: Any) -> None:
+    invalidate_user_card(instance.user_id)
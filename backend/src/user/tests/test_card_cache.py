@@ -0,0 +1,126 @@
+import json
+from django.test import TestCase
+from django.contrib.auth import get_user_model
+from user import card_cache
+from user.models import UserSettings
+from user.serializers import FriendshipSerializer
+from notifications.models import FriendshipRequest
+from unittest.mock import patch
+
+user_model = get_user_model()
+
+
+@patch('user.card_cache.get_redis')
+class TestUserCardCache(TestCase):
+
+    def setUp(self):
+        card_cache._local_cache.clear()
+        self.user = user_model.objects.create_user(username='user1', email='user1@test.com', password='testpass123')
+        card_cache._local_cache.clear()
+
+    def mock_redis(self, mock_redis, versions, cards):
+        pipe = mock_redis.return_value.pipeline.return_value
+        pipe.execute.return_value = [versions, cards]
+        return pipe
+
+    def cached_entry(self, version, **card):
+        return json.dumps({'version': version, 'card': card}).encode()
+
+    def test_card_is_cached(self, mock_redis):
+        pipe = self.mock_redis(mock_redis, [b'2'], [None])
+
+        with self.assertNumQueries(1):
+            card = card_cache.get_user_card(self.user.id)
+        with self.assertNumQueries(0):
+            self.assertEqual(card_cache.get_user_card(self.user.id), card)
+
+        self.assertEqual((card['id'], card['username']), (self.user.id, 'user1'))
+        self.assertEqual(card['settings']['darkmode'], UserSettings.objects.get(user=self.user).darkmode)
+        key, value = pipe.set.call_args.args
+        self.assertEqual(key, card_cache.card_cache_key(self.user.id))
+        self.assertEqual(json.loads(value)['version'], 2)
+
+    def test_redis_hit_at_current_version_skips_database(self, mock_redis):
+        self.mock_redis(mock_redis, [b'2'], [self.cached_entry(2, id=self.user.id, username='cached')])
+
+        with self.assertNumQueries(0):
+            card = card_cache.get_user_card(self.user.id)
+        self.assertEqual(card['username'], 'cached')
+
+    def test_entry_from_older_version_is_ignored(self, mock_redis):
+        self.mock_redis(mock_redis, [b'3'], [self.cached_entry(2, id=self.user.id, username='stale')])
+
+        card = card_cache.get_user_card(self.user.id)
+        self.assertEqual(card['username'], 'user1')
+
+    def test_many_cards_take_one_query(self, mock_redis):
+        users = [self.user] + [
+            user_model.objects.create_user(username=f'user{i}', email=f'user{i}@test.com', password='testpass123')
+            for i in range(2, 5)
+        ]
+        card_cache._local_cache.clear()
+        self.mock_redis(mock_redis, [None] * len(users), [None] * len(users))
+
+        with self.assertNumQueries(1):
+            cards = card_cache.get_user_cards([user.id for user in users])
+        self.assertEqual({user_id: card['username'] for user_id, card in cards.items()}, {user.id: user.username for user in users})
+
+    def test_missing_user_has_no_card(self, mock_redis):
+        self.mock_redis(mock_redis, [None], [None])
+
+        self.assertIsNone(card_cache.get_user_card(self.user.id + 100))
+
+    def test_redis_down_falls_back_to_database(self, mock_redis):
+        mock_redis.return_value.pipeline.return_value.execute.side_effect = ConnectionError('down')
+
+        with self.assertLogs('user.card_cache', 'ERROR'):
+            card = card_cache.get_user_card(self.user.id)
+        self.assertEqual(card['username'], 'user1')
+
+    def test_profile_update_bumps_version(self, mock_redis):
+        pipe = self.mock_redis(mock_redis, [None], [None])
+        card_cache.get_user_card(self.user.id)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.first_name = 'Renamed'
+            self.user.save()
+
+        pipe.incr.assert_called_with(card_cache.card_version_key(self.user.id))
+        self.assertEqual(card_cache.get_user_card(self.user.id)['first_name'], 'Renamed')
+
+    def test_settings_update_bumps_version(self, mock_redis):
+        pipe = self.mock_redis(mock_redis, [None], [None])
+        card_cache.get_user_card(self.user.id)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            user_settings = UserSettings.objects.get(user=self.user)
+            user_settings.darkmode = not user_settings.darkmode
+            user_settings.save()
+
+        pipe.incr.assert_called_with(card_cache.card_version_key(self.user.id))
+        self.assertEqual(card_cache.get_user_card(self.user.id)['settings']['darkmode'], user_settings.darkmode)
+
+    def test_login_does_not_bump_version(self, mock_redis):
+        pipe = self.mock_redis(mock_redis, [None], [None])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.save(update_fields=['last_login'])
+
+        pipe.incr.assert_not_called()
+
+    def test_list_serializer_loads_the_page_cards_at_once(self, mock_redis):
+        others = [
+            user_model.objects.create_user(username=f'user{i}', email=f'user{i}@test.com', password='testpass123')
+            for i in range(2, 5)
+        ]
+        FriendshipRequest.objects.bulk_create(FriendshipRequest(initiator=self.user, recipient=other) for other in others)
+        card_cache._local_cache.clear()
+        self.mock_redis(mock_redis, [None] * 4, [None] * 4)
+        requests = FriendshipRequest.objects.select_related('initiator', 'recipient').order_by('id')
+
+        with patch.object(card_cache, 'get_user_cards', wraps=card_cache.get_user_cards) as get_user_cards:
+            data = FriendshipSerializer(requests, many=True).data
+
+        get_user_cards.assert_called_once()
+        self.assertEqual([row['recipient']['username'] for row in data], ['user2', 'user3', 'user4'])
+        self.assertEqual({row['initiator']['username'] for row in data}, {'user1'})
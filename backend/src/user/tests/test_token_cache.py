@@ -0,0 +1,74 @@
+from django.test import TestCase
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from asgiref.sync import async_to_sync
+from rest_framework.authtoken.models import Token
+from user import token_cache
+from unittest.mock import patch, AsyncMock
+
+user_model = get_user_model()
+get_user_for_token = async_to_sync(token_cache.get_user_for_token)
+
+
+@patch('user.token_cache.get_redis')
+@patch('user.token_cache.get_async_redis')
+class TestTokenCache(TestCase):
+
+    def setUp(self):
+        token_cache._local_cache.clear()
+        self.user = user_model.objects.create_user(username='user1', email='user1@test.com', password='testpass123')
+        self.token = Token.objects.create(user=self.user)
+
+    def mock_redis(self, mock_async_redis, cached=None):
+        mock_async_redis.return_value.get = AsyncMock(return_value=cached)
+        mock_async_redis.return_value.set = AsyncMock()
+
+    def test_handshake_is_cached(self, mock_async_redis, mock_redis):
+        self.mock_redis(mock_async_redis)
+
+        with self.assertNumQueries(1):
+            user = get_user_for_token(self.token.key)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_user_for_token(self.token.key), user)
+
+        self.assertEqual((user.id, user.username), (self.user.id, 'user1'))
+        mock_async_redis.return_value.set.assert_called_once()
+
+    def test_redis_hit_skips_database(self, mock_async_redis, mock_redis):
+        self.mock_redis(mock_async_redis, b'{"id": %d, "username": "user1", "is_active": true, "is_staff": false, "is_superuser": false}' % self.user.id)
+
+        with self.assertNumQueries(0):
+            user = get_user_for_token(self.token.key)
+        self.assertEqual(user.pk, self.user.pk)
+        # Fields left out of the cache are loaded on access
+        self.assertEqual(user.email, 'user1@test.com')
+
+    def test_logout_invalidates_token(self, mock_async_redis, mock_redis):
+        self.mock_redis(mock_async_redis)
+        token_key = self.token.key
+        get_user_for_token(token_key)
+
+        self.token.delete()
+
+        mock_redis.return_value.delete.assert_called_with(token_cache.token_cache_key(token_key))
+        self.assertIsInstance(get_user_for_token(token_key), AnonymousUser)
+
+    def test_inactive_user_is_anonymous(self, mock_async_redis, mock_redis):
+        self.mock_redis(mock_async_redis)
+        self.user.is_active = False
+        self.user.save()
+
+        self.assertIsInstance(get_user_for_token(self.token.key), AnonymousUser)
+
+    def test_profile_save_keeps_tokens_cached(self, mock_async_redis, mock_redis):
+        self.user.bio = 'new bio'
+        # Only the UPDATE, no token lookup
+        with self.assertNumQueries(1):
+            self.user.save()
+        mock_redis.return_value.delete.assert_not_called()
+
+    def test_password_change_invalidates_token(self, mock_async_redis, mock_redis):
+        self.user.set_password('newpass123')
+        self.user.save()
+
+        mock_redis.return_value.delete.assert_called_with(token_cache.token_cache_key(self.token.key))
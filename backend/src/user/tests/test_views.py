@@ -5,6 +5,9 @@ from django.contrib.auth import get_user_model
 from rest_framework.test import APITestCase
 from rest_framework.authtoken.models import Token
 from rest_framework import status
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from unittest.mock import patch
 
 
 user_model = get_user_model()
@@ -129,3 +132,43 @@ class TestviewUrls(APITestCase):
         response = self.client.post(url)
 
         self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+
+@patch('user_activity.audience.get_redis')
+class GetFriendsViewTest(APITestCase):
+
+    def setUp(self):
+        self.user = user_model.objects.create_user(email='user1@test.com', username='user1', password='password123')
+        self.token, _ = Token.objects.get_or_create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def add_friends(self, count):
+        for _ in range(count):
+            i = user_model.objects.count() + 1
+            self.user.add_friend(user_model.objects.create_user(email=f'user{i}@test.com', username=f'user{i}', password='password123'))
+
+    def get_friends(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('get_friends'), {'page_size': 50})
+        return response.data['data']['friends'], len(queries)
+
+    def test_query_count_does_not_grow_with_page_size(self, mock_redis):
+        self.add_friends(2)
+        friends, few_friends_queries = self.get_friends()
+        self.assertEqual(len(friends), 2)
+
+        self.add_friends(10)
+        friends, many_friends_queries = self.get_friends()
+        self.assertEqual(len(friends), 12)
+        self.assertEqual(many_friends_queries, few_friends_queries)
+
+    def test_friend_cards_are_compact(self, mock_redis):
+        self.add_friends(1)
+
+        friend = self.get_friends()[0][0]
+
+        self.assertEqual(friend['username'], 'user2')
+        self.assertIsNotNone(friend['created_at'])
+        self.assertNotIn('password', friend)
+        self.assertNotIn('email', friend)
+        self.assertNotIn('friends', friend)
@@ -0,0 +1,103 @@
+from __future__ import annotations
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import Any
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from channels.db import database_sync_to_async
+from rest_framework.authtoken.models import Token
+from neurocom.redis_client import get_redis, get_async_redis
+from .models import User
+
+logger = logging.getLogger(__name__)
+
+# token -> user fields needed to authorize a websocket handshake, cached in a small
+# per-process LRU in front of redis so the common case costs no database query.
+# Deleting the token (LogOut, user deletion) or changing the user clears the redis
+# entry; the per-process copies expire after WS_AUTH_LOCAL_TTL seconds.
+
+CACHED_USER_FIELDS = ('id', 'username', 'is_active', 'is_staff', 'is_superuser')
+
+_local_cache: OrderedDict[str, tuple[float, dict[str, Any]]] = OrderedDict()
+
+
+def token_cache_key(token_key: str) -> str:
+    return f'ws_auth_token_{token_key}'
+
+
+def user_from_fields(fields: dict[str, Any]) -> User:
+    # Every other field is deferred and only loaded if a consumer reads it
+    field_names = [f.attname for f in User._meta.concrete_fields if f.attname in fields]
+    return User.from_db(None, field_names, [fields[name] for name in field_names])
+
+
+async def get_user_for_token(token_key: str) -> User | AnonymousUser:
+    fields = _get_local(token_key)
+    if fields is None:
+        fields = await _get_cached(token_key)
+        if fields is None:
+            fields = await database_sync_to_async(_load_fields)(token_key)
+            if fields is None:
+                return AnonymousUser()
+            await _set_cached(token_key, fields)
+        _set_local(token_key, fields)
+
+    if not fields['is_active']:
+        return AnonymousUser()
+    return user_from_fields(fields)
+
+
+def invalidate_token(token_key: str) -> None:
+    _local_cache.pop(token_key, None)
+    try:
+        get_redis().delete(token_cache_key(token_key))
+    except Exception as e:
+        logger.error(f"Error on invalidate_token: {e}")
+
+
+def _load_fields(token_key: str) -> dict[str, Any] | None:
+    fields = (
+        Token.objects.filter(key=token_key)
+        .values(*[f'user__{name}' for name in CACHED_USER_FIELDS])
+        .first()
+    )
+    if fields is None:
+        return None
+    return {name: fields[f'user__{name}'] for name in CACHED_USER_FIELDS}
+
+
+def _get_local(token_key: str) -> dict[str, Any] | None:
+    entry = _local_cache.get(token_key)
+    if entry is None:
+        return None
+    expires_at, fields = entry
+    if expires_at < time.monotonic():
+        del _local_cache[token_key]
+        return None
+    _local_cache.move_to_end(token_key)
+    return fields
+
+
+def _set_local(token_key: str, fields: dict[str, Any]) -> None:
+    _local_cache[token_key] = (time.monotonic() + settings.WS_AUTH_LOCAL_TTL, fields)
+    _local_cache.move_to_end(token_key)
+    while len(_local_cache) > settings.WS_AUTH_LOCAL_CACHE_SIZE:
+        _local_cache.popitem(last=False)
+
+
+async def _get_cached(token_key: str) -> dict[str, Any] | None:
+    try:
+        cached = await get_async_redis().get(token_cache_key(token_key))
+    except Exception as e:
+        logger.error(f"Error on token cache lookup: {e}")
+        return None
+    return json.loads(cached) if cached is not None else None
+
+
+async def _set_cached(token_key: str, fields: dict[str, Any]) -> None:
+    try:
+        await get_async_redis().set(token_cache_key(token_key), json.dumps(fields), ex=settings.WS_AUTH_CACHE_TTL)
+    except Exception as e:
+        logger.error(f"Error on token cache store: {e}")
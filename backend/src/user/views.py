@@ -15,13 +15,14 @@ from .serializers import (
     
 )
 from user.models import UserSettings, Friendship, UserBlock
+from .card_cache import get_user_card
 from django.shortcuts import get_object_or_404
 from django.contrib.auth import get_user_model
 from django.http import Http404
 from rest_framework.pagination import PageNumberPagination
 import logging
 from rest_framework.request import Request
-from django.db.models import QuerySet
+from django.db.models import QuerySet, F
 logger = logging.getLogger(__name__)
 from typing import Any, cast, TYPE_CHECKING
 from common.custom_api_classes import AuthenticatedAPIView
@@ -253,8 +254,9 @@ class GetUserProfileView(BaseAPIView, APIView):
 
     def get(self,request: Request,username: str, *args: Any, **kwargs: Any) -> Response:
         try:
-            get_user: User = get_object_or_404(User,username=username)
-            serialized_user: dict[str, Any] = UserSerializer(get_user).data
+            #Only the id is needed, the rest of the profile comes from the card cache
+            get_user: User = get_object_or_404(User.objects.only('id'), username=username)
+            serialized_user: dict[str, Any] | None = get_user_card(get_user.pk)
 
             return self.success_response({"success": True, "user": serialized_user}, "User Retrieved Successfully")
         except User.DoesNotExist:
@@ -282,7 +284,13 @@ class GetFriendsView(BaseAPIView, generics.ListAPIView):
         user = self.get_authenticated_user(self.request)
         if(isinstance(user, Response)):
             raise PermissionError("Unauthenticated")
-        friendships: QuerySet[User] = user.friends.all()
+        # One row per Friendship(user=user, friend=<friend>), its date comes along from the same join
+        friendships: QuerySet[User] = (
+            User.objects.filter(friend__user=user)
+            .annotate(friends_since=F('friend__created_at'))
+            .select_related('profile_picture')
+            .order_by('-friends_since', 'id')
+        )
         return friendships
     
     def get(self, request:Request, *args, **kwargs):
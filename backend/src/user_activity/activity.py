@@ -0,0 +1,92 @@
+from __future__ import annotations
+import logging
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone as dt_timezone
+from django.conf import settings
+from redis.exceptions import ResponseError
+from user.models import User
+from neurocom.redis_client import get_redis, get_async_redis
+from .presence import ONLINE_USERS_KEY
+
+logger = logging.getLogger(__name__)
+
+# Last activity of each user is written to a redis hash (user id -> unix time) on requests
+# and socket events, and flushed to User.last_active / User.is_online in bulk, so the
+# hot path never writes the user row.
+
+LAST_ACTIVE_KEY = 'user_last_active'
+FLUSHING_KEY = 'user_last_active_flushing'
+
+# user id -> monotonic time of the last write from this process, least recently recorded first
+_recorded_at: OrderedDict[int, float] = OrderedDict()
+
+
+def _should_record(user_id: int) -> bool:
+    # One write per user per ACTIVITY_RECORD_INTERVAL per process is precise enough for last seen
+    now = time.monotonic()
+    if now - _recorded_at.get(user_id, float('-inf')) < settings.ACTIVITY_RECORD_INTERVAL:
+        return False
+    _recorded_at[user_id] = now
+    _recorded_at.move_to_end(user_id)
+    # An evicted user only costs one extra write
+    while len(_recorded_at) > settings.ACTIVITY_RECORD_CACHE_SIZE:
+        _recorded_at.popitem(last=False)
+    return True
+
+
+def record_activity(user_id: int) -> None:
+    if not _should_record(user_id):
+        return
+    try:
+        get_redis().hset(LAST_ACTIVE_KEY, str(user_id), time.time())
+    except Exception as e:
+        logger.error(f"Error on record_activity: {e}")
+
+
+async def record_activity_async(user_id: int) -> None:
+    if not _should_record(user_id):
+        return
+    try:
+        await get_async_redis().hset(LAST_ACTIVE_KEY, str(user_id), time.time())
+    except Exception as e:
+        logger.error(f"Error on record_activity: {e}")
+
+
+def flush_activity() -> int:
+    """Write the buffered activity to the user table, returns the number of users updated."""
+    redis_client = get_redis()
+    # Move the hash aside so activity recorded during the flush goes to a fresh one.
+    # A leftover from an interrupted flush is written first.
+    if not redis_client.exists(FLUSHING_KEY):
+        try:
+            redis_client.rename(LAST_ACTIVE_KEY, FLUSHING_KEY)
+        except ResponseError:
+            # Nothing was recorded since the last flush
+            return _flush_offline_users()
+
+    last_active = {int(user_id): float(timestamp) for user_id, timestamp in redis_client.hgetall(FLUSHING_KEY).items()}
+    user_ids = list(last_active)
+    is_online = redis_client.smismember(ONLINE_USERS_KEY, user_ids) if user_ids else []
+
+    users = [
+        User(
+            id=user_id,
+            last_active=datetime.fromtimestamp(last_active[user_id], tz=dt_timezone.utc),
+            is_online=bool(online),
+        )
+        for user_id, online in zip(user_ids, is_online)
+    ]
+    User.objects.bulk_update(users, ['last_active', 'is_online'], batch_size=500)
+    redis_client.delete(FLUSHING_KEY)
+    return len(users) + _flush_offline_users()
+
+
+def _flush_offline_users() -> int:
+    # Users still flagged online in the database who have no live connection anymore
+    online_ids = list(User.objects.filter(is_online=True).values_list('id', flat=True))
+    if not online_ids:
+        return 0
+    still_online = get_redis().smismember(ONLINE_USERS_KEY, online_ids)
+    offline_ids = [user_id for user_id, online in zip(online_ids, still_online) if not online]
+    return User.objects.filter(id__in=offline_ids).update(is_online=False)
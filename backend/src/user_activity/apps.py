@@ -4,3 +4,5 @@ from django.apps import AppConfig
 class UserActivityConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'user_activity'
+    def ready(self):
+        import user_activity.signals #Import the signals
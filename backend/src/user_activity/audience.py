@@ -0,0 +1,65 @@
+from __future__ import annotations
+import logging
+from django.conf import settings
+from django.db.models import Q
+from channels.db import database_sync_to_async
+from chat.models import DirectMessage
+from user.models import Friendship
+from neurocom.redis_client import get_redis, get_async_redis
+
+logger = logging.getLogger(__name__)
+
+# A user's presence is only sent to their audience: their friends and the users they
+# have a direct message with. The audience is cached as a redis set per user and
+# dropped whenever a friendship or a direct message is created or removed.
+
+EMPTY_AUDIENCE = 0  # Placeholder member so an empty audience is still cached
+
+
+def audience_key(user_id: int) -> str:
+    return f'presence_audience_{user_id}'
+
+
+def presence_group_name(user_id: int) -> str:
+    # Every socket of a user joins its own group, the presence of others is sent there
+    return f'presence_{user_id}'
+
+
+async def get_audience(user_id: int) -> set[int]:
+    try:
+        cached = await get_async_redis().smembers(audience_key(user_id))
+        if cached:
+            return {int(member) for member in cached} - {EMPTY_AUDIENCE}
+    except Exception as e:
+        logger.error(f"Error on get_audience: {e}")
+    audience: set[int] = await database_sync_to_async(rebuild_audience)(user_id)
+    return audience
+
+
+def load_audience(user_id: int) -> set[int]:
+    audience = set(Friendship.objects.filter(user_id=user_id).values_list('friend_id', flat=True))
+    audience.update(Friendship.objects.filter(friend_id=user_id).values_list('user_id', flat=True))
+    for user1_id, user2_id in DirectMessage.objects.filter(Q(user1_id=user_id) | Q(user2_id=user_id)).values_list('user1_id', 'user2_id'):
+        audience.update((user1_id, user2_id))
+    audience.discard(user_id)
+    return audience
+
+
+def rebuild_audience(user_id: int) -> set[int]:
+    audience = load_audience(user_id)
+    try:
+        pipe = get_redis().pipeline()
+        pipe.delete(audience_key(user_id))
+        pipe.sadd(audience_key(user_id), *(audience or {EMPTY_AUDIENCE}))
+        pipe.expire(audience_key(user_id), settings.PRESENCE_AUDIENCE_CACHE_TTL)
+        pipe.execute()
+    except Exception as e:
+        logger.error(f"Error on rebuild_audience: {e}")
+    return audience
+
+
+def invalidate_audience(*user_ids: int) -> None:
+    try:
+        get_redis().delete(*[audience_key(user_id) for user_id in user_ids])
+    except Exception as e:
+        logger.error(f"Error on invalidate_audience: {e}")
@@ -1,17 +1,21 @@
-from channels.generic.websocket import AsyncWebsocketConsumer
-import redis
+from common.websocket import FrameProtocolConsumer
+from neurocom.redis_client import get_async_redis
+from .audience import get_audience, presence_group_name
+from .presence import ONLINE_USERS_KEY, touch_connection, remove_connection, publish_presence, maybe_sweep
+from .activity import record_activity_async, flush_activity
 from django.conf import settings
-import redis.client
-from asgiref.sync import sync_to_async
-import json
+import asyncio
 from channels.db import database_sync_to_async
-from channels.layers import get_channel_layer
 from chat.models import DirectMessage
-from typing import cast, Any
-redis_client = redis.StrictRedis(host=settings.REDIS_HOST, port=settings.REDIS_PORT, db=0)
+import logging
 
+logger = logging.getLogger(__name__)
 
-class UserActivityConsumer(AsyncWebsocketConsumer):
+
+class UserActivityConsumer(FrameProtocolConsumer):
+    #Presence is delta based and friend scoped: a new socket gets a snapshot of its online
+    #audience, after that it only gets user_joined / user_left events of that audience
+    #through its own presence group
 
 
     async def connect(self):
@@ -22,10 +26,15 @@ class UserActivityConsumer(AsyncWebsocketConsumer):
         else:
             
             await self.accept()
-            await self.channel_layer.group_add('user_status', self.channel_name)
-            await sync_to_async(redis_client.sadd)('online_users', self.user.id)
-            await sync_to_async(redis_client.sadd)("online_channels",self.channel_name)
-            await self.send_to_all()
+            #Join the group before reading the snapshot so no delta falls in between
+            await self.channel_layer.group_add(presence_group_name(self.user.id), self.channel_name)
+            await record_activity_async(self.user.id)
+            is_new = await touch_connection(self.user.id, self.channel_name)
+            self.audience = await get_audience(self.user.id)
+            await self.send_snapshot()
+            if is_new:
+                await publish_presence(self.user.id, 'user_joined')
+            self.heartbeat_task = asyncio.get_running_loop().create_task(self.heartbeat())
             
 
 
@@ -55,52 +64,53 @@ class UserActivityConsumer(AsyncWebsocketConsumer):
             return None
     
     async def disconnect(self,close_code):
-        user_id = self.scope['user'].id
-        await sync_to_async(redis_client.srem)("online_users", user_id)
-
-        await sync_to_async(redis_client.srem)("online_channels", self.channel_name)
-        await self.send_to_all()
-
-
-    async def receive(self, text_data=None):
+        if self.user.is_anonymous:
+            return
+        heartbeat_task = getattr(self, 'heartbeat_task', None)
+        if heartbeat_task is not None:
+            heartbeat_task.cancel()
+        await self.channel_layer.group_discard(presence_group_name(self.user.id), self.channel_name)
+        #Other tabs or devices of the user may still be connected
+        if await remove_connection(self.user.id, self.channel_name):
+            await publish_presence(self.user.id, 'user_left')
+
+
+    #Keeps this connection alive in the presence set, a connection that stops heartbeating
+    #(crashed worker) is swept after PRESENCE_CONNECTION_TTL seconds
+    async def heartbeat(self):
+        while True:
+            await asyncio.sleep(settings.PRESENCE_HEARTBEAT_INTERVAL)
+            try:
+                await record_activity_async(self.user.id)
+                if await touch_connection(self.user.id, self.channel_name):
+                    #The connection had been swept, the user is back online
+                    await publish_presence(self.user.id, 'user_joined')
+            except Exception as e:
+                logger.error(f"Error on heartbeat: {e}")
+            if await maybe_sweep():
+                try:
+                    await database_sync_to_async(flush_activity)()
+                except Exception as e:
+                    logger.error(f"Error on flush_activity: {e}")
+
+
+    async def receive(self, text_data=None, bytes_data=None):
         pass
         
 
 
-    async def send_to_all(self):
+    async def send_snapshot(self):
         try:
-            
-            online_users: Any = await sync_to_async(redis_client.smembers)("online_users")
-            online_users = [int(user_id) for user_id in online_users], online_users
-
-
-            online_channels: Any = await sync_to_async(redis_client.smembers)("online_channels")
-
-
+            audience = list(self.audience)
+            online_users = []
+            if audience:
+                is_online = await get_async_redis().smismember(ONLINE_USERS_KEY, audience)
+                online_users = [user_id for user_id, online in zip(audience, is_online) if online]
 
-            for channel_name in online_channels:
-
-                channel_name = channel_name.decode()
-                await self.channel_layer.send(channel_name, {
-                    "type": "send_online_users",
-                    "online_users": online_users
-                })
-            
-
-        except Exception as e:
-            print(e)
-
-
-    async def send_online_users(self, event):
-        try:
- 
-            online_users = event.get('online_users', [])
-   
-            
-            await self.send(text_data=json.dumps({
+            await self.send_payload({
                 "type": "online_users",
                 "online_users": online_users
-            }))
+            })
 
         except Exception as e:
-            print(f"Error in send_message: {e}") 
\ No newline at end of file
+            logger.error(f"Error on send_snapshot: {e}")
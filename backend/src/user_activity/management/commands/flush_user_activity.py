@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+from user_activity.activity import flush_activity
+
+
+class Command(BaseCommand):
+    help = "Write the last activity buffered in redis to the user table"
+
+    def handle(self, *args, **options):
+        # The presence sweeper flushes while sockets are open, this covers HTTP-only traffic
+        updated = flush_activity()
+        self.stdout.write(f"{updated} users updated")
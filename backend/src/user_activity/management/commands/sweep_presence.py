@@ -0,0 +1,12 @@
+from asgiref.sync import async_to_sync
+from django.core.management.base import BaseCommand
+from user_activity.presence import sweep_expired_connections
+
+
+class Command(BaseCommand):
+    help = "Expire presence connections that stopped heartbeating and announce the users that went offline"
+
+    def handle(self, *args, **options):
+        # Sockets sweep on their own while any are open, this covers the case where none are
+        offline_users = async_to_sync(sweep_expired_connections)()
+        self.stdout.write(f"{len(offline_users)} users went offline")
@@ -0,0 +1,120 @@
+from __future__ import annotations
+import logging
+import time
+from django.conf import settings
+from channels.layers import get_channel_layer
+from common.websocket import frame_event
+from neurocom.redis_client import get_async_redis
+from .audience import get_audience, presence_group_name
+
+logger = logging.getLogger(__name__)
+
+# Presence is kept per connection: CONNECTIONS_KEY is a sorted set of "<user id>:<channel>"
+# scored by the last heartbeat, REFCOUNT_KEY counts the live connections of each user and
+# ONLINE_USERS_KEY holds the users with at least one. A user only goes offline when their
+# last connection closes, or stops heartbeating (crashed worker) and gets swept.
+
+CONNECTIONS_KEY = 'presence_connections'
+REFCOUNT_KEY = 'presence_refcount'
+ONLINE_USERS_KEY = 'online_users'
+SWEEP_LOCK_KEY = 'presence_sweep_lock'
+
+# Adds or refreshes a connection, returns 1 when it made the user come online
+TOUCH_SCRIPT = """
+if redis.call('ZADD', KEYS[1], ARGV[1], ARGV[2]) == 0 then
+    return 0
+end
+if redis.call('HINCRBY', KEYS[2], ARGV[3], 1) == 1 then
+    redis.call('SADD', KEYS[3], ARGV[3])
+    return 1
+end
+return 0
+"""
+
+# Removes a connection, returns 1 when it was the last one of the user
+REMOVE_SCRIPT = """
+if redis.call('ZREM', KEYS[1], ARGV[1]) == 0 then
+    return 0
+end
+if redis.call('HINCRBY', KEYS[2], ARGV[2], -1) <= 0 then
+    redis.call('HDEL', KEYS[2], ARGV[2])
+    redis.call('SREM', KEYS[3], ARGV[2])
+    return 1
+end
+return 0
+"""
+
+# Removes up to ARGV[2] connections last seen before ARGV[1], returns the users that went offline
+SWEEP_SCRIPT = """
+local expired = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, ARGV[2])
+local offline = {}
+for _, member in ipairs(expired) do
+    redis.call('ZREM', KEYS[1], member)
+    local user_id = string.match(member, '^(%d+):')
+    if redis.call('HINCRBY', KEYS[2], user_id, -1) <= 0 then
+        redis.call('HDEL', KEYS[2], user_id)
+        redis.call('SREM', KEYS[3], user_id)
+        table.insert(offline, user_id)
+    end
+end
+return offline
+"""
+
+PRESENCE_KEYS = [CONNECTIONS_KEY, REFCOUNT_KEY, ONLINE_USERS_KEY]
+
+
+def connection_member(user_id: int, channel_name: str) -> str:
+    return f'{user_id}:{channel_name}'
+
+
+async def touch_connection(user_id: int, channel_name: str) -> bool:
+    """Register or heartbeat a connection. True if the user just came online."""
+    script = get_async_redis().register_script(TOUCH_SCRIPT)
+    return bool(await script(keys=PRESENCE_KEYS, args=[time.time(), connection_member(user_id, channel_name), user_id]))
+
+
+async def remove_connection(user_id: int, channel_name: str) -> bool:
+    """Drop a connection. True if it was the user's last one."""
+    script = get_async_redis().register_script(REMOVE_SCRIPT)
+    return bool(await script(keys=PRESENCE_KEYS, args=[connection_member(user_id, channel_name), user_id]))
+
+
+async def sweep_expired_connections(batch_size: int = 1000) -> list[int]:
+    """Expire connections that missed their heartbeats and announce the users that went offline."""
+    script = get_async_redis().register_script(SWEEP_SCRIPT)
+    deadline = time.time() - settings.PRESENCE_CONNECTION_TTL
+    offline_users: list[int] = []
+    while True:
+        offline = await script(keys=PRESENCE_KEYS, args=[deadline, batch_size])
+        offline_users.extend(int(user_id) for user_id in offline)
+        if await get_async_redis().zcount(CONNECTIONS_KEY, '-inf', deadline) == 0:
+            break
+
+    for user_id in offline_users:
+        await publish_presence(user_id, 'user_left')
+    return offline_users
+
+
+async def maybe_sweep() -> bool:
+    # Every connection heartbeats, but only one of them per interval does the sweep.
+    # Returns True for that one, so it can run the other periodic jobs as well
+    try:
+        if await get_async_redis().set(SWEEP_LOCK_KEY, 1, nx=True, ex=settings.PRESENCE_HEARTBEAT_INTERVAL):
+            await sweep_expired_connections()
+            return True
+    except Exception as e:
+        logger.error(f"Error on maybe_sweep: {e}")
+    return False
+
+
+async def publish_presence(user_id: int, event_type: str) -> None:
+    try:
+        event = frame_event({
+            "type": event_type,
+            "user_id": user_id
+        })
+        channel_layer = get_channel_layer()
+        for audience_user_id in await get_audience(user_id):
+            await channel_layer.group_send(presence_group_name(audience_user_id), event)
+    except Exception as e:
+        logger.error(f"Error on publish_presence: {e}")
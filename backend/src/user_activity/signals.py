@@ -0,0 +1,30 @@
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+from chat.models import DirectMessage
+from user.models import User, Friendship
+from user_activity.audience import invalidate_audience
+from typing import Any
+
+#Presence audiences change with friendships and direct messages
+
+
+@receiver(m2m_changed, sender=User.friends.through)
+def friends_changed(sender: type[Friendship], instance: User, action: str, pk_set: set[int] | None, **kwargs: Any) -> None:
+    if action in ('post_add', 'post_remove'):
+        invalidate_audience(instance.pk, *(pk_set or ()))
+    elif action == 'pre_clear':
+        #pk_set is not given on clear, so collect the friends before they are gone
+        invalidate_audience(instance.pk, *instance.friends.values_list('id', flat=True))
+
+@receiver(post_delete, sender=Friendship)
+def friendship_deleted(sender: type[Friendship], instance: Friendship, **kwargs: Any) -> None:
+    invalidate_audience(instance.user_id, instance.friend_id)
+
+@receiver(post_save, sender=DirectMessage)
+def direct_message_created(sender: type[DirectMessage], instance: DirectMessage, created: bool, **kwargs: Any) -> None:
+    if created:
+        invalidate_audience(instance.user1_id, instance.user2_id)
+
+@receiver(post_delete, sender=DirectMessage)
+def direct_message_deleted(sender: type[DirectMessage], instance: DirectMessage, **kwargs: Any) -> None:
+    invalidate_audience(instance.user1_id, instance.user2_id)
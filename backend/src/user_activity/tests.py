@@ -1,3 +1,87 @@
-from django.test import TestCase
-
-# Create your tests here.
+from django.test import TestCase, SimpleTestCase, override_settings
+from django.contrib.auth import get_user_model
+from chat.models import DirectMessage
+from user_activity.audience import load_audience, audience_key
+from user_activity import activity
+from user_activity.activity import flush_activity, record_activity
+from unittest.mock import patch
+
+User = get_user_model()
+
+
+@patch('user_activity.audience.get_redis')
+class PresenceAudienceTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='user1', email='user1@test.com', password='testpass123')
+        self.friend = User.objects.create_user(username='user2', email='user2@test.com', password='testpass123')
+        self.dm_partner = User.objects.create_user(username='user3', email='user3@test.com', password='testpass123')
+        self.stranger = User.objects.create_user(username='user4', email='user4@test.com', password='testpass123')
+
+    def test_audience_is_friends_and_dm_partners(self, mock_redis):
+        self.user.add_friend(self.friend)
+        DirectMessage.objects.create(user1=self.dm_partner, user2=self.user)
+
+        self.assertEqual(load_audience(self.user.id), {self.friend.id, self.dm_partner.id})
+        self.assertEqual(load_audience(self.friend.id), {self.user.id})
+        self.assertEqual(load_audience(self.stranger.id), set())
+
+    def test_relationship_changes_drop_cached_audiences(self, mock_redis):
+        delete = mock_redis.return_value.delete
+
+        self.user.add_friend(self.friend)
+        delete.assert_called_with(audience_key(self.user.id), audience_key(self.friend.id))
+
+        DirectMessage.objects.create(user1=self.dm_partner, user2=self.stranger)
+        delete.assert_called_with(audience_key(self.dm_partner.id), audience_key(self.stranger.id))
+
+
+@patch('user_activity.activity.get_redis')
+class FlushActivityTest(TestCase):
+    def setUp(self):
+        self.online = User.objects.create_user(username='user1', email='user1@test.com', password='testpass123')
+        self.closed_tab = User.objects.create_user(username='user2', email='user2@test.com', password='testpass123')
+        self.stale = User.objects.create_user(username='user3', email='user3@test.com', password='testpass123', is_online=True)
+
+    def test_buffered_activity_is_written_in_bulk(self, mock_redis):
+        redis_client = mock_redis.return_value
+        redis_client.exists.return_value = False
+        redis_client.hgetall.return_value = {
+            str(self.online.id).encode(): b'1700000000.0',
+            str(self.closed_tab.id).encode(): b'1700000100.0',
+        }
+        # online_users: first the flushed users, then the ones still flagged online in the database
+        redis_client.smismember.side_effect = [[1, 0], [1, 0]]
+
+        with self.assertNumQueries(3):
+            flush_activity()
+
+        redis_client.rename.assert_called_once()
+        redis_client.delete.assert_called_once()
+        self.online.refresh_from_db()
+        self.closed_tab.refresh_from_db()
+        self.stale.refresh_from_db()
+        self.assertEqual(self.online.last_active.timestamp(), 1700000000.0)
+        self.assertTrue(self.online.is_online)
+        self.assertEqual(self.closed_tab.last_active.timestamp(), 1700000100.0)
+        self.assertFalse(self.closed_tab.is_online)
+        self.assertFalse(self.stale.is_online)
+
+
+@patch('user_activity.activity.get_redis')
+class RecordActivityTest(SimpleTestCase):
+    def setUp(self):
+        activity._recorded_at.clear()
+
+    def test_writes_are_throttled_per_user(self, mock_redis):
+        record_activity(1)
+        record_activity(1)
+
+        mock_redis.return_value.hset.assert_called_once()
+        self.assertEqual(mock_redis.return_value.hset.call_args.args[:2], (activity.LAST_ACTIVE_KEY, '1'))
+
+    @override_settings(ACTIVITY_RECORD_CACHE_SIZE=2)
+    def test_throttle_state_is_bounded(self, mock_redis):
+        for user_id in range(5):
+            record_activity(user_id)
+
+        self.assertEqual(list(activity._recorded_at), [3, 4])
@@ -21,7 +21,7 @@ export function AuthProvider ({children} : AuthProviderProps) {
     const [userSettings,setUserSettings] = useState<UserSettings | null>(null)
     const [chatrooms,setChatrooms] = useState<Chatroom[] | null>(null)
     const [myChatrooms,setMyChatrooms] = useState(null)
-    const [onlineUsers, setOnlineUsers] = useState([])
+    const [onlineUsers, setOnlineUsers] = useState<number[]>([])
     const socketRef = useRef<WebSocket | null>(null)
     const [socket,setSocket] = useState<WebSocket | null>(null)
     const [userStatus, setUserStatus] = useState([])
@@ -115,6 +115,13 @@ export function AuthProvider ({children} : AuthProviderProps) {
                             setOnlineUsers(data.online_users);
                             
                         }
+                        //After the first snapshot presence only comes as deltas
+                        else if (data.type === "user_joined") {
+                            setOnlineUsers(prev => prev.includes(data.user_id) ? prev : [...prev, data.user_id]);
+                        }
+                        else if (data.type === "user_left") {
+                            setOnlineUsers(prev => prev.filter(user_id => user_id !== data.user_id));
+                        }
                     };
                 } catch (error) {
                     console.log(error);
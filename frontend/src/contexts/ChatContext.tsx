@@ -240,6 +240,12 @@ export const ChatProvider: React.FC<ChatProviderProps> = ({ mode, children }) =>
                 setUserStatus(user_status);
                 console.log('USER STATUS', userStatus);
               }
+            } else if (data.action_type === 'typing') {
+              // Typing changes only carry the one user, the rest of the status stays as it is
+              const typing = data.is_typing ? "True" : "False";
+              setUserStatus(prev => prev.map(status =>
+                String(status.user_id) === String(data.user_id) ? { ...status, typing } : status
+              ));
             }
           };
 
@@ -292,26 +298,19 @@ export const ChatProvider: React.FC<ChatProviderProps> = ({ mode, children }) =>
   };
 
   useEffect(() => {
+    // Sent on every keystroke, the server turns it into one start and one stop event
     if (message && message.trim() !== '') {
       if (socketRef.current) {
         socketRef.current.send(JSON.stringify({
-          "action_type": "user_status",
-          "user_status": {
-            "user_id": String(user?.id),
-            "in_the_chat_status": "True",
-            "typing": "True"
-          }
+          "action_type": "typing",
+          "is_typing": true
         }));
       }
     } else {
       if (socketRef.current) {
         socketRef.current.send(JSON.stringify({
-          "action_type": "user_status",
-          "user_status": {
-            "user_id": String(user?.id),
-            "in_the_chat_status": "True",
-            "typing": "False"
-          }
+          "action_type": "typing",
+          "is_typing": false
         }));
       }
       console.log('WORKED');
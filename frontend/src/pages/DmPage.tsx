@@ -108,7 +108,7 @@ const DmPage = () => {
                                     <img className='profile-image' src={profilePhoto} alt="" width={40} height={40} />
                                 )}
                                 <div className='dm-user-div'>{dm.other_user.username}</div>
-                                {(onlineUsers.some(user => user.id === dm.other_user.id)) ? (
+                                {(onlineUsers.includes(dm.other_user.id)) ? (
                                     
                                     <div className='online-div'>
                                     <FontAwesomeIcon icon={faCircle} style={{color:"green",marginTop:'8px'}}></FontAwesomeIcon>
@@ -7,7 +7,7 @@ user: User | null;
 isLoggedIn: boolean;
 userSettings: UserSettings | null;
 error: any;
-onlineUsers: User[];
+onlineUsers: number[];
 loadingAuth: boolean;
 handleLogin: (loginData: LoginCredentials) => Promise<LoginResponse | null>;
 logout: () => Promise<LogoutResponse | null>;
@@ -6,4 +6,6 @@ export interface WebSocketMessage {
     message_id: number;
     new_content: string;
     user_status: UserStatus[];
+    user_id: number;
+    is_typing: boolean;
 }
\ No newline at end of file